@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _sub in ('common', 'loop_analysis', 'lv_analysis', 'chordae_analysis'):
+    sys.path.append(os.path.join(ROOT_DIR, _sub))
+
+from synthetic_echo import write_video, write_stills, parse_size
+from stub_models import StubSegmenter, StubMVDetector
+from profiler import Profiler
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def _peak_rss_mb():
+    """このプロセスの最大常駐メモリ (MB)"""
+    if resource is None: return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == 'darwin' else rss / 1024.0
+
+def bench_loop_stages(video_path: str, work_dir: str) -> dict:
+    """echo_loop の処理段（デコード・マスク生成・閉ループ検出・描画・エンコード）ごとの時間"""
+    from echo_loop import get_fan_geometry, make_kernels, make_closed_mask, render_overlay, PARAMS
+    from loop_detector import DETECTORS
+    prof = Profiler()
+    cap = cv2.VideoCapture(video_path)
+    w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    out = cv2.VideoWriter(os.path.join(work_dir, "loop_stages_overlay.mp4"), cv2.VideoWriter_fourcc(*'mp4v'), 30, (w, h))
+    fan = prof.run('fan_geometry', get_fan_geometry, w, h, PARAMS)
+    k_box, k_morph = make_kernels(PARAMS)
+    frames, t0 = 0, time.perf_counter()
+    try:
+        while True:
+            ret, frame = prof.run('decode', cap.read)
+            if not ret: break
+            mask_closed = prof.run('closed_mask', make_closed_mask, frame, fan, k_box, k_morph, PARAMS)
+            max_area, contours = prof.run('detect', DETECTORS['tree'], mask_closed)
+            vis = prof.run('render', render_overlay, mask_closed, contours, max_area > PARAMS['area_thr'])
+            prof.run('encode', out.write, vis)
+            frames += 1
+    finally:
+        cap.release(); out.release()
+    return {'frames': frames, 'wall_s': time.perf_counter() - t0, 'stages': prof.summary()['stages']}
+
+def bench_loop_e2e(video_path: str, work_dir: str, threads: int = 0) -> dict:
+    """echo_loop.process_video 全体の時間"""
+    from echo_loop import process_video
+    from video_io import get_video_info
+    t0 = time.perf_counter()
+    process_video(video_path, os.path.join(work_dir, f"loop_e2e_t{threads}"), threads=threads)
+    return {'frames': get_video_info(video_path)[0], 'wall_s': time.perf_counter() - t0, 'stages': {}}
+
+def bench_lv_stages(video_path: str, work_dir: str, batch_size: int = 32) -> dict:
+    """lv_research の処理段（デコード・スタブU-Net・幾何学マスク）ごとの時間"""
+    from lv_geometry import get_geometric_mask, PARAMS
+    from video_io import iter_frames
+    prof = Profiler()
+    segmenter = StubSegmenter()
+    frames, batch = 0, []
+    it = iter_frames(video_path)
+    t0 = time.perf_counter()
+
+    def flush():
+        masks = prof.run('segment_stub', segmenter.predict_masks, batch, batch_size)
+        for frame, mask in zip(batch, masks):
+            geo = prof.run('geometric_mask', get_geometric_mask, frame, PARAMS)
+            prof.run('count', lambda: (np.count_nonzero(mask), np.count_nonzero(geo)))
+        batch.clear()
+
+    while True:
+        item = prof.run('decode', next, it, None)
+        if item is None: break
+        batch.append(item[1]); frames += 1
+        if len(batch) == batch_size: flush()
+    if batch: flush()
+    return {'frames': frames, 'wall_s': time.perf_counter() - t0, 'stages': prof.summary()['stages']}
+
+def bench_chordae_stages(stills_dir: str, work_dir: str) -> dict:
+    """chordae_evaluation の処理段（読み込み・スタブYOLO・判定・描画・書き出し）ごとの時間"""
+    import chordae_detect as cd
+    prof = Profiler()
+    detector = StubMVDetector()
+    mv_ids = cd.get_mv_class_ids(detector.names)
+    out_dir = os.path.join(work_dir, "chordae_stages")
+    os.makedirs(out_dir, exist_ok=True)
+    images, t0 = 0, time.perf_counter()
+    for sub in ('pos', 'neg'):
+        d = os.path.join(stills_dir, sub)
+        for fname in sorted(os.listdir(d)):
+            img = prof.run('imread', cv2.imread, os.path.join(d, fname))
+            boxes = prof.run('detect_stub', detector.detect, [img])[0]
+            best_box = cd.select_mv_box(boxes, mv_ids)
+            label, _, rois = prof.run('analyze_chordae', cd.analyze_chordae, img, best_box['xyxy'], return_rois=True)
+            vis = prof.run('visualize', cd.visualize_results, img, best_box['xyxy'], label=label, rois=rois)
+            prof.run('imwrite', cv2.imwrite, os.path.join(out_dir, fname), vis)
+            images += 1
+    return {'frames': images, 'wall_s': time.perf_counter() - t0, 'stages': prof.summary()['stages']}
+
+def bench_chordae_e2e(stills_dir: str, work_dir: str, batch_size: int = 16) -> dict:
+    """chordae_evaluation.process_directory 全体の時間（スタブYOLO使用）"""
+    import chordae_detect as cd
+    from chordae_evaluation import process_directory
+    detector = StubMVDetector()
+    mv_ids = cd.get_mv_class_ids(detector.names)
+    images, t0 = 0, time.perf_counter()
+    for sub, gt in (('pos', 1), ('neg', 0)):
+        _, _, _, records = process_directory(detector, os.path.join(stills_dir, sub), gt,
+                                             os.path.join(work_dir, "chordae_e2e"), mv_ids, batch_size=batch_size)
+        images += len(records)
+    return {'frames': images, 'wall_s': time.perf_counter() - t0, 'stages': {}}
+
+BENCHMARKS = {
+    'loop_stages': bench_loop_stages,
+    'loop_e2e': bench_loop_e2e,
+    'lv_stages': bench_lv_stages,
+    'chordae_stages': bench_chordae_stages,
+    'chordae_e2e': bench_chordae_e2e,
+}
+
+def _run_case(case: dict) -> dict:
+    """子プロセスで1つのベンチマークを実行し、スループットと最大メモリを加えて返す（モジュールの読み込み時間は含めない）"""
+    result = BENCHMARKS[case['bench']](case['input'], case['work_dir'], **case.get('kwargs', {}))
+    wall = result['wall_s']
+    result.update({'fps': result['frames'] / wall if wall > 0 else 0.0, 'peak_rss_mb': _peak_rss_mb()})
+    return result
+
+def run_case(case: dict) -> dict:
+    """最大メモリを個別に計測するため、ベンチマークごとに新しいプロセスで実行する"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(_run_case, case).result()
+
+def environment_info() -> dict:
+    """結果の比較用に実行環境とコードのバージョンを記録する"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'git_commit': commit, 'python': platform.python_version(),
+            'numpy': np.__version__, 'opencv': cv2.__version__, 'platform': platform.platform(),
+            'cpu_count': os.cpu_count()}
+
+def compare_results(current: list, baseline: list, tolerance: float) -> list:
+    """基準結果と比べてスループットが tolerance の割合以上低下したケースを返す"""
+    base = {(r['case'], r['size']): r for r in baseline}
+    regressions = []
+    for r in current:
+        b = base.get((r['case'], r['size']))
+        if b is None or b['fps'] <= 0: continue
+        change = r['fps'] / b['fps'] - 1.0
+        print(f"  {r['case']:>18} {r['size']:>9}: {b['fps']:8.1f} -> {r['fps']:8.1f} fps ({change:+.1%})")
+        if change < -tolerance:
+            regressions.append((r['case'], r['size'], change))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic-video benchmark suite for loop/LV/chordae analysis")
+    parser.add_argument("--sizes", type=parse_size, nargs="+", default=[(640, 480)], help="Frame sizes WxH")
+    parser.add_argument("--frames", type=int, default=300, help="Frames per synthetic video")
+    parser.add_argument("--stills", type=int, default=100, help="Synthetic stills per class (pos/neg)")
+    parser.add_argument("--bench", choices=sorted(BENCHMARKS), nargs="+", default=list(BENCHMARKS), help="Benchmarks to run")
+    parser.add_argument("--threads", type=int, nargs="+", default=[0, 4], help="Thread counts for loop_e2e")
+    parser.add_argument("--work_dir", type=str, default=None, help="Directory for synthetic data and outputs (default: temporary)")
+    parser.add_argument("--out", type=str, default="benchmark_results.json", help="Output JSON path")
+    parser.add_argument("--compare", type=str, default=None, help="Baseline JSON to compare throughput against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed throughput drop vs. baseline before reporting a regression")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="echo_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    try:
+        for w, h in args.sizes:
+            size = f"{w}x{h}"
+            video = os.path.join(work_dir, f"synthetic_{size}_{args.frames}.mp4")
+            if not os.path.exists(video):
+                write_video(video, args.frames, w, h)
+            stills = os.path.join(work_dir, f"stills_{size}_{args.stills}")
+            if not os.path.isdir(stills):
+                write_stills(stills, args.stills, w, h)
+
+            cases = []
+            for name in args.bench:
+                inp = stills if name.startswith('chordae') else video
+                if name == 'loop_e2e':
+                    cases += [(f"loop_e2e_t{t}", {'bench': name, 'input': inp, 'work_dir': work_dir, 'kwargs': {'threads': t}})
+                              for t in args.threads]
+                else:
+                    cases.append((name, {'bench': name, 'input': inp, 'work_dir': work_dir}))
+            for case_name, case in cases:
+                res = run_case(case)
+                res.update({'case': case_name, 'size': size})
+                results.append(res)
+                rss = f"{res['peak_rss_mb']:.0f} MB" if res['peak_rss_mb'] is not None else "n/a"
+                print(f"[{case_name} {size}] {res['frames']} frames, {res['fps']:.1f} fps, peak RSS {rss}")
+                for stage, st in res['stages'].items():
+                    print(f"    {stage:>16}: {st['mean_ms']:8.3f} ms (max {st['max_ms']:.3f} ms) x {st['calls']}")
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump({'env': environment_info(), 'results': results}, f, indent=2)
+    print(f"Saved benchmark results to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\n--- Comparison with {args.compare} ({baseline['env'].get('git_commit')}) ---")
+        regressions = compare_results(results, baseline['results'], args.tolerance)
+        if regressions:
+            print(f"Regressions (> {args.tolerance:.0%} slower): {regressions}")
+            sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,46 @@
+import cv2
+import numpy as np
+from synthetic_echo import valve_box
+
+INPUT_SHAPE = (384, 384)
+
+class StubSegmenter:
+    """
+    LVSegmenter の代わりに使うスタブ（Kerasの重みを使わずに同じ入出力を再現する）
+
+    推論の代わりに、入力解像度への縮小・しきい値処理・元サイズへの最近傍拡大を行う。
+    """
+    def __init__(self, model_path: str = None, cache=None):
+        self.cache = cache
+
+    def predict_small_masks(self, frames: list, batch_size: int = 32) -> list:
+        """入力解像度 (384x384) のマスクを返す"""
+        masks = []
+        for frame in frames:
+            gray = cv2.cvtColor(cv2.resize(frame, INPUT_SHAPE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+            _, mask = cv2.threshold(cv2.blur(gray, (9, 9)), 25, 255, cv2.THRESH_BINARY_INV)
+            masks.append(mask)
+        return masks
+
+    def predict_masks(self, frames: list, batch_size: int = 32) -> list:
+        """元の解像度のマスクを返す"""
+        return [cv2.resize(m, (f.shape[1], f.shape[0]), interpolation=cv2.INTER_NEAREST)
+                for f, m in zip(frames, self.predict_small_masks(frames, batch_size))]
+
+    def predict_mask(self, frame: np.ndarray) -> np.ndarray:
+        return self.predict_masks([frame])[0]
+
+class StubMVDetector:
+    """
+    MVDetector の代わりに使うスタブ（YOLOの重みを使わずに同じ入出力を再現する）
+
+    合成画像の僧帽弁の位置 (synthetic_echo.valve_box) を信頼度 0.9 の検出結果として返す。
+    """
+    def __init__(self, model_path: str = None, cache=None):
+        self.cache = cache
+        self.names = {0: 'MV'}
+
+    def detect(self, imgs: list) -> list:
+        """複数画像の検出結果を (N, 6) [cls, conf, x1, y1, x2, y2] 配列のリストで返す"""
+        return [np.concatenate([[0.0, 0.9], valve_box(img.shape[1], img.shape[0])]).astype(np.float32).reshape(1, 6)
+                for img in imgs]
\ No newline at end of file
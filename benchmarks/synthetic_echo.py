@@ -0,0 +1,110 @@
+import os
+import math
+import argparse
+import cv2
+import numpy as np
+
+# 合成画像の基準サイズ（各解析モジュールの PARAMS はこのサイズの動画を想定している）
+BASE_SIZE = (640, 480)
+FAN_CENTER = (315, 62)
+FAN_RADIUS = 300
+FAN_DEG = (46.0, 131.0)      # 扇形の左右端の角度（PARAMS['fan_angles'] の傾きに対応）
+CYCLE_FRAMES = 30             # 1心周期のフレーム数
+
+def _scale(w: int, h: int) -> float:
+    """基準サイズに対する拡大率"""
+    return min(w / BASE_SIZE[0], h / BASE_SIZE[1])
+
+def valve_box(w: int, h: int) -> np.ndarray:
+    """合成画像中の僧帽弁を囲むボックス [x1, y1, x2, y2]（スタブ検出器が返す座標）"""
+    s = _scale(w, h)
+    return np.array([355 * s, 205 * s, 430 * s, 265 * s], dtype=np.float32)
+
+def make_frame(w: int, h: int, t: int, rng: np.random.Generator, chordae: bool = True) -> np.ndarray:
+    """
+    PLAX像を模した扇形のエコー画像を1フレーム生成する
+
+    扇形内のスペックルノイズに、心周期で伸縮する左室壁、左側で開閉を繰り返すループ、
+    僧帽弁の弁尖と腱索（chordae=True の場合）を描画する。
+    """
+    s = _scale(w, h)
+    phase = 2 * math.pi * (t % CYCLE_FRAMES) / CYCLE_FRAMES
+    beat = 0.5 * (1 + math.sin(phase))
+    center = (int(FAN_CENTER[0] * s), int(FAN_CENTER[1] * s))
+
+    fan = np.zeros((h, w), dtype=np.uint8)
+    cv2.ellipse(fan, center, (int(FAN_RADIUS * s), int(FAN_RADIUS * s)), 0, FAN_DEG[0], FAN_DEG[1], 255, -1)
+    img = rng.rayleigh(12.0, (h, w)).clip(0, 255).astype(np.uint8)
+
+    # 左室の前壁（中隔）と後壁（左側は扇形の外まで伸び、左室腔は左に開いている）
+    xs = np.arange(60, 560, 10) * s
+    for y0, amp, level, thick in [(170, -10, 170, 14), (330, 12, 150, 18)]:
+        ys = (y0 + (amp * beat) * np.sin(np.pi * (xs / s - 60) / 500)) * s
+        cv2.polylines(img, [np.stack([xs, ys], axis=1).astype(np.int32)], False, level, max(1, int(thick * s)))
+
+    # 左側のループ（拡張期には閉じ、収縮期には開く）
+    gap = 0 if beat > 0.5 else 70
+    cv2.ellipse(img, (int(255 * s), int(250 * s)), (int(40 * s), int(34 * s)), 0, gap, 360, 200, max(1, int(6 * s)))
+
+    # 僧帽弁の弁尖と腱索
+    base = (int(420 * s), int(225 * s))
+    angle = math.radians(200 + 25 * beat)
+    tip = (int(base[0] + 60 * s * math.cos(angle)), int(base[1] - 60 * s * math.sin(angle)))
+    cv2.line(img, base, tip, 230, max(1, int(6 * s)))
+    if chordae:
+        cv2.line(img, tip, (int(tip[0] - 30 * s), int(tip[1] + 40 * s)), 120, max(1, int(3 * s)))
+
+    img = cv2.GaussianBlur(img, (5, 5), 0)
+    img = cv2.bitwise_and(img, img, mask=fan)
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+def write_video(path: str, n_frames: int, w: int = BASE_SIZE[0], h: int = BASE_SIZE[1], fps: float = 30.0, seed: int = 0):
+    """合成動画を mp4v で書き出す"""
+    rng = np.random.default_rng(seed)
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+    try:
+        for t in range(n_frames):
+            out.write(make_frame(w, h, t, rng))
+    finally:
+        out.release()
+
+def write_stills(dir_path: str, n_images: int, w: int = BASE_SIZE[0], h: int = BASE_SIZE[1], seed: int = 0) -> tuple:
+    """
+    腱索あり (pos/) と腱索なし (neg/) の合成静止画を n_images 枚ずつ書き出す
+
+    Returns:
+        (pos ディレクトリ, neg ディレクトリ)
+    """
+    rng = np.random.default_rng(seed)
+    dirs = []
+    for name, chordae in [("pos", True), ("neg", False)]:
+        d = os.path.join(dir_path, name)
+        os.makedirs(d, exist_ok=True)
+        for i in range(n_images):
+            cv2.imwrite(os.path.join(d, f"{name}_{i:05d}.png"), make_frame(w, h, int(rng.integers(CYCLE_FRAMES)), rng, chordae))
+        dirs.append(d)
+    return tuple(dirs)
+
+def parse_size(text: str) -> tuple:
+    """'640x480' 形式の文字列を (幅, 高さ) に変換する"""
+    w, h = text.lower().split('x')
+    return int(w), int(h)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic PLAX-like echo videos and stills")
+    parser.add_argument("out_dir", help="Output directory")
+    parser.add_argument("--size", type=parse_size, default=BASE_SIZE, help="Frame size WxH (default: 640x480)")
+    parser.add_argument("--frames", type=int, default=300, help="Frames per video")
+    parser.add_argument("--videos", type=int, default=1, help="Number of videos")
+    parser.add_argument("--stills", type=int, default=0, help="Number of stills per class (pos/neg)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    w, h = args.size
+    for i in range(args.videos):
+        path = os.path.join(args.out_dir, f"synthetic_{w}x{h}_{i + 1}.mp4")
+        write_video(path, args.frames, w, h, seed=args.seed + i)
+        print(f"Saved: {path}")
+    if args.stills > 0:
+        print(f"Saved stills: {write_stills(os.path.join(args.out_dir, 'stills'), args.stills, w, h, args.seed)}")
\ No newline at end of file
@@ -50,11 +50,30 @@ def _get_rois_coordinates(img_shape: Tuple[int, ...], bbox: np.ndarray) -> Tuple
     ly2 = min(h, y2 + extend_px)
     return (x1, y1, x2, y2), (lx1, y1, lx2, ly2)
 
-def analyze_chordae(img: np.ndarray, bbox: np.ndarray) -> Tuple[int, float]:
-    """腱索の接続状態を判定する (1=Connected, 0=None)"""
+def get_mv_class_ids(names: dict) -> list:
+    """YOLOモデルのクラス名から僧帽弁(MV)に該当するクラスIDを抽出する"""
+    return [k for k, v in names.items() if "mv" in v.lower() or "mitral" in v.lower()]
+
+def select_mv_box(boxes: np.ndarray, mv_class_ids) -> Optional[dict]:
+    """検出結果 (N, 6) [cls, conf, x1, y1, x2, y2] から僧帽弁クラスで最も信頼度の高いボックスを選択する"""
+    best_box = None
+    for box in boxes:
+        if int(box[0]) in mv_class_ids:
+            conf = float(box[1])
+            if best_box is None or conf > best_box['conf']:
+                best_box = {'conf': conf, 'xyxy': box[2:6]}
+    return best_box
+
+def analyze_chordae(img: np.ndarray, bbox: np.ndarray, return_rois: bool = False):
+    """
+    腱索の接続状態を判定する (1=Connected, 0=None)
+
+    Returns:
+        (判定ラベル, 輝度比)。return_rois=True の場合は visualize_results に渡せる処理済みROI（ROIが定義できない場合は None）を加えた3要素
+    """
     valve_coords, left_coords = _get_rois_coordinates(img.shape, bbox)
     if valve_coords is None or left_coords is None:
-        return 0, 0.0
+        return (0, 0.0, None) if return_rois else (0, 0.0)
     gray = _to_gray(img)
     vx1, vy1, vx2, vy2 = valve_coords
     valve_roi = _process_roi(gray[vy1:vy2, vx1:vx2], CONFIG['NOISE_THRESH_VALVE'])
@@ -62,25 +81,29 @@ def analyze_chordae(img: np.ndarray, bbox: np.ndarray) -> Tuple[int, float]:
     lx1, ly1, lx2, ly2 = left_coords
     left_roi = _process_roi(gray[ly1:ly2, lx1:lx2], CONFIG['NOISE_THRESH_LEFT'])
     left_sum = float(left_roi.sum())
+    rois = {'valve_coords': valve_coords, 'valve': valve_roi, 'left_coords': left_coords, 'left': left_roi}
     if valve_sum <= 1e-6:
-        return 0, 0.0
+        return (0, 0.0, rois) if return_rois else (0, 0.0)
     ratio = left_sum / valve_sum
     label = 1 if ratio >= CONFIG['INTENSITY_RATIO_THRESH'] else 0
-    return label, ratio
+    return (label, ratio, rois) if return_rois else (label, ratio)
 
-def visualize_results(img: np.ndarray, bbox: np.ndarray, label: int = None) -> np.ndarray:
-    """判定結果を描画する"""
-    valve_coords, left_coords = _get_rois_coordinates(img.shape, bbox)
+def visualize_results(img: np.ndarray, bbox: np.ndarray, label: int = None, rois: dict = None) -> np.ndarray:
+    """判定結果を描画する（rois に analyze_chordae の処理済みROIを渡すと前処理を再計算しない）"""
+    if rois is not None:
+        valve_coords, left_coords = rois['valve_coords'], rois['left_coords']
+    else:
+        valve_coords, left_coords = _get_rois_coordinates(img.shape, bbox)
     if valve_coords is None: return img.copy()
     vis_img = (img.copy() * 0.4).astype(np.uint8)
-    gray = _to_gray(img)
+    gray = _to_gray(img) if rois is None else None
     vx1, vy1, vx2, vy2 = valve_coords
-    v_roi = _process_roi(gray[vy1:vy2, vx1:vx2], CONFIG['NOISE_THRESH_VALVE'])
+    v_roi = rois['valve'] if rois is not None else _process_roi(gray[vy1:vy2, vx1:vx2], CONFIG['NOISE_THRESH_VALVE'])
     vis_img[vy1:vy2, vx1:vx2] = cv2.cvtColor(v_roi, cv2.COLOR_GRAY2BGR)
     cv2.rectangle(vis_img, (vx1, vy1), (vx2, vy2), (0, 0, 255), 2)
     if left_coords:
         lx1, ly1, lx2, ly2 = left_coords
-        l_roi = _process_roi(gray[ly1:ly2, lx1:lx2], CONFIG['NOISE_THRESH_LEFT'])
+        l_roi = rois['left'] if rois is not None else _process_roi(gray[ly1:ly2, lx1:lx2], CONFIG['NOISE_THRESH_LEFT'])
         vis_img[ly1:ly2, lx1:lx2] = cv2.cvtColor(l_roi, cv2.COLOR_GRAY2BGR)
         cv2.rectangle(vis_img, (lx1, ly1), (lx2, ly2), (0, 255, 255), 2)
     if label is not None:
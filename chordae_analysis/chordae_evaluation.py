@@ -1,10 +1,20 @@
 import os
+import sys
 import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
-from sklearn.metrics import classification_report, confusion_matrix
-from ultralytics import YOLO
 import chordae_detect as cd
+from mv_detector import MVDetector
+from score_analysis import save_scores
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+from inference_cache import InferenceCache, add_cache_args
+from model_client import connect_model_server, add_server_args
+from stage_pipeline import run_stages
+from frame_store import list_images, open_store, add_store_args
+from profiler import Profiler, NULL_PROFILER, add_profile_args
 
 def get_args():
     """コマンドライン引数を解析し、設定値を取得する"""
@@ -13,67 +23,143 @@ def get_args():
     parser.add_argument("--pos_dir", type=str, required=True, help="Connected images dir")
     parser.add_argument("--neg_dir", type=str, required=True, help="None images dir")
     parser.add_argument("--out_dir", type=str, default="results", help="Output dir")
+    parser.add_argument("--batch_size", type=int, default=16, help="Number of images per YOLO inference call")
+    parser.add_argument("--io_threads", type=int, default=4, help="Threads for image decoding and visualization writing")
+    parser.add_argument("--no_vis", action="store_true", help="Skip writing visualization images (render them later from the score file with render_vis.py)")
+    parser.add_argument("--scores_out", type=str, default=None, help="Per-image score file for score_analysis.py (default: <out_dir>/chordae_scores.npz)")
+    add_cache_args(parser)
+    add_server_args(parser)
+    add_store_args(parser, color=False)
+    add_profile_args(parser)
     return parser.parse_args()
 
-def process_directory(model, dir_path, gt_label, output_base, mv_class_ids):
-    """指定ディレクトリ内の画像を順次処理し、正誤判定結果を返す"""
-    y_true, y_pred = [], []
+def result_subset(gt_label: int, pred_label) -> str:
+    """可視化画像の保存先サブディレクトリ名 (TP / FN / FP / TN / undetected) を返す（pred_label=None は未検出）"""
+    if pred_label is None:
+        return "undetected"
+    if gt_label == 1:
+        return "TP" if pred_label == 1 else "FN"
+    return "FP" if pred_label == 1 else "TN"
+
+def _save_visualization(img, best_box, pred_label, save_path, prof=NULL_PROFILER):
+    """判定結果の可視化画像を書き出す"""
+    vis = prof.run('visualize', cd.visualize_results, img, best_box['xyxy'] if best_box else [], label=pred_label,
+                   rois=best_box.get('rois') if best_box else None)
+    prof.run('imwrite', cv2.imwrite, save_path, vis)
+
+def process_directory(detector, dir_path, gt_label, output_base, mv_class_ids, batch_size=16, io_threads=4, save_vis=True,
+                      prof=NULL_PROFILER, frame_store=None):
+    """
+    指定ディレクトリ内の画像を処理し、正誤判定結果を返す
+
+    画像の読み込み（スレッドプールで先読み）、YOLOのバッチ推論と判定、可視化画像の書き出しを別スレッドで重ねて実行する。
+    結果は画像の順序どおりに集計するため、逐次処理と同じ判定結果になる。save_vis=False の場合は可視化画像を書き出さない。
+    prof を指定した場合は処理段（読み込み・YOLO・判定・描画・書き出し）ごとの時間と画像数を記録する。
+    frame_store を指定した場合は、ディレクトリの画像を初回のみデコードしてフレームストア (common/frame_store.py) を作成し、
+    以降は画像をデコードせずにストアから読み出す（読み込めない画像はストアに含まれないため、結果は同じになる）。
+
+    Returns:
+        (正解ラベルのリスト, 予測ラベルのリスト, 未検出数, 画像ごとのスコア (score_analysis.save_scores の形式))
+    """
+    y_true, y_pred, records = [], [], []
     undetected = 0
     if not os.path.exists(dir_path):
         print(f"Warning: Directory not found -> {dir_path}")
-        return [], [], 0
-    exts = {".png", ".jpg", ".jpeg", ".bmp"}
-    files = [f for f in os.listdir(dir_path) if os.path.splitext(f.lower())[1] in exts]
+        return [], [], 0, []
+    store = open_store(frame_store, dir_path) if frame_store else None
+    files = store.names if store is not None else list_images(dir_path)
     print(f"Processing directory: {dir_path} ({len(files)} images)")
 
-    for fname in files:
-        img_path = os.path.join(dir_path, fname)
-        img = cv2.imread(img_path)
-        if img is None: continue
-        results = model(img, verbose=False)[0]
-        best_box = None
-        for box in results.boxes:
-            if int(box.cls[0]) in mv_class_ids:
-                conf = float(box.conf[0])
-                if best_box is None or conf > best_box['conf']:
-                    best_box = {'conf': conf, 'xyxy': box.xyxy[0].cpu().numpy()}
-        
-        save_subdir = "undetected"
-        pred_label = 0
-        if best_box:
-            pred_label, _ = cd.analyze_chordae(img, best_box['xyxy'])
-            if gt_label == 1: save_subdir = "TP" if pred_label == 1 else "FN"
-            else: save_subdir = "FP" if pred_label == 1 else "TN"
-            y_true.append(gt_label)
-            y_pred.append(pred_label)
-        else:
-            undetected += 1
-        
-        save_dir = os.path.join(output_base, save_subdir)
-        os.makedirs(save_dir, exist_ok=True)
-        vis = cd.visualize_results(img, best_box['xyxy'] if best_box else [], label=pred_label if best_box else None)
-        cv2.imwrite(os.path.join(save_dir, fname), vis)
-    return y_true, y_pred, undetected
+    io_pool = ThreadPoolExecutor(max_workers=max(1, io_threads))
+    batch_starts = iter(range(0, len(files), max(1, batch_size)))
+    pending_writes = deque()
+
+    def read_batch():
+        start = next(batch_starts, None)
+        if start is None: return None
+        names = files[start:start + max(1, batch_size)]
+        if store is not None:
+            return [(fname, prof.run('imread', store.frame, i)) for i, fname in enumerate(names, start)]
+        imgs = io_pool.map(lambda path: prof.run('imread', cv2.imread, path), [os.path.join(dir_path, f) for f in names])
+        return [(fname, img) for fname, img in zip(names, imgs) if img is not None]
+
+    def infer_batch(batch):
+        all_boxes = prof.run('yolo', detector.detect, [img for _, img in batch])
+        results = []
+        for (fname, img), boxes in zip(batch, all_boxes):
+            best_box = cd.select_mv_box(boxes, mv_class_ids)
+            pred_label = ratio = None
+            if best_box:
+                pred_label, ratio, best_box['rois'] = prof.run('analyze_chordae', cd.analyze_chordae, img, best_box['xyxy'], return_rois=True)
+            results.append((fname, img, best_box, pred_label, ratio))
+        return results
+
+    def write_batch(results):
+        nonlocal undetected
+        for fname, img, best_box, pred_label, ratio in results:
+            records.append((os.path.join(dir_path, fname), gt_label, best_box['conf'] if best_box else None,
+                            best_box['xyxy'] if best_box else None, ratio, pred_label))
+            save_subdir = result_subset(gt_label, pred_label)
+            if best_box:
+                y_true.append(gt_label)
+                y_pred.append(pred_label)
+            else:
+                undetected += 1
+                prof.count('undetected')
+            prof.count('images')
+            if not save_vis: continue
+            save_dir = os.path.join(output_base, save_subdir)
+            os.makedirs(save_dir, exist_ok=True)
+            pending_writes.append(io_pool.submit(_save_visualization, img, best_box, pred_label, os.path.join(save_dir, fname), prof))
+            while len(pending_writes) > 4 * max(1, io_threads):
+                pending_writes.popleft().result()
+
+    try:
+        # YOLOの推論は1スレッドで順に行い、その間に次のバッチの読み込みと可視化画像の書き出しを進める
+        run_stages(read_batch, infer_batch, write_batch, workers=1, queue_depth=2)
+        while pending_writes:
+            pending_writes.popleft().result()
+    finally:
+        io_pool.shutdown(wait=True)
+    return y_true, y_pred, undetected, records
 
 def main():
     """モデルの読み込みと評価プロセス全体を実行する"""
     args = get_args()
     if not os.path.exists(args.model):
         raise FileNotFoundError(f"Model not found: {args.model}")
-    print(f"Loading model: {args.model}")
-    model = YOLO(args.model)
-    mv_ids = [k for k, v in model.names.items() if "mv" in v.lower() or "mitral" in v.lower()]
+    cache = None
+    if args.cache_dir:
+        cache = InferenceCache(args.cache_dir, args.model, 'yolo_mv', max_bytes=args.cache_size_mb << 20)
+    prof = Profiler() if args.profile else NULL_PROFILER
+    detector = MVDetector(args.model, cache=cache, server=connect_model_server(args.model_server, 'mv', args.model))
+    mv_ids = cd.get_mv_class_ids(detector.names)
     
-    all_true, all_pred = [], []
+    all_true, all_pred, all_records = [], [], []
     total_und = 0
-    yt, yp, und = process_directory(model, args.pos_dir, 1, args.out_dir, mv_ids)
-    all_true.extend(yt); all_pred.extend(yp); total_und += und
-    yt, yp, und = process_directory(model, args.neg_dir, 0, args.out_dir, mv_ids)
-    all_true.extend(yt); all_pred.extend(yp); total_und += und
+    opts = dict(batch_size=args.batch_size, io_threads=args.io_threads, save_vis=not args.no_vis, prof=prof,
+                frame_store=args.frame_store)
+    for dir_path, gt_label in [(args.pos_dir, 1), (args.neg_dir, 0)]:
+        yt, yp, und, rec = process_directory(detector, dir_path, gt_label, args.out_dir, mv_ids, **opts)
+        all_true.extend(yt); all_pred.extend(yp); total_und += und; all_records.extend(rec)
+
+    scores_out = args.scores_out or os.path.join(args.out_dir, "chordae_scores.npz")
+    os.makedirs(os.path.dirname(os.path.abspath(scores_out)), exist_ok=True)
+    save_scores(all_records, scores_out)
+    print(f"Saved per-image scores to {scores_out} (re-tune thresholds with score_analysis.py)")
 
+    if cache is not None:
+        print(f"Inference cache: {cache.stats()}")
+        for key in ('hits', 'misses', 'evictions'):
+            prof.count(f"cache_{key}", cache.stats()[key])
+    if args.profile:
+        prof.print_summary()
+        prof.save(args.profile, tool="chordae_evaluation", batch_size=args.batch_size, io_threads=args.io_threads)
+        print(f"Saved profile to {args.profile}")
     if not all_true:
         print("No valid images processed.")
         return
+    from sklearn.metrics import classification_report, confusion_matrix
     print("\n" + "="*40 + "\n Evaluation Report\n" + "="*40)
     print(f"Total Valid: {len(all_true)}, Undetected: {total_und}")
     print(classification_report(all_true, all_pred, target_names=["None", "Connected"]))
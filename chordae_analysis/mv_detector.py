@@ -0,0 +1,76 @@
+import numpy as np
+
+def boxes_to_array(result) -> np.ndarray:
+    """YOLOの検出結果を (N, 6) [cls, conf, x1, y1, x2, y2] の float32 配列に変換する"""
+    boxes = result.boxes
+    if len(boxes) == 0:
+        return np.zeros((0, 6), dtype=np.float32)
+    return np.concatenate([
+        boxes.cls.cpu().numpy().reshape(-1, 1),
+        boxes.conf.cpu().numpy().reshape(-1, 1),
+        boxes.xyxy.cpu().numpy().reshape(-1, 4),
+    ], axis=1).astype(np.float32)
+
+class MVDetector:
+    """
+    YOLOによる僧帽弁検出を行う
+
+    cache (common/inference_cache.InferenceCache) を指定した場合は、検出結果とクラス名を
+    画像内容とモデルファイルのハッシュで永続キャッシュし、全てヒットする間はモデルをロードしない。
+    server (common/model_client.ModelClient) を指定した場合は、モデルをロードせずにモデルサーバーで検出する。
+    """
+    def __init__(self, model_path: str, cache=None, server=None):
+        self.model_path = model_path
+        self.cache = cache
+        self.server = server
+        self._model = None
+        names = cache.get_meta('names') if cache is not None else None
+        if names is None:
+            names = server.call('mv_names') if server is not None else self.model.names
+            names = {int(k): v for k, v in names.items()}
+            if cache is not None:
+                cache.put_meta('names', names)
+        self.names = {int(k): v for k, v in names.items()}
+
+    @property
+    def model(self):
+        if self._model is None:
+            from ultralytics import YOLO
+            print(f"Loading model: {self.model_path}")
+            self._model = YOLO(self.model_path)
+        return self._model
+
+    def _infer(self, imgs: list) -> list:
+        """
+        キャッシュを介さずに検出し、画像ごとの (N, 6) 配列のリストを返す
+
+        サイズの異なる画像を1回の推論にまとめるとレターボックスの余白の付け方が1枚ずつの推論と変わるため、
+        同じサイズの画像ごとにまとめて推論する（結果はバッチの組み方によらず1枚ずつ推論した場合と同じになる）。
+        """
+        if self.server is not None:
+            return self.server.call('mv_detect', imgs=imgs)
+        groups = {}
+        for i, img in enumerate(imgs):
+            groups.setdefault(img.shape, []).append(i)
+        results = [None] * len(imgs)
+        for idx in groups.values():
+            for i, result in zip(idx, self.model([imgs[i] for i in idx], verbose=False)):
+                results[i] = boxes_to_array(result)
+        return results
+
+    def detect(self, imgs: list) -> list:
+        """複数画像をまとめて検出し、画像ごとの (N, 6) 配列のリストを返す"""
+        if len(imgs) == 0:
+            return []
+        results = [None] * len(imgs)
+        if self.cache is not None:
+            for i, value in enumerate(self.cache.get_many(imgs)):
+                if value is not None:
+                    results[i] = np.frombuffer(value, dtype=np.float32).reshape(-1, 6)
+        todo = [i for i, r in enumerate(results) if r is None]
+        if todo:
+            for i, boxes in zip(todo, self._infer([imgs[i] for i in todo])):
+                results[i] = boxes
+            if self.cache is not None:
+                self.cache.put_many([imgs[i] for i in todo], [results[i].tobytes() for i in todo])
+        return results
\ No newline at end of file
@@ -0,0 +1,62 @@
+import os
+import json
+import fnmatch
+import argparse
+import cv2
+import numpy as np
+import chordae_detect as cd
+from chordae_evaluation import result_subset
+from score_analysis import RATIO_CONFIG_KEYS
+
+SUBSETS = ["TP", "FN", "FP", "TN", "undetected"]
+
+def load_results(path: str) -> list:
+    """
+    chordae_evaluation.py が保存したスコアファイルから、画像ごとの (画像パス, 分類, バウンディングボックス, 判定ラベル) のリストを返す
+
+    判定ラベルを保存していない古いファイルでは、輝度比と現在の INTENSITY_RATIO_THRESH から判定する。未検出の画像は判定ラベルを None とする。
+    """
+    with np.load(path) as data:
+        config = json.loads(str(data['config']))
+        current = {k: cd.CONFIG[k] for k in RATIO_CONFIG_KEYS}
+        if config != current:
+            print(f"[Warning] Scores were computed with a different CONFIG: {config} (current: {current}); ROIs are redrawn with the current CONFIG")
+        ratios = data['ratio']
+        labels = data['label'] if 'label' in data.files else np.where(
+            np.isnan(ratios), -1, (np.nan_to_num(ratios) >= cd.CONFIG['INTENSITY_RATIO_THRESH']).astype(np.int8))
+        items = []
+        for path_i, gt, xyxy, label in zip(data['path'], data['gt'], data['xyxy'], labels):
+            pred = None if label < 0 else int(label)
+            items.append((str(path_i), result_subset(int(gt), pred), None if pred is None else xyxy, pred))
+    return items
+
+def render(items: list, out_dir: str) -> int:
+    """画像を読み直して判定結果を描画し、chordae_evaluation.py と同じ <out_dir>/<分類>/<ファイル名> に保存する"""
+    n = 0
+    for img_path, subset, xyxy, label in items:
+        img = cv2.imread(img_path)
+        if img is None:
+            print(f"[Warning] Could not read image: {img_path}")
+            continue
+        save_dir = os.path.join(out_dir, subset)
+        os.makedirs(save_dir, exist_ok=True)
+        vis = cd.visualize_results(img, xyxy if xyxy is not None else [], label=label)
+        cv2.imwrite(os.path.join(save_dir, os.path.basename(img_path)), vis)
+        n += 1
+    return n
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render chordae visualization images from a score file written by chordae_evaluation.py")
+    parser.add_argument("scores", type=str, help="Score file (.npz) written by chordae_evaluation.py")
+    parser.add_argument("--out_dir", type=str, default="results", help="Output dir")
+    parser.add_argument("--subsets", nargs="+", choices=SUBSETS, default=SUBSETS, help="Only render images in these outcome groups")
+    parser.add_argument("--paths", nargs="+", default=None, help="Only render images whose file name matches one of these glob patterns")
+    parser.add_argument("--limit", type=int, default=None, help="Render at most this many images")
+    args = parser.parse_args()
+
+    items = [it for it in load_results(args.scores) if it[1] in args.subsets]
+    if args.paths:
+        items = [it for it in items if any(fnmatch.fnmatch(os.path.basename(it[0]), p) for p in args.paths)]
+    if args.limit is not None:
+        items = items[:args.limit]
+    print(f"Saved {render(items, args.out_dir)} images to {args.out_dir}")
\ No newline at end of file
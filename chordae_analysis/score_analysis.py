@@ -0,0 +1,115 @@
+import json
+import argparse
+from typing import TYPE_CHECKING
+import numpy as np
+import chordae_detect as cd
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# pandas / scikit-learn は読み込みに時間がかかるため、chordae_evaluation.py が save_scores だけを使う場合には読み込まない
+
+# 輝度比に影響する設定（INTENSITY_RATIO_THRESH は判定にのみ使うため含めない）
+RATIO_CONFIG_KEYS = ['NOISE_THRESH_LEFT', 'NOISE_THRESH_VALVE', 'GAUSSIAN_KERNEL', 'BINARIZATION_THRESH', 'BOX_EXTEND_Y', 'BOX_SHRINK_X']
+
+def save_scores(records: list, path: str):
+    """
+    画像ごとの判定スコアを列ごとの配列として圧縮保存する (.npz)
+
+    records の各要素は (画像パス, 正解ラベル, 検出信頼度, バウンディングボックス, 輝度比, 判定ラベル)。
+    僧帽弁が検出されなかった画像は信頼度・ボックス・輝度比を NaN、判定ラベルを -1 とする。
+    render_vis.py はこのファイルから可視化画像を後から生成する（解析領域はボックスと現在の CONFIG から求め直す）。
+    """
+    n = len(records)
+    boxes = np.full((n, 4), np.nan, dtype=np.float32)
+    for i, rec in enumerate(records):
+        if rec[3] is not None: boxes[i] = rec[3]
+    np.savez_compressed(
+        path,
+        path=np.array([rec[0] for rec in records], dtype=str),
+        gt=np.array([rec[1] for rec in records], dtype=np.int8),
+        conf=np.array([np.nan if rec[2] is None else rec[2] for rec in records], dtype=np.float32),
+        xyxy=boxes,
+        ratio=np.array([np.nan if rec[4] is None else rec[4] for rec in records], dtype=np.float64),
+        label=np.array([-1 if rec[5] is None else rec[5] for rec in records], dtype=np.int8),
+        config=np.array(json.dumps({k: cd.CONFIG[k] for k in RATIO_CONFIG_KEYS})),
+    )
+
+def load_scores(path: str) -> "pd.DataFrame":
+    """save_scores で保存したスコアを DataFrame として読み込む（保存時の CONFIG は attrs['config']）"""
+    import pandas as pd
+    with np.load(path) as data:
+        df = pd.DataFrame({
+            'path': data['path'], 'gt': data['gt'], 'conf': data['conf'],
+            'x1': data['xyxy'][:, 0], 'y1': data['xyxy'][:, 1], 'x2': data['xyxy'][:, 2], 'y2': data['xyxy'][:, 3],
+            'ratio': data['ratio'],
+        })
+        if 'label' in data.files:  # 判定ラベルを保存していない古いファイルでは省略
+            df['label'] = data['label']
+        df.attrs['config'] = json.loads(str(data['config']))
+    return df
+
+def report_threshold(y_true: np.ndarray, ratios: np.ndarray, thresh: float):
+    """指定したしきい値での評価指標と混同行列を表示する（analyze_chordae と同じく ratio >= thresh を Connected とする）"""
+    from sklearn.metrics import classification_report, confusion_matrix
+    y_pred = (ratios >= thresh).astype(int)
+    print("\n" + "="*40 + f"\n INTENSITY_RATIO_THRESH = {thresh:.4f}\n" + "="*40)
+    print(classification_report(y_true, y_pred, labels=[0, 1], target_names=["None", "Connected"], zero_division=0))
+    tn, fp, fn, tp = confusion_matrix(y_true, y_pred, labels=[0, 1]).ravel()
+    print(f"TP:{tp} | FN:{fn}\nFP:{fp} | TN:{tn}")
+
+def optimal_thresholds(y_true: np.ndarray, ratios: np.ndarray) -> dict:
+    """Youden's J（TPR - FPR）が最大となるしきい値と、F1-score が最大となるしきい値を求める"""
+    from sklearn.metrics import roc_curve, precision_recall_curve
+    fpr, tpr, roc_thr = roc_curve(y_true, ratios)
+    j = np.argmax(tpr - fpr)
+    prec, rec, pr_thr = precision_recall_curve(y_true, ratios)
+    f1 = np.divide(2 * prec * rec, prec + rec, out=np.zeros_like(prec), where=(prec + rec) > 0)[:-1]
+    k = np.argmax(f1)
+    return {'youden': float(roc_thr[j]), 'youden_j': float(tpr[j] - fpr[j]),
+            'max_f1': float(pr_thr[k]), 'f1': float(f1[k])}
+
+def save_curves(y_true: np.ndarray, ratios: np.ndarray, csv_out: str):
+    """ROC曲線とPR曲線の各点をCSVに保存する"""
+    import pandas as pd
+    from sklearn.metrics import roc_curve, precision_recall_curve
+    fpr, tpr, roc_thr = roc_curve(y_true, ratios)
+    prec, rec, pr_thr = precision_recall_curve(y_true, ratios)
+    pd.concat([
+        pd.DataFrame({'Curve': 'ROC', 'Threshold': roc_thr, 'X': fpr, 'Y': tpr}),
+        pd.DataFrame({'Curve': 'PR', 'Threshold': pr_thr, 'X': rec[:-1], 'Y': prec[:-1]}),
+    ]).to_csv(csv_out, index=False)
+
+def main():
+    """保存済みスコアからしきい値ごとの評価・ROC/PR解析・最適しきい値の算出を行う"""
+    parser = argparse.ArgumentParser(description="Offline threshold analysis of saved chordae scores")
+    parser.add_argument("scores", type=str, help="Score file written by chordae_evaluation.py (.npz)")
+    parser.add_argument("--thresh", type=float, nargs="+", default=[cd.CONFIG['INTENSITY_RATIO_THRESH']], help="Thresholds to report confusion matrices for")
+    parser.add_argument("--curves_out", type=str, default=None, help="Save ROC/PR curve points to this CSV")
+    args = parser.parse_args()
+
+    from sklearn.metrics import roc_auc_score, average_precision_score
+    df = load_scores(args.scores)
+    current = {k: cd.CONFIG[k] for k in RATIO_CONFIG_KEYS}
+    if df.attrs['config'] != current:
+        print(f"[Warning] Scores were computed with a different CONFIG: {df.attrs['config']} (current: {current})")
+    valid = df[df['ratio'].notna()]
+    print(f"Total Valid: {len(valid)}, Undetected: {len(df) - len(valid)}")
+    if valid.empty or valid['gt'].nunique() < 2:
+        print("Both positive and negative detected images are required.")
+        return
+    y_true, ratios = valid['gt'].to_numpy(), valid['ratio'].to_numpy()
+
+    for thresh in args.thresh:
+        report_threshold(y_true, ratios, thresh)
+    print("\n" + "="*40)
+    print(f"ROC AUC: {roc_auc_score(y_true, ratios):.4f}, PR AP: {average_precision_score(y_true, ratios):.4f}")
+    best = optimal_thresholds(y_true, ratios)
+    print(f"Optimal threshold (Youden's J = {best['youden_j']:.3f}): {best['youden']:.4f}")
+    print(f"Optimal threshold (F1 = {best['f1']:.3f}): {best['max_f1']:.4f}")
+    if args.curves_out:
+        save_curves(y_true, ratios, args.curves_out)
+        print(f"Saved ROC/PR curves to {args.curves_out}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
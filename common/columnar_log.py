@@ -0,0 +1,235 @@
+import os
+import io
+import csv
+import sys
+import json
+import struct
+import argparse
+import numpy as np
+
+MAGIC = b"ECHOCOL1"
+_U32 = struct.Struct("<I")
+DEFAULT_CHUNK_ROWS = 65536
+
+def _column_spec(name: str, dtype) -> dict:
+    """(列名, 型) を保存用の列定義にする（型は numpy の数値型、またはカテゴリの文字列のタプル・リスト）"""
+    if isinstance(dtype, (tuple, list)):
+        if len(dtype) > 255:
+            raise ValueError(f"Too many categories for column {name}: {len(dtype)}")
+        return {'name': name, 'dtype': 'u1', 'categories': [str(c) for c in dtype]}
+    dt = np.dtype(dtype)
+    if dt.kind not in 'iufb':
+        raise ValueError(f"Unsupported column type for {name}: {dt}")
+    return {'name': name, 'dtype': dt.str}
+
+class ColumnarWriter:
+    """
+    行を列ごとの型付き配列としてバッファし、chunk_rows 行ごとにファイル末尾へ追記する列指向ログ
+
+    ファイルは「MAGIC + スキーマ(JSON)」のヘッダの後に、「行数 + 各列の生データ（リトルエンディアン）」のチャンクが続く。
+    カテゴリ列は1バイトのコード（スキーマ内のカテゴリ一覧の位置）で保存する。数値列の空欄（'' / None）は
+    整数列では -1、浮動小数点列では NaN として保存する。append=True で既存のファイル（同じスキーマ）に追記する。
+    """
+    def __init__(self, path: str, columns: list, chunk_rows: int = DEFAULT_CHUNK_ROWS, append: bool = False):
+        self.path = path
+        self.schema = [_column_spec(name, dtype) for name, dtype in columns]
+        self.chunk_rows = max(1, chunk_rows)
+        self._codes = [{c: i for i, c in enumerate(s['categories'])} if 'categories' in s else None for s in self.schema]
+        self._dtypes = [np.dtype(s['dtype']).newbyteorder('<') for s in self.schema]
+        self._buffer = []
+        self.rows = 0
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            log = ColumnarLog(path)
+            if log.schema != self.schema:
+                raise ValueError(f"Schema of {path} does not match; cannot append")
+            # 中断した書き込みの途中のチャンクは切り捨ててから追記する
+            self._f = open(path, 'r+b')
+            self._f.truncate(log.data_end())
+            self._f.seek(0, io.SEEK_END)
+        else:
+            self._f = open(path, 'wb')
+            header = json.dumps({'columns': self.schema}).encode()
+            self._f.write(MAGIC + _U32.pack(len(header)) + header)
+
+    def add(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.chunk_rows:
+            self.flush()
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def writerow(self, row):
+        """csv.writer と同じ名前の別名（CSV出力と同じコードで書けるようにする）"""
+        self.add(row)
+
+    def writerows(self, rows):
+        self.add_rows(rows)
+
+    def _column(self, k: int, values: list) -> np.ndarray:
+        codes, dt = self._codes[k], self._dtypes[k]
+        if codes is not None:
+            try:
+                return np.fromiter((codes[v] for v in values), dtype=dt, count=len(values))
+            except KeyError as e:
+                raise ValueError(f"Unknown category for column {self.schema[k]['name']}: {e.args[0]!r}") from None
+        if any(v == '' or v is None for v in values):
+            missing = np.nan if dt.kind == 'f' else -1
+            values = [missing if (v == '' or v is None) else v for v in values]
+        return np.asarray(values, dtype=dt)
+
+    def flush(self):
+        """バッファした行を1チャンクとして書き出す"""
+        if not self._buffer:
+            return
+        columns = list(zip(*self._buffer))
+        parts = [_U32.pack(len(self._buffer))]
+        for k in range(len(self.schema)):
+            parts.append(self._column(k, columns[k]).tobytes())
+        self._f.write(b"".join(parts))
+        self._f.flush()
+        self.rows += len(self._buffer)
+        self._buffer = []
+
+    def close(self):
+        if self._f.closed:
+            return
+        self.flush()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ColumnarLog:
+    """ColumnarWriter のファイルを読み、チャンクごとに列の配列を返す（メモリ使用量はチャンク1つ分）"""
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a columnar log: {path}")
+            (n,) = _U32.unpack(f.read(_U32.size))
+            self.schema = json.loads(f.read(n))['columns']
+            self._data_start = f.tell()
+        self.columns = [s['name'] for s in self.schema]
+        self.categories = {s['name']: s['categories'] for s in self.schema if 'categories' in s}
+        self._dtypes = [np.dtype(s['dtype']).newbyteorder('<') for s in self.schema]
+
+    def iter_chunks(self, columns: list = None):
+        """
+        チャンクごとに {列名: 配列} を返す（columns 指定時はその列のみ読み、他の列は読み飛ばす）
+
+        カテゴリ列はコード (uint8) のまま返す（値は categories[列名][コード]）。書き込み途中で終わった末尾のチャンクは読まない。
+        """
+        wanted = set(self.columns if columns is None else columns)
+        missing = wanted - set(self.columns)
+        if missing:
+            raise KeyError(f"Columns not in {self.path}: {sorted(missing)}")
+        size = os.path.getsize(self.path)
+        with open(self.path, 'rb') as f:
+            f.seek(self._data_start)
+            while f.tell() + _U32.size <= size:
+                (rows,) = _U32.unpack(f.read(_U32.size))
+                nbytes = [rows * dt.itemsize for dt in self._dtypes]
+                if f.tell() + sum(nbytes) > size:
+                    print(f"[Warning] Ignoring incomplete last chunk in {self.path}")
+                    return
+                chunk = {}
+                for name, dt, nb in zip(self.columns, self._dtypes, nbytes):
+                    if name in wanted:
+                        chunk[name] = np.frombuffer(f.read(nb), dtype=dt)
+                    else:
+                        f.seek(nb, io.SEEK_CUR)
+                yield chunk
+
+    def data_end(self) -> int:
+        """最後の完全なチャンクの終わりの位置（チャンクの行数だけを読んで求める）"""
+        size = os.path.getsize(self.path)
+        row_bytes = sum(dt.itemsize for dt in self._dtypes)
+        with open(self.path, 'rb') as f:
+            end = self._data_start
+            while end + _U32.size <= size:
+                f.seek(end)
+                (rows,) = _U32.unpack(f.read(_U32.size))
+                if end + _U32.size + rows * row_bytes > size:
+                    break
+                end += _U32.size + rows * row_bytes
+        return end
+
+    def __len__(self):
+        return sum(len(next(iter(c.values()))) if c else 0 for c in self.iter_chunks(self.columns[:1]))
+
+    def to_csv(self, out):
+        """全ての行をCSVとして out（テキストのファイルオブジェクト）に書き出す"""
+        writer = csv.writer(out)
+        writer.writerow(self.columns)
+        for chunk in self.iter_chunks():
+            cols = []
+            for name in self.columns:
+                values = chunk[name]
+                if name in self.categories:
+                    cats = np.array(self.categories[name], dtype=object)
+                    values = cats[values]
+                cols.append(values.tolist())
+            writer.writerows(zip(*cols))
+
+def _infer_columns(csv_path: str) -> list:
+    """CSVを1回読み、各列の型（整数（値の範囲で int32 / int64）/ 浮動小数点 / カテゴリ）を推定する"""
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        kinds = ['i'] * len(header)
+        values = [set() for _ in header]
+        bounds = [[0, 0] for _ in header]
+        for row in reader:
+            for k, v in enumerate(row):
+                if kinds[k] == 'i':
+                    try:
+                        x = int(v)
+                        bounds[k][0] = min(bounds[k][0], x); bounds[k][1] = max(bounds[k][1], x)
+                        continue
+                    except ValueError:
+                        kinds[k] = 'f'
+                if kinds[k] == 'f':
+                    try:
+                        float(v); continue
+                    except ValueError:
+                        kinds[k] = 'c'
+                values[k].add(v)
+    int32 = np.iinfo(np.int32)
+    def column_type(kind, vals, lo, hi):
+        if kind == 'i':
+            return np.int32 if int32.min <= lo and hi <= int32.max else np.int64
+        return np.float64 if kind == 'f' else tuple(sorted(vals))
+    return [(name, column_type(kind, vals, *b)) for name, kind, vals, b in zip(header, kinds, values, bounds)]
+
+def convert_csv(csv_path: str, out_path: str = None, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> str:
+    """CSV（正解データなど）を列指向ログに変換する（列の型はCSVの値から推定し、2回とも行単位で読む）"""
+    out_path = out_path or os.path.splitext(csv_path)[0] + ".col"
+    columns = _infer_columns(csv_path)
+    with open(csv_path, newline='', encoding='utf-8') as f, ColumnarWriter(out_path, columns, chunk_rows) as writer:
+        reader = csv.reader(f)
+        next(reader)
+        writer.add_rows(reader)
+    return out_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert between CSV and columnar logs (.col)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_conv = sub.add_parser("convert", help="Convert CSV files (e.g. <name>_truth.csv) to <name>.col next to them")
+    p_conv.add_argument("files", nargs="+", help="CSV files")
+    p_conv.add_argument("--chunk_rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per chunk")
+    p_csv = sub.add_parser("to_csv", help="Print a columnar log as CSV")
+    p_csv.add_argument("file", help="Columnar log (.col)")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        for path in args.files:
+            if not os.path.exists(path):
+                print(f"[Warning] Not found: {path}"); continue
+            print(f"{path} -> {convert_csv(path, chunk_rows=args.chunk_rows)}")
+    else:
+        ColumnarLog(args.file).to_csv(sys.stdout)
\ No newline at end of file
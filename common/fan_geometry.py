@@ -0,0 +1,107 @@
+import functools
+import numpy as np
+
+class FanGeometry:
+    """
+    フレームサイズと扇形パラメータから決まる幾何情報（マスク・座標ベクトル・外接矩形・境界点）を保持する
+
+    生成は get_fan_geometry() 経由で行い、同じサイズ・パラメータの組み合わせでは同一インスタンスを共有する。
+    保持する配列は複数の解析器・フレームで共有されるため、読み取り専用としている。
+    """
+    def __init__(self, w: int, h: int, center: tuple, r_range: tuple, angles: tuple, open_slope: float = None):
+        self.w, self.h = w, h
+        self.center = (int(center[0]), int(center[1]))
+        cx, cy = center
+        r_min, r_max = r_range
+        aL, aR = angles
+
+        # 座標ベクトル（フレームごとの処理ではこれらをブロードキャストして使う）
+        self.xs = np.arange(w, dtype=np.float32)
+        self.ys = np.arange(h, dtype=np.float32)
+        self.rows = np.arange(h, dtype=np.int32).reshape(h, 1)
+
+        # マスク生成は初回のみ行うため、ここでは全画面グリッドを使って素直に計算する
+        xg, yg = np.meshgrid(self.xs, self.ys)
+        X = xg - cx
+        dist = np.sqrt(X**2 + (yg - cy)**2)
+        mask_ring = (dist >= r_min) & (dist <= r_max)
+        mask_wedge = (yg >= aL * X + cy) & (yg >= aR * X + cy)
+
+        self.inside = mask_ring & mask_wedge
+        self.mask = np.zeros((h, w), dtype=np.uint8)
+        self.mask[self.inside] = 255
+
+        # 扇形の外接矩形 (x0, y0, x1, y1)（x1, y1 は含まない）
+        ys_in, xs_in = np.nonzero(self.inside)
+        if len(xs_in) > 0:
+            self.bbox = (int(xs_in.min()), int(ys_in.min()), int(xs_in.max()) + 1, int(ys_in.max()) + 1)
+        else:
+            self.bbox = (0, 0, 0, 0)
+
+        # 列ごとの扇形の上端・下端（扇形が存在しない列は -1）
+        self.col_count = self.inside.sum(axis=0).astype(np.int32)
+        has_px = self.col_count > 0
+        self.col_top = np.where(has_px, self.inside.argmax(axis=0), -1).astype(np.int32)
+        self.col_bottom = np.where(has_px, h - 1 - self.inside[::-1].argmax(axis=0), -1).astype(np.int32)
+        self.contiguous = bool(np.all(self.col_count[has_px] == self.col_bottom[has_px] - self.col_top[has_px] + 1))
+
+        # 開ループ判定用の領域と境界点（open_boundary_slope が指定された場合のみ）
+        self.open_region_mask = None
+        self.boundary_pt = None
+        if open_slope is not None:
+            mask_open_wedge = (yg >= aL * X + cy) & (yg >= open_slope * X + cy)
+            self.open_region_mask = np.zeros((h, w), dtype=np.uint8)
+            self.open_region_mask[mask_ring & mask_open_wedge] = 255
+            dx = r_max / np.sqrt(1 + open_slope**2)
+            self.boundary_pt = (int(cx + dx), int(cy + open_slope * dx))
+
+        for arr in (self.xs, self.ys, self.rows, self.inside, self.mask, self.col_count,
+                    self.col_top, self.col_bottom, self.open_region_mask):
+            if arr is not None:
+                arr.setflags(write=False)
+
+    def roi(self, pad: int) -> tuple:
+        """
+        外接矩形を上下左右に pad 画素広げ、フレーム内に収めた矩形 (x0, y0, x1, y1)（x1, y1 は含まない）を返す
+
+        扇形の外側が0となる画像にフィルタをかける場合、pad をカーネル半径の合計より大きくとれば、
+        この矩形内だけで処理しても扇形内の結果は全画面で処理した場合と一致する。扇形が空の場合は全画面を返す。
+        """
+        x0, y0, x1, y1 = self.bbox
+        if x1 <= x0 or y1 <= y0:
+            return 0, 0, self.w, self.h
+        return max(0, x0 - pad), max(0, y0 - pad), min(self.w, x1 + pad), min(self.h, y1 + pad)
+
+    def fill_below_curve(self, y_curve: np.ndarray) -> np.ndarray:
+        """扇形内かつ各列で y < y_curve[x] となる画素を 255 とするマスクを生成する"""
+        cond = self.rows < y_curve.reshape(1, -1)
+        np.logical_and(cond, self.inside, out=cond)
+        out = cond.view(np.uint8)
+        np.multiply(out, 255, out=out)
+        return out
+
+    def count_below_curve(self, y_curve: np.ndarray) -> int:
+        """
+        fill_below_curve のマスクの画素数を、マスクを生成せずに求める
+
+        扇形が各列で上下に連続している場合は、列ごとの上端 col_top と画素数 col_count から
+        y < y_curve[x] を満たす画素数 clip(ceil(y_curve[x]) - col_top, 0, col_count) を合計する。
+        """
+        if not self.contiguous:
+            return int(np.count_nonzero(self.fill_below_curve(y_curve)))
+        # NaN は比較が常に偽（0画素）になるため -inf として扱う
+        y = np.nan_to_num(np.asarray(y_curve, dtype=np.float64), nan=-np.inf)
+        n = np.clip(np.ceil(y) - self.col_top, 0, self.col_count)
+        return int(n.sum())
+
+@functools.lru_cache(maxsize=16)
+def _build_fan_geometry(w, h, center, r_range, angles, open_slope):
+    return FanGeometry(w, h, center, r_range, angles, open_slope)
+
+def get_fan_geometry(w: int, h: int, params: dict) -> FanGeometry:
+    """フレームサイズと解析パラメータに対応する FanGeometry をキャッシュから取得する"""
+    return _build_fan_geometry(
+        int(w), int(h),
+        tuple(params['fan_center']), tuple(params['fan_r_range']), tuple(params['fan_angles']),
+        params.get('open_boundary_slope')
+    )
\ No newline at end of file
@@ -0,0 +1,92 @@
+import queue
+import numpy as np
+from multiprocessing import shared_memory
+
+class RingReader:
+    """
+    FrameRing の1つの読み手（解析プロセス）側
+
+    Process の引数として子プロセスに渡し、子プロセス内で iter_frames / release を呼ぶ。
+    返すフレームは共有メモリを直接参照する配列で、release するまで書き換えられない。
+    """
+    def __init__(self, name: str, shape: tuple, slots: int, free, refs, notices):
+        self.name, self.shape, self.slots = name, shape, slots
+        self.frame_bytes = int(np.prod(shape))
+        self.free, self.refs, self.notices = free, refs, notices
+        self.shm = None
+
+    def iter_frames(self, poll: float = 1.0, alive=None):
+        """公開されたフレームを (フレーム番号, スロット, フレーム) として順に返す（alive() が False になったら終了）"""
+        self.shm = shared_memory.SharedMemory(name=self.name)
+        while True:
+            try:
+                item = self.notices.get(timeout=poll)
+            except queue.Empty:
+                if alive is not None and not alive(): return
+                continue
+            if item is None: return
+            index, slot = item
+            yield index, slot, np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.frame_bytes)
+
+    def release(self, slot: int):
+        """スロットの参照を返す（全ての読み手が返したスロットは書き手が再利用する）"""
+        with self.refs.get_lock():
+            self.refs[slot] -= 1
+            if self.refs[slot] == 0:
+                self.free.release()
+
+    def close(self):
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except BufferError:  # フレームへの参照が残っている（プロセス終了時に解放される）
+                pass
+            self.shm = None
+
+class FrameRing:
+    """
+    1つの書き手（デコーダ）が複数の読み手（解析プロセス）にフレームを配る、共有メモリ上のリングバッファ
+
+    フレームは slots 枚分の multiprocessing.shared_memory に1回だけ書き込み、読み手へはフレーム番号とスロット番号だけを
+    キューで通知するため、フレーム本体をプロセス間で pickle・コピーしない。スロットは全ての読み手が release した時点で
+    空きとなり、書き手は空きがない間は待つ（最も遅い読み手より slots 枚以上先には進まない）。
+    読み手はフレーム順に release するため、スロットは書き込んだ順に空き、フレーム i は常にスロット i % slots を使う。
+    """
+    def __init__(self, ctx, shape: tuple, slots: int, readers: int):
+        self.shape = tuple(int(v) for v in shape)
+        self.slots = max(1, slots)
+        self.frame_bytes = int(np.prod(self.shape))
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, self.slots * self.frame_bytes))
+        self.free = ctx.Semaphore(self.slots)
+        self.refs = ctx.Array('i', self.slots)
+        self.readers = [RingReader(self.shm.name, self.shape, self.slots, self.free, self.refs, ctx.Queue())
+                        for _ in range(max(1, readers))]
+
+    def publish(self, index: int, frame: np.ndarray, poll: float = 1.0, alive=None) -> bool:
+        """
+        フレームを空きスロットに書き込み、全ての読み手に通知する
+
+        空きスロットを待つ間に alive() が False になった場合は書き込まずに False を返す。
+        """
+        if frame.shape != self.shape or frame.dtype != np.uint8:
+            raise ValueError(f"Frame {index} has shape {frame.shape} ({frame.dtype}); expected {self.shape} (uint8)")
+        while not self.free.acquire(timeout=poll):
+            if alive is not None and not alive():
+                return False
+        slot = index % self.slots
+        np.copyto(np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.frame_bytes), frame)
+        with self.refs.get_lock():
+            self.refs[slot] = len(self.readers)
+        for reader in self.readers:
+            reader.notices.put((index, slot))
+        return True
+
+    def finish(self):
+        """全ての読み手にフレームの終端を通知する"""
+        for reader in self.readers:
+            reader.notices.put(None)
+
+    def close(self):
+        """共有メモリを解放する（全ての読み手が終了した後に呼ぶ）"""
+        self.shm.close()
+        self.shm.unlink()
\ No newline at end of file
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import cv2
+import numpy as np
+from video_io import iter_frames, iter_frames_at, get_video_info
+
+# 画像ディレクトリとして読み込む拡張子（chordae_evaluation.py の評価対象と同じ）
+IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".bmp"}
+COLORS = ('bgr', 'gray')
+DATA_FILE = "frames.u8"
+INDEX_FILE = "index.npz"
+
+def list_images(dir_path: str) -> list:
+    """ディレクトリ内の画像ファイル名を os.listdir の順に返す"""
+    return [f for f in os.listdir(dir_path) if os.path.splitext(f.lower())[1] in IMAGE_EXTS]
+
+def source_key(source: str) -> str:
+    """
+    入力（動画ファイルまたは画像ディレクトリ）を識別するハッシュ
+
+    動画はファイルの実パス・サイズ・更新時刻、画像ディレクトリは画像ファイルの名前・サイズ・更新時刻から求める。
+    入力が変わるとキーも変わるため、古いフレームストアを誤って読むことはない。
+    ファイル内容は読まないため、並列ワーカー（spawn で起動したプロセスを含む）がそれぞれ求めても動画全体を読み直さない。
+    """
+    h = hashlib.sha256()
+    if os.path.isdir(source):
+        for name in sorted(list_images(source)):
+            st = os.stat(os.path.join(source, name))
+            h.update(f"{name}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    else:
+        st = os.stat(source)
+        h.update(f"{os.path.realpath(source)}\0{st.st_size}\0{st.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+def store_path(root: str, source: str, color: str = 'bgr') -> str:
+    """入力に対応するフレームストアのディレクトリ (<root>/<入力名>-<キー>-<色>)"""
+    base = os.path.basename(os.path.normpath(source))
+    return os.path.join(root, f"{base}-{source_key(source)[:16]}-{color}")
+
+def _iter_video(video_path: str):
+    cap = cv2.VideoCapture(video_path)
+    try:
+        while cap.isOpened():
+            ret, frame = cap.read()
+            if not ret: break
+            yield "", frame, cap.get(cv2.CAP_PROP_POS_MSEC), ""
+    finally:
+        cap.release()
+
+def _iter_images(dir_path: str):
+    # ファイルは1回だけ読み、同じバイト列からハッシュとデコード画像を得る（読めない画像は含めない）
+    for name in list_images(dir_path):
+        with open(os.path.join(dir_path, name), 'rb') as f:
+            data = f.read()
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is not None:
+            yield name, img, np.nan, hashlib.sha256(data).hexdigest()
+
+def build_store(source: str, root: str, color: str = 'bgr') -> str:
+    """
+    動画または画像ディレクトリを1回だけデコードし、フレームストアを作成してそのディレクトリを返す（作成済みの場合はそのまま返す）
+
+    フレームは uint8 の生データとして1つのファイル (frames.u8) に連結し、index.npz にフレームごとの位置・サイズ・
+    タイムスタンプ [ms]（動画のみ）・画像名と画像ファイルのハッシュ（画像ディレクトリのみ）を保存する。
+    作成中は一時ディレクトリに書き込み、完成後に名前を変えるため、途中で中断されたストアが読まれることはない。
+    """
+    path = store_path(root, source, color)
+    if os.path.exists(os.path.join(path, INDEX_FILE)):
+        return path
+    is_dir = os.path.isdir(source)
+    tmp = f"{path}.tmp{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    offsets, shapes, stamps, names, hashes = [0], [], [], [], []
+    with open(os.path.join(tmp, DATA_FILE), 'wb') as f:
+        for name, frame, stamp, digest in (_iter_images(source) if is_dir else _iter_video(source)):
+            if color == 'gray' and frame.ndim == 3:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            frame = np.ascontiguousarray(frame)
+            f.write(frame.data)
+            offsets.append(offsets[-1] + frame.nbytes)
+            shapes.append(frame.shape if frame.ndim == 3 else frame.shape + (1,))
+            stamps.append(stamp); names.append(name); hashes.append(digest)
+    info = None if is_dir else get_video_info(source)
+    meta = {'source': os.path.abspath(source), 'kind': 'images' if is_dir else 'video', 'color': color,
+            'source_hash': source_key(source), 'fps': info[3] if info else None}
+    np.savez(os.path.join(tmp, INDEX_FILE), offsets=np.array(offsets, dtype=np.int64),
+             shapes=np.array(shapes, dtype=np.int32).reshape(-1, 3), timestamps=np.array(stamps, dtype=np.float64),
+             names=np.array(names, dtype=str), hashes=np.array(hashes, dtype=str), meta=np.array(json.dumps(meta)))
+    try:
+        os.rename(tmp, path)
+    except OSError:  # 他のプロセスが先に同じストアを作成した
+        shutil.rmtree(tmp, ignore_errors=True)
+    return path
+
+class FrameStore:
+    """
+    build_store で作成したフレームストアをメモリマップで開き、フレームをコピーせずに読み出す
+
+    返すフレームはファイルを直接参照する読み取り専用の配列（BGR は (H, W, 3)、グレースケールは (H, W)）。
+    同じストアを読む複数のプロセス・再実行はOSのページキャッシュを共有し、デコードを行わない。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with np.load(os.path.join(path, INDEX_FILE)) as index:
+            self.offsets = index['offsets']
+            self.shapes = index['shapes']
+            self.timestamps = index['timestamps']
+            self.names = [str(n) for n in index['names']]
+            self.hashes = [str(h) for h in index['hashes']]
+            self.meta = json.loads(str(index['meta']))
+        if self.offsets[-1] > 0:
+            self._data = np.memmap(os.path.join(path, DATA_FILE), dtype=np.uint8, mode='r').view(np.ndarray)
+        else:
+            self._data = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def frame(self, i: int) -> np.ndarray:
+        h, w, c = (int(v) for v in self.shapes[i])
+        return self._data[self.offsets[i]:self.offsets[i + 1]].reshape((h, w) if c == 1 else (h, w, c))
+
+    def iter_frames(self, start: int = 0, stop: int = None):
+        """[start, stop) 範囲のフレームを (フレーム番号, フレーム) として順に返す（video_io.iter_frames と同じ形式）"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for i in range(max(0, start), stop):
+            yield i, self.frame(i)
+
+    @property
+    def array(self) -> np.ndarray:
+        """全フレームが同じサイズの場合に (N, H, W[, 3]) の配列として返す（サイズが異なる場合は None）"""
+        if len(self) == 0 or not (self.shapes == self.shapes[0]).all():
+            return None
+        h, w, c = (int(v) for v in self.shapes[0])
+        return self._data[:self.offsets[-1]].reshape((len(self), h, w) if c == 1 else (len(self), h, w, c))
+
+def open_store(root: str, source: str, color: str = 'bgr') -> FrameStore:
+    """入力のフレームストアを開く（まだない場合は作成する）"""
+    return FrameStore(build_store(source, root, color))
+
+def iter_source_frames(video_path: str, start: int = 0, stop: int = None, store_root: str = None, color: str = 'bgr'):
+    """store_root を指定した場合はフレームストアから、指定しない場合は動画を直接デコードして [start, stop) のフレームを返す"""
+    if store_root:
+        yield from open_store(store_root, video_path, color).iter_frames(start, stop)
+    else:
+        yield from iter_frames(video_path, start, stop)
+
+def iter_source_frames_at(video_path: str, indices, store_root: str = None, color: str = 'bgr'):
+    """昇順のフレーム番号 indices のフレームだけを、フレームストア（store_root 指定時）または動画から (フレーム番号, フレーム) として返す"""
+    if store_root:
+        store = open_store(store_root, video_path, color)
+        for i in indices:
+            if i < len(store):
+                yield i, store.frame(i)
+    else:
+        yield from iter_frames_at(video_path, indices)
+
+def source_frame_count(video_path: str, store_root: str = None, color: str = 'bgr') -> int:
+    """入力のフレーム数（フレームストアがあれば実際のフレーム数、なければ動画のヘッダの値。開けない場合は 0）"""
+    if store_root:
+        return len(open_store(store_root, video_path, color))
+    info = get_video_info(video_path)
+    return info[0] if info else 0
+
+def add_store_args(parser, color: bool = True):
+    """フレームストア関連のコマンドライン引数を追加する（color=False はBGRのみ対応するスクリプト用）"""
+    parser.add_argument("--frame_store", type=str, default=None,
+                        help="Decode each input once into a memory-mapped frame store under this directory and read frames from it (built on first use)")
+    if color:
+        parser.add_argument("--store_color", choices=COLORS, default="bgr",
+                            help="Channels kept in the frame store (gray is a third of the size; analysis results are identical)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode videos or image directories once into memory-mapped frame stores")
+    parser.add_argument("sources", nargs="+", help="Video files or image directories")
+    parser.add_argument("--root", type=str, required=True, help="Frame store directory")
+    parser.add_argument("--color", choices=COLORS, default="bgr", help="Channels to keep")
+    args = parser.parse_args()
+
+    for source in args.sources:
+        if not os.path.exists(source):
+            print(f"[Warning] Not found: {source}"); continue
+        t0 = time.perf_counter()
+        store = open_store(args.root, source, args.color)
+        print(f"{source}: {len(store)} frames, {store.offsets[-1] / (1 << 20):.1f} MB -> {store.path} ({time.perf_counter() - t0:.1f} s)")
\ No newline at end of file
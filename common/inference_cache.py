@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+_FILE_HASHES = {}
+
+def file_hash(path: str) -> str:
+    """ファイル内容のSHA-256を返す（パス・サイズ・更新時刻が同じ間は再計算しない）"""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if memo_key not in _FILE_HASHES:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        _FILE_HASHES[memo_key] = h.hexdigest()
+    return _FILE_HASHES[memo_key]
+
+class InferenceCache:
+    """
+    フレーム内容のハッシュとモデルファイルのハッシュをキーとして推論結果を保存する永続キャッシュ
+
+    値は呼び出し側で圧縮したバイト列として SQLite に保存する。合計サイズが max_bytes を超えると、
+    最終アクセスが古いものから削除する (LRU)。ヒット・ミス・削除の回数は stats() で取得できる。
+    複数プロセスから同じディレクトリを共有して利用できる。
+    """
+    def __init__(self, cache_dir: str, model_path: str, namespace: str, max_bytes: int = 1 << 30):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.model_hash = file_hash(model_path)
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "inference_cache.sqlite3"), timeout=60, check_same_thread=False)
+        # 合計サイズは1行の表 (stats) に保持し、entries の追加・サイズ変更・削除のたびにトリガーで同じトランザクション内で更新する
+        # （複数プロセスで共有しても一致し、保存のたびに全件を集計しない）。既存のキャッシュでは初回のみ集計する
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, size INTEGER, atime REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL)")
+            self._conn.execute("INSERT OR IGNORE INTO stats (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM entries")
+            self._conn.execute("CREATE TRIGGER IF NOT EXISTS entries_ins AFTER INSERT ON entries "
+                               "BEGIN UPDATE stats SET total = total + NEW.size WHERE id = 0; END")
+            self._conn.execute("CREATE TRIGGER IF NOT EXISTS entries_upd AFTER UPDATE OF size ON entries "
+                               "BEGIN UPDATE stats SET total = total + NEW.size - OLD.size WHERE id = 0; END")
+            self._conn.execute("CREATE TRIGGER IF NOT EXISTS entries_del AFTER DELETE ON entries "
+                               "BEGIN UPDATE stats SET total = total - OLD.size WHERE id = 0; END")
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            raise
+
+    def key(self, frame: np.ndarray) -> str:
+        """モデル・用途・フレームの形状と画素値から決まるキーを返す"""
+        frame = np.ascontiguousarray(frame)
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{self.model_hash}:{self.namespace}:{frame.shape}:{frame.dtype.str}:".encode())
+        h.update(memoryview(frame).cast('B'))
+        return h.hexdigest()
+
+    def get(self, frame: np.ndarray):
+        """キャッシュされた値（バイト列）を返す。存在しない場合は None"""
+        return self.get_many([frame])[0]
+
+    def get_many(self, frames: list) -> list:
+        """複数フレーム分の値をまとめて取得する（存在しないものは None）"""
+        keys = [self.key(f) for f in frames]
+        with self._lock:
+            found = {}
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany("UPDATE entries SET atime=? WHERE key=?", [(now, k) for k in found])
+            values = [found.get(k) for k in keys]
+            n_hit = sum(v is not None for v in values)
+            self.hits += n_hit
+            self.misses += len(values) - n_hit
+        return values
+
+    def put(self, frame: np.ndarray, value: bytes):
+        """値を保存する"""
+        self.put_many([frame], [value])
+
+    def put_many(self, frames: list, values: list):
+        """複数フレーム分の値をまとめて保存し、上限を超えた場合は古いものから削除する"""
+        now = time.time()
+        rows = [(self.key(f), sqlite3.Binary(v), len(v), now) for f, v in zip(frames, values)]
+        with self._lock, self._conn:
+            # INSERT OR REPLACE は置き換え時に削除トリガーが動かないため、UPSERT でサイズの差分をトリガーに渡す
+            self._conn.executemany("INSERT INTO entries (key, value, size, atime) VALUES (?, ?, ?, ?) "
+                                   "ON CONFLICT(key) DO UPDATE SET value=excluded.value, size=excluded.size, atime=excluded.atime", rows)
+            self._evict()
+
+    def total_bytes(self) -> int:
+        """保存している値の合計サイズ"""
+        return self._conn.execute("SELECT total FROM stats WHERE id = 0").fetchone()[0]
+
+    def _evict(self):
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+        excess, victims = total - self.max_bytes, []
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY atime"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0: break
+        self._conn.executemany("DELETE FROM entries WHERE key=?", victims)
+        self.evictions += len(victims)
+
+    def get_meta(self, name: str):
+        """モデル・用途ごとの付随情報（クラス名など）を取得する"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key=?", (f"{self.model_hash}:{self.namespace}:{name}",)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_meta(self, name: str, value):
+        """モデル・用途ごとの付随情報を保存する"""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                               (f"{self.model_hash}:{self.namespace}:{name}", json.dumps(value)))
+
+    def stats(self) -> dict:
+        """ヒット・ミス・削除の回数とヒット率を返す"""
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0}
+
+    def close(self):
+        self._conn.close()
+
+def add_cache_args(parser):
+    """推論キャッシュ関連のコマンドライン引数を追加する"""
+    parser.add_argument("--cache_dir", type=str, default=None, help="Directory of the on-disk inference cache (disabled if omitted)")
+    parser.add_argument("--cache_size_mb", type=int, default=1024, help="Max inference cache size in MB (LRU eviction)")
\ No newline at end of file
@@ -0,0 +1,22 @@
+import numpy as np
+
+def rle_encode(mask: np.ndarray) -> np.ndarray:
+    """
+    バイナリマスク (0 or 255) を行優先のランレングス（0 の連続長と 255 の連続長を交互に並べた uint32 配列）に圧縮する
+
+    先頭は常に 0 の連続長（マスクが 255 で始まる場合は 0）とする。
+    """
+    flat = mask.reshape(-1) > 0
+    if flat.size == 0:
+        return np.zeros(0, dtype=np.uint32)
+    edges = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    runs = np.diff(np.concatenate(([0], edges, [flat.size])))
+    if flat[0]:
+        runs = np.concatenate(([0], runs))
+    return runs.astype(np.uint32)
+
+def rle_decode(runs: np.ndarray, shape: tuple) -> np.ndarray:
+    """rle_encode で圧縮したランレングスを shape のバイナリマスク (0 or 255, uint8) に戻す"""
+    values = np.zeros(len(runs), dtype=np.uint8)
+    values[1::2] = 255
+    return np.repeat(values, runs.astype(np.int64)).reshape(shape)
\ No newline at end of file
@@ -0,0 +1,109 @@
+import os
+import stat
+import tempfile
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+# --model_server を省略した場合に使う環境変数
+SERVER_ENV = 'ECHO_MODEL_SERVER'
+# 接続の認証鍵（未設定の場合はサーバーがソケットと同じディレクトリに作成する鍵ファイル <ソケット>.key を使う）
+KEY_ENV = 'ECHO_MODEL_SERVER_KEY'
+SOCKET_NAME = 'echo_model_server.sock'
+
+def default_socket_path() -> str:
+    """
+    既定のソケットのパス（$XDG_RUNTIME_DIR、未設定の場合は一時ディレクトリ内のユーザーごとの 0700 のディレクトリ）
+
+    ユーザーごとのディレクトリが他のユーザーの所有、または他のユーザーが書き込める場合は、なりすましを避けるため使わない。
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, SOCKET_NAME)
+    user_dir = os.path.join(tempfile.gettempdir(), f"echo_model_server-{os.getuid()}")
+    os.makedirs(user_dir, mode=0o700, exist_ok=True)
+    st = os.lstat(user_dir)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError(f"{user_dir} must be a directory owned by the current user with mode 0700")
+    return os.path.join(user_dir, SOCKET_NAME)
+
+def key_path(address: str) -> str:
+    return address + '.key'
+
+def load_authkey(address: str) -> bytes:
+    """
+    address のサーバーへの接続の認証鍵（環境変数 ECHO_MODEL_SERVER_KEY、なければ鍵ファイル）
+
+    鍵ファイルは現在のユーザーの所有で、他のユーザーが読み書きできないもののみ使う。
+    """
+    if os.environ.get(KEY_ENV):
+        return os.environ[KEY_ENV].encode()
+    path = key_path(address)
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        if st.st_uid != os.getuid() or st.st_mode & 0o077:
+            raise PermissionError(f"{path} must be owned by the current user with mode 0600")
+        return f.read()
+
+def model_identity(model_path: str) -> list:
+    """モデルファイルの同一性判定に使う値（実パス・サイズ・更新時刻）。サーバーとクライアントで比較する"""
+    st = os.stat(model_path)
+    return [os.path.realpath(model_path), st.st_size, st.st_mtime_ns]
+
+class ModelClient:
+    """
+    モデルサーバー (pipeline/model_server.py) への接続
+
+    要求は (操作名, 引数の辞書) を送って (状態, 値) を受け取る。1つの接続では要求を1つずつ順に処理する。
+    応答は pickle で受け取るため、接続時に認証鍵 (load_authkey) でサーバーを相互に認証する。
+    """
+    def __init__(self, address: str):
+        self.address = address
+        self._conn = Client(address, family='AF_UNIX', authkey=load_authkey(address))
+        self._lock = threading.Lock()
+        self.models = self.call('models')
+
+    def call(self, op: str, **kwargs):
+        with self._lock:
+            self._conn.send((op, kwargs))
+            status, value = self._conn.recv()
+        if status != 'ok':
+            raise RuntimeError(f"Model server error ({op}): {value}")
+        return value
+
+    def serves(self, kind: str, model_path: str) -> bool:
+        """サーバーが model_path と同じファイルを kind ('lv' / 'mv') のモデルとして読み込んでいるか"""
+        ident = self.models.get(kind)
+        return ident is not None and os.path.exists(model_path) and list(ident) == model_identity(model_path)
+
+    def close(self):
+        self._conn.close()
+
+def connect_model_server(address: str, kind: str, model_path: str):
+    """
+    address のモデルサーバーが model_path のモデルを kind として読み込み済みなら接続を返す
+
+    アドレス未指定・接続できない・認証に失敗した・別のモデルを読み込んでいる場合は None を返し、
+    呼び出し側はプロセス内でモデルをロードする。address が 'auto' の場合は default_socket_path を使う。
+    """
+    if not address:
+        return None
+    try:
+        if address == 'auto':
+            address = default_socket_path()
+        client = ModelClient(address)
+    except (OSError, EOFError, AuthenticationError) as e:
+        print(f"[Info] Model server not available at {address} ({e}); loading the model in-process")
+        return None
+    if not client.serves(kind, model_path):
+        print(f"[Info] Model server at {address} does not serve {model_path}; loading the model in-process")
+        client.close()
+        return None
+    print(f"Using model server: {address} ({kind})")
+    return client
+
+def add_server_args(parser):
+    """モデルサーバーのソケットを指定する --model_server オプションを追加する"""
+    parser.add_argument("--model_server", type=str, default=os.environ.get(SERVER_ENV),
+                        help=f"Unix socket of a running model server (pipeline/model_server.py), or 'auto' for its default socket; "
+                             f"falls back to in-process loading (default: ${SERVER_ENV})")
\ No newline at end of file
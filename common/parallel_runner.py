@@ -0,0 +1,23 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from video_io import plan_shards
+
+def make_shard_tasks(video_files: list, shard_frames: int = 0) -> list:
+    """動画リストを (動画パス, 開始フレーム, 終了フレーム) のタスク列に展開する（動画順・フレーム順）"""
+    tasks = []
+    for video_path in video_files:
+        for start, stop in plan_shards(video_path, shard_frames):
+            tasks.append((video_path, start, stop))
+    return tasks
+
+def run_in_order(worker_fn, tasks: list, workers: int, initializer=None, initargs=()):
+    """
+    タスクをプロセスプールで並列実行し、結果をタスクの順序どおりに返すイテレータ
+
+    OpenCVやKerasがスレッドを保持した状態での fork を避けるため、spawn で子プロセスを起動する。
+    そのため worker_fn / initializer はモジュールのトップレベルに定義されている必要がある。
+    """
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=initializer, initargs=initargs) as pool:
+        yield from pool.map(worker_fn, tasks)
\ No newline at end of file
@@ -0,0 +1,173 @@
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+_NULL_CONTEXT = nullcontext()
+
+class Profiler:
+    """
+    処理段ごとの所要時間と、フレームごとの値（輪郭数など）・カウンタを集計する
+
+    値は2のべき乗の区間（時間はマイクロ秒単位）のヒストグラムとして集計するため、記録の負荷とメモリが小さく、
+    ワーカープロセスの結果も state() / merge() で合算できる。enabled=False の場合は何も記録しない。
+    フレームごとの値をCSVの追加列として出力する場合は、collect() の with 文の間に記録した値を辞書として受け取る。
+    """
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stages, self.values, self.counters = {}, {}, {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def collect(self):
+        """
+        with 文の間にこのスレッドで記録した所要時間（秒）と値を、名前をキーとする辞書に集める
+
+        辞書は with 文ごとに新しく作るため、他のスレッドのフレームや前のフレームの値が混ざることはない
+        （with 文の間に記録しなかった段はキーを持たない）。集計 (summary) への記録は通常どおり行う。
+        """
+        record = {}
+        if not self.enabled:
+            yield record
+            return
+        outer = getattr(self._local, 'record', None)
+        self._local.record = record
+        try:
+            yield record
+        finally:
+            self._local.record = outer
+
+    def _collect(self, name: str, value):
+        record = getattr(self._local, 'record', None)
+        if record is not None:
+            record[name] = value
+
+    def stage(self, name: str):
+        """with 文で囲んだ処理の所要時間を name の段として記録する"""
+        return self._timed(name) if self.enabled else _NULL_CONTEXT
+
+    @contextmanager
+    def _timed(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+
+    def run(self, name: str, fn, *args, **kwargs):
+        """fn を実行し、その所要時間を name の段として記録して結果を返す"""
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+
+    def iter(self, name: str, iterable):
+        """イテレータの各要素の取得にかかった時間を name の段として記録しながら要素を返す"""
+        if not self.enabled:
+            yield from iterable
+            return
+        it = iter(iterable)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            self.add_time(name, time.perf_counter() - t0)
+            yield item
+
+    def add_time(self, name: str, seconds: float):
+        """所要時間（秒）を記録する"""
+        if not self.enabled: return
+        self._collect(name, seconds)
+        self._add(self.stages, name, seconds, int(seconds * 1e6))
+
+    def observe(self, name: str, value):
+        """フレームごとの値（非負）を記録する"""
+        if not self.enabled: return
+        self._collect(name, value)
+        self._add(self.values, name, value, int(value))
+
+    def count(self, name: str, n: int = 1):
+        """カウンタを加算する"""
+        if not self.enabled: return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def _add(self, table: dict, name: str, value, key: int):
+        bucket = max(0, key).bit_length()
+        with self._lock:
+            s = table.get(name)
+            if s is None:
+                s = table[name] = [0, 0.0, value, {}]
+            s[0] += 1; s[1] += value; s[2] = max(s[2], value)
+            s[3][bucket] = s[3].get(bucket, 0) + 1
+
+    def state(self) -> dict:
+        """プロセス間で受け渡せる集計状態を返す"""
+        with self._lock:
+            return {'stages': {k: [v[0], v[1], v[2], dict(v[3])] for k, v in self.stages.items()},
+                    'values': {k: [v[0], v[1], v[2], dict(v[3])] for k, v in self.values.items()},
+                    'counters': dict(self.counters)}
+
+    def merge(self, state: dict):
+        """他のプロファイラ（ワーカープロセス等）の集計状態を合算する"""
+        if not self.enabled or not state: return
+        with self._lock:
+            for key in ('stages', 'values'):
+                table = getattr(self, key)
+                for name, (n, total, vmax, hist) in state[key].items():
+                    s = table.setdefault(name, [0, 0.0, vmax, {}])
+                    s[0] += n; s[1] += total; s[2] = max(s[2], vmax)
+                    for b, c in hist.items():
+                        s[3][b] = s[3].get(b, 0) + c
+            for name, n in state['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self.stages, self.values, self.counters = {}, {}, {}
+
+    def summary(self) -> dict:
+        """段ごとの回数・合計・平均・最大とヒストグラム、値の統計、カウンタをまとめた辞書を返す"""
+        def hist(h, unit):
+            return {f"<{1 << b}{unit}": h[b] for b in sorted(h)}
+        with self._lock:
+            stages = {name: {'calls': n, 'total_s': total, 'mean_ms': 1000.0 * total / n, 'max_ms': 1000.0 * vmax,
+                             'histogram': hist(h, 'us')}
+                      for name, (n, total, vmax, h) in self.stages.items()}
+            values = {name: {'count': n, 'mean': total / n, 'max': vmax, 'histogram': hist(h, '')}
+                      for name, (n, total, vmax, h) in self.values.items()}
+            return {'stages': stages, 'values': values, 'counters': dict(self.counters)}
+
+    def save(self, path: str, **meta):
+        """集計結果をJSONに保存する（meta は付随情報として追加される）"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(dict(meta, **self.summary()), f, indent=2, ensure_ascii=False)
+
+    def print_summary(self):
+        """集計結果を合計時間の大きい順に表示する"""
+        summary = self.summary()
+        total = sum(s['total_s'] for s in summary['stages'].values()) or 1.0
+        print("\n--- Profile ---")
+        for name, s in sorted(summary['stages'].items(), key=lambda kv: -kv[1]['total_s']):
+            print(f"  {name:>16}: {s['total_s']:8.3f} s ({100.0 * s['total_s'] / total:5.1f}%)  "
+                  f"{s['mean_ms']:8.3f} ms x {s['calls']}  (max {s['max_ms']:.3f} ms)")
+        for name, v in summary['values'].items():
+            print(f"  {name:>16}: mean {v['mean']:.1f}, max {v['max']} (n={v['count']})")
+        for name, n in summary['counters'].items():
+            print(f"  {name:>16}: {n}")
+
+NULL_PROFILER = Profiler(enabled=False)
+
+def add_profile_args(parser, csv_columns: bool = False):
+    """プロファイル関連のコマンドライン引数を追加する"""
+    parser.add_argument("--profile", nargs="?", const="profile.json", default=None,
+                        help="Record per-stage timings and counters and save them as JSON (default path: profile.json)")
+    if csv_columns:
+        parser.add_argument("--profile_columns", action="store_true",
+                            help="With --profile, also append per-frame stage timings to the output CSV")
\ No newline at end of file
@@ -0,0 +1,145 @@
+import csv
+import math
+import random
+from statistics import NormalDist
+
+def sampling_levels(total: int, initial_frames: int = 32, seed: int = 0) -> list:
+    """
+    動画全体を粗い間隔から細かい間隔へ順に覆うフレーム番号のリスト（段ごと、昇順）を返す
+
+    最初の段は動画を長さ s（2のべき乗）の区間に分けて各区間から1フレーム（約 initial_frames 枚）、以降の段は各区間を
+    半分に分け、まだフレームを選んでいない側の半分から1フレームを加える。区間内の位置は乱数 (seed) で選ぶ層化抽出のため、
+    心周期のような周期的な変化と抽出間隔が重なっても割合の推定が偏らない。全ての段を合わせると全フレームを1回ずつ含む。
+    """
+    if total <= 0:
+        return []
+    rng = random.Random(seed)
+    stride = 1 << max(0, math.ceil(math.log2(max(1.0, total / max(1, initial_frames)))))
+    # 区間 (先頭, 長さ, 選んだフレーム)
+    blocks = []
+    for start in range(0, total, stride):
+        size = min(stride, total - start)
+        blocks.append((start, size, start + rng.randrange(size)))
+    levels = [[b[2] for b in blocks]]
+    while stride > 1:
+        stride //= 2
+        next_blocks, picked = [], []
+        for start, size, chosen in blocks:
+            for sub_start, sub_size in ((start, min(stride, size)), (start + stride, size - stride)):
+                if sub_size <= 0: continue
+                if sub_start <= chosen < sub_start + sub_size:
+                    next_blocks.append((sub_start, sub_size, chosen))
+                else:
+                    point = sub_start + rng.randrange(sub_size)
+                    next_blocks.append((sub_start, sub_size, point))
+                    picked.append(point)
+        blocks = next_blocks
+        levels.append(sorted(picked))
+    return levels
+
+class SequentialVerdict:
+    """
+    フレームごとの二値判定を順に加え、動画全体で「該当するフレームの割合 > threshold」かを逐次的に判定する
+
+    該当割合の信頼区間（有限母集団修正付きの Wilson スコア区間）が threshold の片側に収まった時点で判定を確定する。
+    min_frames 枚未満では確定しない。全フレームを判定した場合は区間の幅が0になり、全フレームでの割合と同じ判定になる。
+    sampling_levels の層化抽出では単純無作為抽出の区間で近似する（層化により実際のばらつきはこれ以下になる）。
+    """
+    def __init__(self, total: int, threshold: float = 0.5, confidence: float = 0.95, min_frames: int = 30):
+        self.total = max(1, total)
+        self.threshold = threshold
+        self.confidence = confidence
+        self.min_frames = min_frames
+        self.z = NormalDist().inv_cdf(1.0 - (1.0 - confidence) / 2.0)
+        self.n = 0
+        self.positives = 0
+
+    def add(self, positive: bool):
+        self.n += 1
+        self.positives += bool(positive)
+
+    @property
+    def proportion(self) -> float:
+        return self.positives / self.n if self.n else 0.0
+
+    def interval(self) -> tuple:
+        """該当割合の信頼区間 (下限, 上限)"""
+        if self.n == 0:
+            return 0.0, 1.0
+        n, p = self.n, self.proportion
+        fpc = max(0.0, (self.total - n) / (self.total - 1)) if self.total > 1 else 0.0
+        z2 = self.z * self.z * fpc
+        center = (p + z2 / (2 * n)) / (1 + z2 / n)
+        half = math.sqrt(z2) / (1 + z2 / n) * math.sqrt(p * (1 - p) / n + z2 / (4 * n * n))
+        return max(0.0, center - half), min(1.0, center + half)
+
+    def decision(self, final: bool = False):
+        """
+        確定した判定（True: 該当割合 > threshold）を返す（未確定の場合は None）
+
+        final=True（全ての段を判定した後）の場合は、区間によらず判定したフレームの割合で確定する。
+        """
+        if self.n == 0:
+            return None
+        if final:
+            return self.proportion > self.threshold
+        if self.n < min(self.min_frames, self.total):
+            return None
+        lo, hi = self.interval()
+        if lo > self.threshold:
+            return True
+        if hi <= self.threshold:
+            return False
+        return None
+
+def run_sequential(verdict: SequentialVerdict, levels: list, judge_level) -> tuple:
+    """
+    段ごとに judge_level(フレーム番号のリスト) でフレームを判定し、判定が確定した段で打ち切る
+
+    judge_level は判定できたフレームごとの二値判定のリストを返す。
+    Returns:
+        (判定 (True / False), 判定した段の数)
+    """
+    for k, indices in enumerate(levels):
+        for positive in judge_level(indices):
+            verdict.add(positive)
+        decided = verdict.decision(final=(k == len(levels) - 1))
+        if decided is not None:
+            return decided, k + 1
+    return verdict.decision(final=True), len(levels)
+
+VERDICT_COLUMNS = ["Video", "Verdict", "Fraction", "CI_Low", "CI_High", "Frames_Analyzed", "Frames_Total", "Levels"]
+
+def verdict_row(video_path: str, label: str, verdict: SequentialVerdict, levels: int) -> list:
+    """判定結果を VERDICT_COLUMNS の1行にする"""
+    lo, hi = verdict.interval()
+    return [video_path, label, f"{verdict.proportion:.4f}", f"{lo:.4f}", f"{hi:.4f}", verdict.n, verdict.total, levels]
+
+def write_verdicts(results, out_csv: str, prof=None, fraction_name: str = "positive"):
+    """
+    (verdict_row の行, プロファイルの集計状態) の列を out_csv に1動画1行で書き出す
+
+    動画ごとの判定と、判定したフレーム数 / 総フレーム数を動画ごと・全体で表示する。
+    """
+    analyzed = total = 0
+    with open(out_csv, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(VERDICT_COLUMNS)
+        for row, prof_state in results:
+            if prof is not None:
+                prof.merge(prof_state)
+            writer.writerow(row)
+            video_path, label, fraction, lo, hi, n, n_total, _ = row
+            analyzed += n; total += n_total
+            print(f"{video_path}: {label} ({fraction_name} {fraction}, CI {lo}-{hi}) from {n}/{n_total} frames")
+    if total:
+        print(f"Analyzed {analyzed}/{total} frames ({100.0 * analyzed / total:.1f}%). Saved verdicts to {out_csv}")
+
+def add_verdict_args(parser, threshold_help: str):
+    """動画単位の逐次判定モード関連のコマンドライン引数を追加する"""
+    parser.add_argument("--verdict", action="store_true",
+                        help="Only decide a video-level verdict: analyze frames coarse-to-fine and stop once it is confident")
+    parser.add_argument("--verdict_threshold", type=float, default=0.5, help=threshold_help)
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence required before stopping early (with --verdict)")
+    parser.add_argument("--initial_frames", type=int, default=32, help="Frames analyzed in the first pass, one from each equal-length segment of the video (with --verdict)")
+    parser.add_argument("--min_frames", type=int, default=30, help="Never stop before this many frames are analyzed (with --verdict)")
\ No newline at end of file
@@ -0,0 +1,67 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_END = object()
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """停止要求を監視しながらキューに投入する（停止された場合は False）"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def run_stages(read_frame, process, write, workers: int = 2, queue_depth: int = 8):
+    """
+    デコード → 解析 → エンコードの3段をスレッドで重ね合わせて実行する
+
+    Args:
+        read_frame: 次のフレームを返す関数（終端では None を返す）
+        process: 1フレーム分の解析を行う関数（ワーカープールで並列に呼ばれる）
+        write: 解析結果を出力する関数（入力フレームの順序どおりに1スレッドから呼ばれる）
+        workers: 解析ワーカー数
+        queue_depth: 解析待ち・出力待ちとして保持するフレーム数の上限
+
+    OpenCVの関数は実行中にGILを解放するため、デコード・解析・エンコードを別スレッドで重ねることで高速化できる。
+    出力順は入力順と一致するため、結果はシリアル実行と同一になる。
+    """
+    pending = queue.Queue(maxsize=max(1, queue_depth))
+    stop = threading.Event()
+    errors = []
+
+    def decode_loop(pool):
+        try:
+            while not stop.is_set():
+                frame = read_frame()
+                if frame is None: break
+                if not _put(pending, pool.submit(process, frame), stop): return
+        except BaseException as e:
+            errors.append(e); stop.set()
+        _put(pending, _END, stop)
+
+    def encode_loop():
+        try:
+            while True:
+                try:
+                    item = pending.get(timeout=0.1)
+                except queue.Empty:
+                    if stop.is_set(): return
+                    continue
+                if item is _END: return
+                write(item.result())
+        except BaseException as e:
+            errors.append(e); stop.set()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        decoder = threading.Thread(target=decode_loop, args=(pool,), name="decoder", daemon=True)
+        encoder = threading.Thread(target=encode_loop, name="encoder", daemon=True)
+        decoder.start(); encoder.start()
+        decoder.join(); encoder.join()
+        if errors:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    if errors:
+        raise errors[0]
\ No newline at end of file
@@ -0,0 +1,81 @@
+import cv2
+
+def get_video_info(video_path: str):
+    """動画のフレーム数・幅・高さ・FPSを取得する（開けない場合は None）"""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return None
+    info = (int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), cap.get(cv2.CAP_PROP_FPS))
+    cap.release()
+    return info
+
+def open_at(video_path: str, start: int = 0):
+    """動画を開き、start フレーム目から読み出せる状態の VideoCapture を返す"""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened() or start <= 0:
+        return cap
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start:
+        # シークが正確でないコーデックでは先頭から読み飛ばす
+        cap.release()
+        cap = cv2.VideoCapture(video_path)
+        for _ in range(start):
+            if not cap.grab(): break
+    return cap
+
+def iter_frames(video_path: str, start: int = 0, stop: int = None):
+    """動画の [start, stop) 範囲のフレームを (フレーム番号, フレーム) として順に返す"""
+    cap = open_at(video_path, start)
+    try:
+        frame_idx = start
+        while cap.isOpened() and (stop is None or frame_idx < stop):
+            ret, frame = cap.read()
+            if not ret: break
+            yield frame_idx, frame
+            frame_idx += 1
+    finally:
+        cap.release()
+
+def iter_frames_at(video_path: str, indices, seek_gap: int = 250):
+    """
+    昇順のフレーム番号 indices のフレームだけを (フレーム番号, フレーム) として順に返す
+
+    次のフレームまで seek_gap フレーム以上離れている場合はシークし、それ以外は grab で読み飛ばす（色変換を行わない）。
+    シークが正確でないコーデックでは、以降は読み飛ばしのみを使う。
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        pos, can_seek = 0, True
+        for idx in indices:
+            if idx < pos: continue
+            if can_seek and idx - pos >= seek_gap:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+                if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == idx:
+                    pos = idx
+                else:
+                    can_seek = False
+                    cap.release()
+                    cap, pos = cv2.VideoCapture(video_path), 0
+            while pos < idx:
+                if not cap.grab(): return
+                pos += 1
+            ret, frame = cap.read()
+            if not ret: return
+            pos += 1
+            yield idx, frame
+    finally:
+        cap.release()
+
+def plan_shards(video_path: str, shard_frames: int) -> list:
+    """
+    動画をフレーム範囲 (start, stop) に分割する
+
+    CAP_PROP_FRAME_COUNT は実際のフレーム数とずれることがあるため、最後の範囲は stop=None（末尾まで）とする。
+    shard_frames <= 0 の場合は分割しない。
+    """
+    info = get_video_info(video_path)
+    if info is None or shard_frames <= 0 or info[0] <= shard_frames:
+        return [(0, None)]
+    starts = list(range(0, info[0], shard_frames))
+    return [(s, s + shard_frames) for s in starts[:-1]] + [(starts[-1], None)]
\ No newline at end of file
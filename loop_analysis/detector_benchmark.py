@@ -0,0 +1,68 @@
+import os
+import time
+import argparse
+import cv2
+import numpy as np
+from echo_loop import get_fan_geometry, make_kernels, make_closed_mask, PARAMS
+from loop_detector import DETECTORS
+from video_io import iter_frames
+
+def full_frame_mask(frame: np.ndarray, fan, k_box, k_morph, params: dict = PARAMS) -> np.ndarray:
+    """切り出しを行わずにフレーム全体で閉曲線判定用マスクを生成する（make_closed_mask の一致確認用の参照実装）"""
+    masked_frame = cv2.bitwise_and(frame, frame, mask=fan.mask)
+    gray = cv2.cvtColor(masked_frame, cv2.COLOR_BGR2GRAY)
+    _, bin_img = cv2.threshold(cv2.blur(gray, k_box), params['threshold'], 255, cv2.THRESH_BINARY)
+    mask_closed = cv2.morphologyEx(bin_img, cv2.MORPH_CLOSE, k_morph, iterations=params['iterations'])
+    cv2.line(mask_closed, tuple(params['fan_center']), fan.boundary_pt, 255, params['boundary_thickness'], cv2.LINE_8)
+    return cv2.bitwise_and(mask_closed, fan.open_region_mask)
+
+def benchmark_video(video_path: str, max_frames: int = None, params: dict = PARAMS) -> dict:
+    """
+    動画の各フレームの閉曲線マスクに対して全検出手法を実行し、処理時間と判定の一致を集計する
+
+    前処理（マスク生成）は共通のため1回だけ行い、検出処理のみを計測する。
+    切り出し範囲で生成したマスク (make_closed_mask) がフレーム全体で生成したマスクと一致しないフレーム数も数える。
+    """
+    k_box, k_morph = make_kernels(params)
+    times = {name: 0.0 for name in DETECTORS}
+    areas = {name: [] for name in DETECTORS}
+    roi_mismatch = 0
+    for frame_idx, frame in iter_frames(video_path, 0, max_frames):
+        fan = get_fan_geometry(frame.shape[1], frame.shape[0], params)
+        mask_closed = make_closed_mask(frame, fan, k_box, k_morph, params)
+        roi_mismatch += not np.array_equal(mask_closed, full_frame_mask(frame, fan, k_box, k_morph, params))
+        for name, detect in DETECTORS.items():
+            t0 = time.perf_counter()
+            max_area, _ = detect(mask_closed)
+            times[name] += time.perf_counter() - t0
+            areas[name].append(max_area)
+
+    ref = np.array(areas['tree'])
+    result = {'frames': len(ref), 'time': times, 'area_mismatch': {}, 'state_mismatch': {}, 'roi_mismatch': roi_mismatch}
+    for name in DETECTORS:
+        a = np.array(areas[name])
+        result['area_mismatch'][name] = int(np.count_nonzero(a != ref))
+        result['state_mismatch'][name] = int(np.count_nonzero((a > params['area_thr']) != (ref > params['area_thr'])))
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Closed-loop detector parity and speed benchmark")
+    parser.add_argument("videos", nargs="+", help="Input video paths")
+    parser.add_argument("--max_frames", type=int, default=None, help="Analyze at most this many frames per video")
+    parser.add_argument("--fan_r_min", type=float, nargs="+", default=[PARAMS['fan_r_range'][0]],
+                        help="Minimum fan radii to check (a radius > 0 puts the fan apex outside the analyzed crop)")
+    args = parser.parse_args()
+
+    for video_path in args.videos:
+        if not os.path.exists(video_path):
+            print(f"[Warning] Not found: {video_path}"); continue
+        for r_min in args.fan_r_min:
+            params = dict(PARAMS, fan_r_range=(r_min, PARAMS['fan_r_range'][1]))
+            res = benchmark_video(video_path, args.max_frames, params)
+            print(f"[{os.path.basename(video_path)}] {res['frames']} frames (fan_r_min {r_min:g}), "
+                  f"crop vs full-frame mask mismatch: {res['roi_mismatch']}")
+            for name in DETECTORS:
+                ms = 1000.0 * res['time'][name] / max(1, res['frames'])
+                speedup = res['time']['tree'] / res['time'][name] if res['time'][name] > 0 else float('nan')
+                print(f"  {name:>5}: {ms:7.3f} ms/frame (x{speedup:.2f})  "
+                      f"MaxArea mismatch: {res['area_mismatch'][name]}  State mismatch: {res['state_mismatch'][name]}")
\ No newline at end of file
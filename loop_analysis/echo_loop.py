@@ -1,7 +1,16 @@
 import cv2
 import numpy as np
 import argparse
+import functools
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+from fan_geometry import get_fan_geometry
+from stage_pipeline import run_stages
+from profiler import Profiler, NULL_PROFILER, add_profile_args
+from loop_detector import DETECTORS
+from loop_results import LoopResultWriter
 
 # 解析パラメータ設定
 PARAMS = {
@@ -13,98 +22,246 @@ PARAMS = {
     'fan_center': (315, 62),         # 扇形の中心座標 (cx, cy)
     'fan_r_range': (0, 280),         # 扇形の半径範囲 (min, max)
     'fan_angles': (-300.0/259.0, 287.0/274.0), # 扇形の左右の傾き (slope_L, slope_R)
-    'open_boundary_slope': 6.0       # 開ループ判定用の境界線の傾き
+    'open_boundary_slope': 6.0,      # 開ループ判定用の境界線の傾き
+    'boundary_thickness': 3          # 開ループ判定用の境界線の太さ
 }
 
 def create_fan_mask(w: int, h: int, params: dict):
     """解析パラメータに基づいて扇形のマスク画像と境界点を生成する"""
+    fan = get_fan_geometry(w, h, params)
+    return fan.mask.copy(), fan.open_region_mask.copy(), fan.boundary_pt
+
+# 縮小解析で選択できる縮小率（1 = 元の解像度）
+SCALES = (1, 2, 4)
+
+def scale_params(params: dict, scale: int) -> dict:
+    """
+    1/scale に縮小したフレームで解析するためのパラメータを返す
+
+    扇形の中心・半径と平滑化カーネルは 1/scale に、area_thr は 1/scale^2 にする。
+    境界線は縮小すると相対的に太くなり偽の閉ループを作るため、太さも 1/scale（最小1画素）にする。
+    クロージングは元の解像度での到達距離（iterations * (morph_ksize // 2)）が変わらないよう、カーネル半径と回数を選び直す。
+    """
+    if scale == 1:
+        return params
+    r = params['morph_ksize'] // 2
+    r_s = max(1, round(r / scale))
     cx, cy = params['fan_center']
     r_min, r_max = params['fan_r_range']
-    aL, aR = params['fan_angles']
-    a_open = params['open_boundary_slope']
-    
-    xs, ys = np.meshgrid(np.arange(w, dtype=np.float32), np.arange(h, dtype=np.float32))
-    X = xs - cx
-    dist = np.sqrt(X**2 + (ys - cy)**2)
-    
-    mask_ring = (dist >= r_min) & (dist <= r_max)
-    mask_wedge = (ys >= aL * X + cy) & (ys >= aR * X + cy)
-    
-    full_mask = np.zeros((h, w), dtype=np.uint8)
-    full_mask[mask_ring & mask_wedge] = 255
-    
-    mask_open_wedge = (ys >= aL * X + cy) & (ys >= a_open * X + cy)
-    open_region_mask = np.zeros((h, w), dtype=np.uint8)
-    open_region_mask[mask_ring & mask_open_wedge] = 255
+    return dict(params,
+                blur_ksize=max(1, round(params['blur_ksize'] / scale)) | 1,
+                morph_ksize=2 * r_s + 1,
+                iterations=max(1, round(params['iterations'] * r / (scale * r_s))),
+                area_thr=params['area_thr'] / (scale * scale),
+                # 縮小後の画素中心は元の座標の (x + 0.5) / scale - 0.5 に対応する
+                fan_center=(round((cx + 0.5) / scale - 0.5), round((cy + 0.5) / scale - 0.5)),
+                fan_r_range=(r_min / scale, r_max / scale),
+                boundary_thickness=max(1, params['boundary_thickness'] // scale))
+
+def downscale(frame: np.ndarray, scale: int) -> np.ndarray:
+    """
+    フレームを 1/scale に縮小する（画素平均, scale=1 の場合はそのまま返す）
+
+    OpenCV の INTER_AREA は縮小率2のみ高速な処理が使われるため、1/2 の縮小を繰り返す。
+    """
+    while scale > 1:
+        h, w = frame.shape[:2]
+        frame = cv2.resize(frame, (w // 2, h // 2), interpolation=cv2.INTER_AREA)
+        scale //= 2
+    return frame
+
+def make_kernels(params: dict):
+    """平滑化カーネルサイズとモルフォロジー演算用の構造要素を生成する"""
+    k_box = (params['blur_ksize'], params['blur_ksize'])
+    k_morph = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (params['morph_ksize'], params['morph_ksize']))
+    return k_box, k_morph
+
+def closing_pad(params: dict) -> int:
+    """扇形の外接矩形に足す余白（平滑化とクロージングの影響が及ぶ距離より1画素大きくとる）"""
+    return params['blur_ksize'] // 2 + params['iterations'] * (params['morph_ksize'] // 2) + 1
+
+@functools.lru_cache(maxsize=16)
+def _roi_masks(fan, fan_center: tuple, thickness: int, pad: int):
+    """切り出し矩形と、その範囲の扇形マスク・開ループ判定領域・（判定領域内の）境界線マスクを生成する"""
+    x0, y0, x1, y1 = fan.roi(pad)
+    fan_roi = np.ascontiguousarray(fan.mask[y0:y1, x0:x1])
+    open_roi = np.ascontiguousarray(fan.open_region_mask[y0:y1, x0:x1])
+    # 中心が切り出し範囲の外にある場合（fan_r_range の最小半径 > 0）、切り出し座標で引くとクリップにより画素が変わるため、
+    # 境界線はフレーム全体に引いてから切り出す
+    line = np.zeros((fan.h, fan.w), dtype=np.uint8)
+    cv2.line(line, tuple(fan_center), tuple(fan.boundary_pt), 255, thickness, cv2.LINE_8)
+    line = cv2.bitwise_and(np.ascontiguousarray(line[y0:y1, x0:x1]), open_roi)
+    for arr in (fan_roi, open_roi, line):
+        arr.setflags(write=False)
+    return (x0, y0, x1, y1), fan_roi, open_roi, line
+
+def make_closed_mask_roi(frame: np.ndarray, fan, k_box, k_morph, params: dict = PARAMS, prof=NULL_PROFILER):
+    """
+    扇形の外接矩形（カーネルの影響範囲分の余白付き）だけを切り出して make_closed_mask と同じ処理を行い、
+    (切り出し範囲の閉曲線判定用マスク, 切り出し位置 (x0, y0)) を返す
+
+    扇形の外側は0のため、余白をとれば切り出し範囲内の結果は全画面で処理した場合と画素単位で一致する。
+    グレースケールのフレーム（フレームストアの gray）も受け付け、BGRのフレームと同じ結果になる。
+    境界線は開ループ判定領域との積をあらかじめ求めておき、論理和で重ねる。
+    """
+    (x0, y0, x1, y1), fan_roi, open_roi, line = _roi_masks(fan, tuple(params['fan_center']), params['boundary_thickness'], closing_pad(params))
+    roi = frame[y0:y1, x0:x1]
+    with prof.stage('fan_mask'):
+        masked_frame = cv2.bitwise_and(roi, roi, mask=fan_roi)
+        gray = cv2.cvtColor(masked_frame, cv2.COLOR_BGR2GRAY) if masked_frame.ndim == 3 else masked_frame
     
-    dx = r_max / np.sqrt(1 + a_open**2)
-    pt_end = (int(cx + dx), int(cy + a_open * dx))
+    with prof.stage('blur'):
+        blur = cv2.blur(gray, k_box)
+        _, bin_img = cv2.threshold(blur, params['threshold'], 255, cv2.THRESH_BINARY)
+    with prof.stage('morphology'):
+        mask_closed = cv2.morphologyEx(bin_img, cv2.MORPH_CLOSE, k_morph, iterations=params['iterations'])
+
+    mask_closed = cv2.bitwise_and(mask_closed, open_roi)
+    return cv2.bitwise_or(mask_closed, line, dst=mask_closed), (x0, y0)
+
+def _paste(mask_roi: np.ndarray, origin: tuple, fan) -> np.ndarray:
+    """切り出し範囲のマスクをフレームサイズのマスクに貼り付ける"""
+    x0, y0 = origin
+    full = np.zeros((fan.h, fan.w), dtype=np.uint8)
+    full[y0:y0 + mask_roi.shape[0], x0:x0 + mask_roi.shape[1]] = mask_roi
+    return full
+
+def make_closed_mask(frame: np.ndarray, fan, k_box, k_morph, params: dict = PARAMS, prof=NULL_PROFILER) -> np.ndarray:
+    """扇形マスク・平滑化・二値化・クロージングを行い、開ループ境界線を引いた閉曲線判定用マスクを生成する"""
+    mask_roi, origin = make_closed_mask_roi(frame, fan, k_box, k_morph, params, prof)
+    return _paste(mask_roi, origin, fan)
+
+def detect_loop_roi(frame: np.ndarray, fan, k_box, k_morph, params: dict = PARAMS, detector: str = 'tree', prof=NULL_PROFILER):
+    """detect_loop と同じ判定を行い、マスクは貼り付けずに (切り出し範囲のマスク, 切り出し位置, 輪郭リスト, 最大面積) を返す"""
+    mask_roi, origin = make_closed_mask_roi(frame, fan, k_box, k_morph, params, prof)
+    max_area, contours = prof.run('contours', DETECTORS[detector], mask_roi, origin)
+    if contours is not None:
+        prof.observe('n_contours', len(contours))
+    return mask_roi, origin, contours, max_area
+
+def detect_loop(frame: np.ndarray, fan, k_box, k_morph, params: dict = PARAMS, detector: str = 'tree', prof=NULL_PROFILER):
+    """
+    1フレームの開閉判定を行い、(閉曲線マスク, 輪郭リスト, 深度1輪郭の最大面積) を返す
+
+    detector は loop_detector.DETECTORS のキー（'tree': 従来の輪郭階層解析, 'ccomp': 2階層の輪郭抽出, 'label': 連結成分ラベリング）。
+    いずれも同じ最大面積を返す。'label' の場合は輪郭リストを求めないため None を返す。
+    画像処理と輪郭解析は扇形の外接矩形の範囲で行い、マスクと輪郭はフレーム座標に戻して返す。
+    prof (common/profiler.Profiler) を指定した場合は処理段ごとの時間と輪郭数を記録する。
+    """
+    mask_roi, origin, contours, max_area = detect_loop_roi(frame, fan, k_box, k_morph, params, detector, prof)
+    return _paste(mask_roi, origin, fan), contours, max_area
+
+def restore_full_size(mask_roi: np.ndarray, origin: tuple, contours, fan, scale: int, size: tuple):
+    """切り出し範囲のマスクと輪郭を、元の解像度 size = (w, h) のフレームのマスクと輪郭に戻す"""
+    mask_closed = _paste(mask_roi, origin, fan)
+    if scale > 1:
+        mask_closed = cv2.resize(mask_closed, size, interpolation=cv2.INTER_NEAREST)
+        if contours is not None:
+            contours = [c * scale for c in contours]
+    return mask_closed, contours
+
+def render_overlay(mask_closed: np.ndarray, contours, is_closed: bool) -> np.ndarray:
+    """閉曲線マスクに輪郭と判定結果を描画したオーバーレイ画像を生成する"""
+    if contours is None:
+        contours, _ = cv2.findContours(mask_closed, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    vis = cv2.cvtColor(mask_closed, cv2.COLOR_GRAY2BGR)
+    cv2.drawContours(vis, contours, -1, (0, 255, 0), 2)
     
-    return full_mask, open_region_mask, pt_end
-
-def get_contour_depths(hierarchy):
-    """輪郭の階層構造から各輪郭の深度リストを取得する"""
-    if hierarchy is None: return []
-    depths = []
-    for i, h in enumerate(hierarchy[0]):
-        d = 0; parent = h[3]
-        while parent != -1: d += 1; parent = hierarchy[0][parent][3]
-        depths.append(d)
-    return depths
-
-def process_video(input_path: str, output_prefix: str):
-    """動画を読み込み、フレームごとに開閉判定を行って結果動画を出力する"""
+    status = "Close" if is_closed else "Open"
+    color = (0, 0, 255) if is_closed else (0, 255, 255)
+    cv2.putText(vis, f"State: {status}", (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.2, color, 3)
+    return vis
+
+def process_video(input_path: str, output_prefix: str, threads: int = 0, queue_depth: int = 8, detector: str = 'tree',
+                  prof=NULL_PROFILER, scale: int = 1, save_video: bool = True, save_results: bool = False):
+    """
+    動画を読み込み、フレームごとに開閉判定を行って結果動画を出力する
+
+    threads > 0 の場合は、デコード・解析（threads 個のワーカー）・エンコードをスレッドで並行実行する。
+    出力動画はシリアル実行 (threads=0) とバイト単位で同一になる。
+    prof を指定した場合は処理段（デコード・各画像処理・描画・エンコード）ごとの時間を記録する。
+    scale > 1 の場合は 1/scale に縮小したフレームで判定し、マスクと輪郭を元の解像度に戻して描画する。
+    save_results=True の場合はフレームごとの結果を <output_prefix>_loop.npz (loop_results.LoopResultWriter) に保存する。
+    save_video=False の場合は描画とエンコードを行わない（動画は render_loop.py で後から必要な範囲だけ生成できる）。
+    """
     cap = cv2.VideoCapture(input_path)
     if not cap.isOpened(): print(f"Error: {input_path}"); return
     w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = cap.get(cv2.CAP_PROP_FPS)
     
-    fan_mask, open_region_mask, boundary_pt = create_fan_mask(w, h, PARAMS)
+    params = scale_params(PARAMS, scale)
+    fan = get_fan_geometry(w // scale, h // scale, params)
     
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out_mask = cv2.VideoWriter(f"{output_prefix}_mask.mp4", fourcc, fps, (w, h), False)
-    out_overlay = cv2.VideoWriter(f"{output_prefix}_overlay.mp4", fourcc, fps, (w, h))
+    out_mask = out_overlay = results = None
+    if save_video:
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        out_mask = cv2.VideoWriter(f"{output_prefix}_mask.mp4", fourcc, fps, (w, h), False)
+        out_overlay = cv2.VideoWriter(f"{output_prefix}_overlay.mp4", fourcc, fps, (w, h))
+    if save_results:
+        results = LoopResultWriter(f"{output_prefix}_loop.npz", w, h, fps, params, scale, detector, input_path)
     
-    k_box = (PARAMS['blur_ksize'], PARAMS['blur_ksize'])
-    k_morph = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (PARAMS['morph_ksize'], PARAMS['morph_ksize']))
+    k_box, k_morph = make_kernels(params)
+
+    def read_frame():
+        ret, frame = prof.run('decode', cap.read)
+        return frame if ret else None
+
+    def analyze(frame):
+        small = prof.run('downscale', downscale, frame, scale) if scale > 1 else frame
+        mask_roi, origin, contours, max_area = detect_loop_roi(small, fan, k_box, k_morph, params, detector, prof)
+        prof.count('frames')
+        is_closed = max_area > params['area_thr']
+        rendered = None
+        if save_video:
+            mask_closed, full_contours = restore_full_size(mask_roi, origin, contours, fan, scale, (w, h))
+            rendered = (mask_closed, prof.run('render', render_overlay, mask_closed, full_contours, is_closed))
+        return (mask_roi, origin, contours, max_area, is_closed), rendered
+
+    def write(result):
+        compact, rendered = result
+        if results is not None:
+            prof.run('save_results', results.add, *compact)
+        if rendered is not None:
+            with prof.stage('encode'):
+                out_mask.write(rendered[0]); out_overlay.write(rendered[1])
     
     print(f"Processing: {input_path}")
-    while True:
-        ret, frame = cap.read()
-        if not ret: break
-        
-        masked_frame = cv2.bitwise_and(frame, frame, mask=fan_mask)
-        gray = cv2.cvtColor(masked_frame, cv2.COLOR_BGR2GRAY)
-        
-        blur = cv2.blur(gray, k_box)
-        _, bin_img = cv2.threshold(blur, PARAMS['threshold'], 255, cv2.THRESH_BINARY)
-        mask_closed = cv2.morphologyEx(bin_img, cv2.MORPH_CLOSE, k_morph, iterations=PARAMS['iterations'])
-        
-        cv2.line(mask_closed, PARAMS['fan_center'], boundary_pt, 255, 3, cv2.LINE_8)
-        mask_closed = cv2.bitwise_and(mask_closed, open_region_mask)
-        
-        contours, hierarchy = cv2.findContours(mask_closed, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-        depths = get_contour_depths(hierarchy)
-        
-        is_closed = False
-        for i, cnt in enumerate(contours):
-            if (depths[i] if i < len(depths) else 0) == 1 and cv2.contourArea(cnt) > PARAMS['area_thr']:
-                is_closed = True; break
-                
-        vis = cv2.cvtColor(mask_closed, cv2.COLOR_GRAY2BGR)
-        cv2.drawContours(vis, contours, -1, (0, 255, 0), 2)
-        
-        status = "Close" if is_closed else "Open"
-        color = (0, 0, 255) if is_closed else (0, 255, 255)
-        cv2.putText(vis, f"State: {status}", (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.2, color, 3)
-        
-        out_mask.write(mask_closed); out_overlay.write(vis)
-        
-    cap.release(); out_mask.release(); out_overlay.release()
+    try:
+        if threads > 0:
+            run_stages(read_frame, analyze, write, workers=threads, queue_depth=queue_depth)
+        else:
+            while True:
+                frame = read_frame()
+                if frame is None: break
+                write(analyze(frame))
+    finally:
+        cap.release()
+        if save_video:
+            out_mask.release(); out_overlay.release()
+        if results is not None:
+            results.close()
+            print(f"Saved results to {results.path}")
     print("Done.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("input_video", help="Input video path")
+    parser.add_argument("--threads", type=int, default=0, help="Analysis worker threads (0 = serial decode/analyze/encode)")
+    parser.add_argument("--queue_depth", type=int, default=8, help="Max frames buffered between pipeline stages")
+    parser.add_argument("--detector", choices=sorted(DETECTORS), default="tree", help="Closed-loop detector (tree: RETR_TREE hierarchy, ccomp: RETR_CCOMP holes, label: connected-component hole labeling)")
+    parser.add_argument("--scale", type=int, choices=SCALES, default=1, help="Analyze frames downscaled by this factor (1 = full resolution)")
+    parser.add_argument("--results", action="store_true", help="Save compact per-frame results to <name>_loop.npz (render later with render_loop.py)")
+    parser.add_argument("--no_video", action="store_true", help="Skip rendering and encoding the mask/overlay videos")
+    add_profile_args(parser)
     args = parser.parse_args()
-    process_video(args.input_video, os.path.splitext(os.path.basename(args.input_video))[0])
\ No newline at end of file
+    if args.no_video and not args.results:
+        parser.error("--no_video requires --results (nothing would be written)")
+    prof = Profiler() if args.profile else NULL_PROFILER
+    process_video(args.input_video, os.path.splitext(os.path.basename(args.input_video))[0],
+                  threads=args.threads, queue_depth=args.queue_depth, detector=args.detector, prof=prof, scale=args.scale,
+                  save_video=not args.no_video, save_results=args.results)
+    if args.profile:
+        prof.print_summary()
+        prof.save(args.profile, tool="echo_loop", input=args.input_video, threads=args.threads, detector=args.detector,
+                  scale=args.scale, video=not args.no_video)
+        print(f"Saved profile to {args.profile}")
\ No newline at end of file
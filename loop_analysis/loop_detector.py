@@ -0,0 +1,98 @@
+import cv2
+import numpy as np
+
+def get_contour_depths(hierarchy):
+    """輪郭の階層構造から各輪郭の深度リストを取得する"""
+    if hierarchy is None: return []
+    depths = []
+    for i, h in enumerate(hierarchy[0]):
+        d = 0; parent = h[3]
+        while parent != -1: d += 1; parent = hierarchy[0][parent][3]
+        depths.append(d)
+    return depths
+
+def max_depth1_area_tree(mask: np.ndarray, offset: tuple = (0, 0)):
+    """
+    RETR_TREE の輪郭階層から深度1の輪郭（最上位の領域に開いた穴）の最大面積を求める（従来手法）
+
+    offset を指定した場合は、輪郭の座標にそのずれを加える（切り出した領域の輪郭をフレーム座標で返すため）。
+
+    Returns:
+        (深度1輪郭の最大面積, 全輪郭リスト)
+    """
+    contours, hierarchy = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE, offset=offset)
+    depths = get_contour_depths(hierarchy)
+
+    max_area = 0.0
+    for i, cnt in enumerate(contours):
+        if (depths[i] if i < len(depths) else 0) == 1:
+            max_area = max(max_area, cv2.contourArea(cnt))
+    return max_area, contours
+
+def max_depth1_area_ccomp(mask: np.ndarray, offset: tuple = (0, 0)):
+    """
+    RETR_CCOMP の2階層（外周と穴）から穴の輪郭だけを取り出し、その最大面積を求める
+
+    深度3以上の穴は必ずいずれかの深度1の穴の内側にあり面積も小さいため、全ての穴の最大値が深度1の最大値と一致する。
+    深度の計算（親を辿るPythonループ）が不要で、面積も穴の輪郭に対してのみ計算する。
+
+    Returns:
+        (深度1輪郭の最大面積, 全輪郭リスト)
+    """
+    contours, hierarchy = cv2.findContours(mask, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE, offset=offset)
+    if hierarchy is None:
+        return 0.0, contours
+    holes = np.flatnonzero(hierarchy[0][:, 3] != -1)
+    max_area = 0.0
+    for i in holes:
+        max_area = max(max_area, cv2.contourArea(contours[i]))
+    return max_area, contours
+
+def _hole_contour_area(bg_labels: np.ndarray, label: int, x: int, y: int, w: int, h: int) -> float:
+    """穴（背景の連結成分）1つを囲む輪郭の面積を、その穴だけを含む小領域で求める"""
+    crop = bg_labels[y - 1:y + h + 1, x - 1:x + w + 1]
+    sub = np.zeros((h + 4, w + 4), dtype=np.uint8)
+    sub[1:-1, 1:-1] = crop != label
+    # 小領域では外周の成分だけが深度0となり、その深度1の輪郭が対象の穴の輪郭となる
+    area, _ = max_depth1_area_tree(sub)
+    return area
+
+def max_depth1_area_label(mask: np.ndarray, offset: tuple = (0, 0)):
+    """
+    背景の連結成分ラベリングで穴を列挙し、深度1輪郭の最大面積を求める（高速手法）
+
+    findContours と同じく背景を4近傍でラベリングし、画像外側に繋がらない成分を穴とする。
+    深度3以上の穴は必ずいずれかの深度1の穴の内側にあり面積も小さいため、全ての穴の最大値が深度1の最大値と一致する。
+    面積は外接矩形から求まる上限の大きい穴から順に小領域で輪郭を追跡して求め、
+    上限が現在の最大値以下になった時点で打ち切るため、max_depth1_area_tree と同じ値を少ない輪郭追跡で得られる。
+
+    Returns:
+        (深度1輪郭の最大面積, None)
+    """
+    x0, y0, w0, h0 = cv2.boundingRect(mask)
+    if w0 == 0 or h0 == 0:
+        return 0.0, None
+    padded = cv2.copyMakeBorder(mask[y0:y0 + h0, x0:x0 + w0], 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    bg = (padded == 0).view(np.uint8)
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(bg, connectivity=4, ltype=cv2.CV_32S)
+
+    # ラベル0は前景、画像外側と繋がる背景は (0, 0) のラベル
+    hole_ids = np.arange(1, n)
+    hole_ids = hole_ids[hole_ids != labels[0, 0]]
+    if len(hole_ids) == 0:
+        return 0.0, None
+
+    hole_stats = stats[hole_ids]
+    bounds = (hole_stats[:, cv2.CC_STAT_WIDTH] + 1) * (hole_stats[:, cv2.CC_STAT_HEIGHT] + 1)
+    max_area = 0.0
+    for k in np.argsort(-bounds, kind='stable'):
+        if bounds[k] <= max_area: break
+        x, y, w, h = hole_stats[k, :4]
+        max_area = max(max_area, _hole_contour_area(labels, hole_ids[k], x, y, w, h))
+    return max_area, None
+
+DETECTORS = {
+    'tree': max_depth1_area_tree,
+    'ccomp': max_depth1_area_ccomp,
+    'label': max_depth1_area_label,
+}
\ No newline at end of file
@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+from mask_rle import rle_encode, rle_decode
+
+class LoopResultWriter:
+    """
+    開閉判定のフレームごとの結果を、動画を書き出さずに列ごとの配列として圧縮保存する (.npz)
+
+    保存するのは判定・最大面積・切り出し矩形・切り出し範囲の閉曲線マスク（ランレングス）・輪郭点で、
+    座標と面積はいずれも解析した解像度（scale > 1 の場合は縮小後）の値とする。
+    render_loop.py はこのファイルから echo_loop.process_video と同じマスク動画・オーバーレイ動画を再現する。
+    """
+    def __init__(self, path: str, width: int, height: int, fps: float, params: dict, scale: int = 1,
+                 detector: str = 'tree', source: str = None):
+        self.path = path
+        self.meta = {'width': width, 'height': height, 'fps': fps, 'scale': scale, 'detector': detector,
+                     'source': source, 'params': params}
+        self.closed, self.max_area, self.roi = [], [], []
+        self.runs, self.contour_counts, self.contour_lengths, self.points = [], [], [], []
+
+    def add(self, mask_roi: np.ndarray, origin: tuple, contours, max_area: float, is_closed: bool):
+        """1フレーム分の結果（echo_loop.detect_loop_roi の戻り値と判定）を追加する（フレーム順に呼ぶ）"""
+        x0, y0 = origin
+        self.closed.append(bool(is_closed))
+        self.max_area.append(float(max_area))
+        self.roi.append((x0, y0, x0 + mask_roi.shape[1], y0 + mask_roi.shape[0]))
+        self.runs.append(rle_encode(mask_roi))
+        if contours is None:
+            self.contour_counts.append(-1)  # 'label' 検出器は輪郭を求めない（描画時に求める）
+            return
+        self.contour_counts.append(len(contours))
+        for c in contours:
+            self.contour_lengths.append(len(c))
+            self.points.append(c.reshape(-1, 2))
+
+    def close(self):
+        offsets = np.zeros(len(self.runs) + 1, dtype=np.int64)
+        np.cumsum([len(r) for r in self.runs], out=offsets[1:])
+        np.savez_compressed(
+            self.path,
+            closed=np.array(self.closed, dtype=bool),
+            max_area=np.array(self.max_area, dtype=np.float64),
+            roi=np.array(self.roi, dtype=np.int32).reshape(-1, 4),
+            mask_runs=np.concatenate(self.runs) if self.runs else np.zeros(0, dtype=np.uint32),
+            mask_offsets=offsets,
+            contour_counts=np.array(self.contour_counts, dtype=np.int32),
+            contour_lengths=np.array(self.contour_lengths, dtype=np.int32),
+            contour_points=np.concatenate(self.points).astype(np.int32) if self.points else np.zeros((0, 2), dtype=np.int32),
+            meta=np.array(json.dumps(self.meta)),
+        )
+
+class LoopResults:
+    """LoopResultWriter で保存した結果を読み込み、フレームごとに取り出す"""
+    def __init__(self, path: str):
+        with np.load(path) as data:
+            self.arrays = {k: data[k] for k in data.files}
+        self.meta = json.loads(str(self.arrays.pop('meta')))
+        self.params = dict(self.meta['params'])
+        for key in ('fan_center', 'fan_r_range', 'fan_angles'):
+            self.params[key] = tuple(self.params[key])
+        counts = self.arrays['contour_counts']
+        # フレームごとの輪郭の開始位置と、輪郭ごとの点の開始位置
+        self._contour_start = np.concatenate(([0], np.cumsum(np.maximum(counts, 0))))
+        self._point_start = np.concatenate(([0], np.cumsum(self.arrays['contour_lengths'])))
+
+    def __len__(self):
+        return len(self.arrays['closed'])
+
+    def frame(self, i: int):
+        """
+        i 番目のフレームの (切り出し範囲のマスク, 切り出し位置 (x0, y0), 輪郭リスト, 最大面積, 閉ループか) を返す
+
+        輪郭リストは cv2.findContours と同じ (K, 1, 2) の int32 配列のリスト（求めていない場合は None）。
+        """
+        a = self.arrays
+        x0, y0, x1, y1 = (int(v) for v in a['roi'][i])
+        runs = a['mask_runs'][a['mask_offsets'][i]:a['mask_offsets'][i + 1]]
+        mask_roi = rle_decode(runs, (y1 - y0, x1 - x0))
+        contours = None
+        if a['contour_counts'][i] >= 0:
+            contours = []
+            for k in range(self._contour_start[i], self._contour_start[i + 1]):
+                pts = a['contour_points'][self._point_start[k]:self._point_start[k + 1]]
+                contours.append(pts.reshape(-1, 1, 2))
+        return mask_roi, (x0, y0), contours, float(a['max_area'][i]), bool(a['closed'][i])
\ No newline at end of file
@@ -0,0 +1,160 @@
+import os
+import csv
+import argparse
+import itertools
+import cv2
+import numpy as np
+import pandas as pd
+from echo_loop import get_fan_geometry, PARAMS
+from loop_detector import DETECTORS
+from sixvideo_research import VIDEO_LIST, score_predictions
+from video_io import iter_frames
+from parallel_runner import make_shard_tasks, run_in_order
+
+# 処理段の順序（上流の値が同じ組み合わせでは、その段までの結果を共有する）
+SWEEP_KEYS = ['blur_ksize', 'threshold', 'morph_ksize', 'iterations', 'area_thr']
+
+def make_grid(**values) -> dict:
+    """各パラメータの候補値を重複なく昇順に整理する（未指定のものは PARAMS の値のみ）"""
+    grid = {}
+    for key in SWEEP_KEYS:
+        vals = values.get(key)
+        grid[key] = sorted(set(vals)) if vals else [PARAMS[key]]
+    return grid
+
+def upstream_points(grid: dict) -> list:
+    """面積しきい値より上流のパラメータの組み合わせを sweep_frame の出力順で返す"""
+    return list(itertools.product(grid['blur_ksize'], grid['threshold'], grid['morph_ksize'], grid['iterations']))
+
+def sweep_frame(frame: np.ndarray, fan, grid: dict, detector: str = 'tree') -> list:
+    """
+    1フレームについて、上流パラメータの全組み合わせの深度1輪郭最大面積を求める
+
+    扇形マスクとグレースケール化は1回、平滑化は blur_ksize ごと、二値化は threshold ごとに1回だけ行う。
+    クロージング（膨張 n 回 → 収縮 n 回）は、iterations の昇順に膨張結果を引き継いで計算する。
+    面積しきい値 area_thr は最大面積との比較のみのため、ここでは扱わない。
+    """
+    masked = cv2.bitwise_and(frame, frame, mask=fan.mask)
+    gray = cv2.cvtColor(masked, cv2.COLOR_BGR2GRAY)
+    areas = []
+    for bk in grid['blur_ksize']:
+        blur = cv2.blur(gray, (bk, bk))
+        for thr in grid['threshold']:
+            _, bin_img = cv2.threshold(blur, thr, 255, cv2.THRESH_BINARY)
+            for mk in grid['morph_ksize']:
+                k_morph = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (mk, mk))
+                dilated, done = bin_img, 0
+                for n in grid['iterations']:
+                    dilated = cv2.dilate(dilated, k_morph, iterations=n - done); done = n
+                    mask_closed = cv2.erode(dilated, k_morph, iterations=n)
+                    cv2.line(mask_closed, PARAMS['fan_center'], fan.boundary_pt, 255, PARAMS['boundary_thickness'], cv2.LINE_8)
+                    mask_closed = cv2.bitwise_and(mask_closed, fan.open_region_mask)
+                    max_area, _ = DETECTORS[detector](mask_closed)
+                    areas.append(max_area)
+    return areas
+
+def sweep_range(video_path: str, start: int, stop, grid: dict, detector: str = 'tree') -> np.ndarray:
+    """動画の [start, stop) 範囲について (フレーム数, 上流パラメータの組み合わせ数) の最大面積配列を返す"""
+    rows = []
+    for _, frame in iter_frames(video_path, start, stop):
+        fan = get_fan_geometry(frame.shape[1], frame.shape[0], PARAMS)
+        rows.append(sweep_frame(frame, fan, grid, detector))
+    return np.array(rows, dtype=np.float64).reshape(len(rows), len(upstream_points(grid)))
+
+def _sweep_shard(task):
+    """プロセスプール用: (動画パス, 開始フレーム, 終了フレーム, グリッド, 検出手法) を処理する"""
+    return sweep_range(*task)
+
+def run_sweep(video_files, grid: dict, detector: str = 'tree', workers: int = 1, shard_frames: int = 0) -> dict:
+    """全動画の最大面積配列を {動画パス: 配列} として返す（デコードは各フレーム1回のみ）"""
+    found = []
+    for video_path in video_files:
+        if not os.path.exists(video_path):
+            print(f"[Warning] Not found: {video_path}"); continue
+        found.append(video_path)
+    tasks = [task + (grid, detector) for task in make_shard_tasks(found, shard_frames if workers > 1 else 0)]
+    if workers > 1:
+        results = run_in_order(_sweep_shard, tasks, workers)
+    else:
+        results = map(_sweep_shard, tasks)
+
+    parts = {}
+    for (video_path, *_), areas in zip(tasks, results):
+        parts.setdefault(video_path, []).append(areas)
+        print(f"Processed: {video_path} ({sum(len(a) for a in parts[video_path])} frames)")
+    return {v: np.concatenate(a, axis=0) for v, a in parts.items()}
+
+def score_sweep(areas_by_video: dict, grid: dict) -> list:
+    """各グリッド点について、正解データ (*_truth.csv) と比較した評価指標を求める"""
+    truths = {}
+    for video_path in areas_by_video:
+        base = os.path.splitext(os.path.basename(video_path))[0]
+        truth_file = f"{base}_truth.csv"
+        if os.path.exists(truth_file):
+            truths[video_path] = (base, pd.read_csv(truth_file))
+    if not truths:
+        print("[Warning] No *_truth.csv found; nothing to score.")
+
+    results = []
+    for u, upstream in enumerate(upstream_points(grid)):
+        for area_thr in grid['area_thr']:
+            point = dict(zip(SWEEP_KEYS, upstream + (area_thr,)))
+            metrics = {'acc': [], 'prec': [], 'rec': [], 'f1': []}
+            per_video = {}
+            for video_path, (base, df_true) in truths.items():
+                states = np.where(areas_by_video[video_path][:, u] > area_thr, "Close", "Open")
+                scores = score_predictions(pd.DataFrame({'State': states}), df_true)
+                if scores is None: continue
+                for k in metrics: metrics[k].append(scores[k])
+                per_video[f"F1_{base}"] = scores['f1']
+            point.update({
+                'Videos': len(metrics['f1']),
+                'Mean_Acc': np.mean(metrics['acc']) if metrics['acc'] else float('nan'),
+                'Mean_Prec': np.mean(metrics['prec']) if metrics['prec'] else float('nan'),
+                'Mean_Rec': np.mean(metrics['rec']) if metrics['rec'] else float('nan'),
+                'Mean_F1': np.mean(metrics['f1']) if metrics['f1'] else float('nan'),
+            })
+            point.update(per_video)
+            results.append(point)
+    return results
+
+def save_results(results: list, csv_out: str):
+    """グリッド点ごとの評価結果をCSVに保存する"""
+    columns = []
+    for r in results:
+        columns.extend(k for k in r if k not in columns)
+    with open(csv_out, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Staged parameter sweep for loop_analysis PARAMS")
+    parser.add_argument("videos", nargs="*", help="Input video paths (default: VIDEO_LIST in sixvideo_research.py)")
+    parser.add_argument("--blur_ksize", type=int, nargs="+", help="Candidate blur kernel sizes")
+    parser.add_argument("--threshold", type=int, nargs="+", help="Candidate binarization thresholds")
+    parser.add_argument("--morph_ksize", type=int, nargs="+", help="Candidate morphology kernel sizes")
+    parser.add_argument("--iterations", type=int, nargs="+", help="Candidate closing iterations (>= 1)")
+    parser.add_argument("--area_thr", type=float, nargs="+", help="Candidate closed-loop area thresholds")
+    parser.add_argument("--detector", choices=sorted(DETECTORS), default="tree", help="Closed-loop detector")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes (1 = sequential)")
+    parser.add_argument("--shard_frames", type=int, default=0, help="Split each video into frame ranges of this length when workers > 1 (0 = whole video)")
+    parser.add_argument("--out", type=str, default="sweep_results.csv", help="Output CSV path")
+    args = parser.parse_args()
+
+    grid = make_grid(blur_ksize=args.blur_ksize, threshold=args.threshold, morph_ksize=args.morph_ksize,
+                     iterations=args.iterations, area_thr=args.area_thr)
+    if min(grid['iterations']) < 1:
+        parser.error("--iterations must be >= 1")
+    n_points = len(upstream_points(grid)) * len(grid['area_thr'])
+    print(f"Sweeping {n_points} parameter combinations: {grid}")
+
+    areas = run_sweep(args.videos or VIDEO_LIST, grid, args.detector, args.workers, args.shard_frames)
+    results = score_sweep(areas, grid)
+    save_results(results, args.out)
+    print(f"Saved sweep results to {args.out}")
+
+    ranked = sorted((r for r in results if r['Videos'] > 0), key=lambda r: r['Mean_F1'], reverse=True)
+    print("\n--- Top 5 (Mean F1) ---")
+    for r in ranked[:5]:
+        print(", ".join(f"{k}={r[k]}" for k in SWEEP_KEYS) + f" -> Mean F1: {r['Mean_F1']:.4f}")
\ No newline at end of file
@@ -0,0 +1,65 @@
+import os
+import argparse
+import cv2
+from echo_loop import get_fan_geometry, restore_full_size, render_overlay
+from loop_results import LoopResults
+
+def iter_rendered(results: LoopResults, start: int = 0, stop: int = None):
+    """保存済みの結果から、[start, stop) の各フレームの (フレーム番号, 閉曲線マスク, オーバーレイ画像) を順に返す"""
+    meta = results.meta
+    scale = meta['scale']
+    size = (meta['width'], meta['height'])
+    fan = get_fan_geometry(size[0] // scale, size[1] // scale, results.params)
+    stop = len(results) if stop is None else min(stop, len(results))
+    for i in range(max(0, start), stop):
+        mask_roi, origin, contours, _, is_closed = results.frame(i)
+        mask_closed, contours = restore_full_size(mask_roi, origin, contours, fan, scale, size)
+        yield i, mask_closed, render_overlay(mask_closed, contours, is_closed)
+
+def render_video(results_path: str, out_prefix: str, start: int = 0, stop: int = None, with_mask: bool = False):
+    """結果ファイルから <out_prefix>_overlay.mp4（with_mask=True なら <out_prefix>_mask.mp4 も）を生成する"""
+    results = LoopResults(results_path)
+    meta = results.meta
+    size = (meta['width'], meta['height'])
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out_overlay = cv2.VideoWriter(f"{out_prefix}_overlay.mp4", fourcc, meta['fps'], size)
+    out_mask = cv2.VideoWriter(f"{out_prefix}_mask.mp4", fourcc, meta['fps'], size, False) if with_mask else None
+    try:
+        for _, mask_closed, vis in iter_rendered(results, start, stop):
+            out_overlay.write(vis)
+            if out_mask is not None:
+                out_mask.write(mask_closed)
+    finally:
+        out_overlay.release()
+        if out_mask is not None:
+            out_mask.release()
+    print(f"Saved {out_prefix}_overlay.mp4" + (f" and {out_prefix}_mask.mp4" if with_mask else ""))
+
+def render_images(results_path: str, out_prefix: str, start: int = 0, stop: int = None, with_mask: bool = False):
+    """結果ファイルからフレームごとの画像 <out_prefix>_overlay_<フレーム番号>.png（with_mask=True ならマスク画像も）を生成する"""
+    n = 0
+    for i, mask_closed, vis in iter_rendered(LoopResults(results_path), start, stop):
+        cv2.imwrite(f"{out_prefix}_overlay_{i:06d}.png", vis)
+        if with_mask:
+            cv2.imwrite(f"{out_prefix}_mask_{i:06d}.png", mask_closed)
+        n += 1
+    print(f"Saved {n} frames to {out_prefix}_overlay_*.png")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render overlay videos or images from results saved by echo_loop.py --results")
+    parser.add_argument("results", nargs="+", help="Result files (<name>_loop.npz)")
+    parser.add_argument("--start", type=int, default=0, help="First frame to render")
+    parser.add_argument("--stop", type=int, default=None, help="Stop before this frame (default: last frame)")
+    parser.add_argument("--format", choices=["video", "images"], default="video", help="Write one mp4 per result file or one PNG per frame")
+    parser.add_argument("--mask", action="store_true", help="Also write the closed-loop mask")
+    parser.add_argument("--out_dir", type=str, default=".", help="Output dir")
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    render = render_video if args.format == "video" else render_images
+    for path in args.results:
+        if not os.path.exists(path):
+            print(f"[Warning] Not found: {path}"); continue
+        name = os.path.basename(path)
+        name = name[:-len("_loop.npz")] if name.endswith("_loop.npz") else os.path.splitext(name)[0]
+        render(path, os.path.join(args.out_dir, name), args.start, args.stop, args.mask)
\ No newline at end of file
@@ -0,0 +1,101 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from echo_loop import get_fan_geometry, make_kernels, detect_loop, scale_params, downscale, PARAMS, SCALES
+from loop_detector import DETECTORS
+from sixvideo_research import VIDEO_LIST, score_predictions
+from video_io import iter_frames
+
+def compare_scales(video_path: str, scales, detector: str = 'tree', max_frames: int = None) -> dict:
+    """
+    動画の各フレームを縮小率ごとに判定し、処理時間・判定・最大面積（元の解像度の画素数に換算）を集計する
+
+    デコードは各フレーム1回のみ行い、縮小から判定までを縮小率ごとに計測する。
+    """
+    setups = {}
+    for scale in scales:
+        params = scale_params(PARAMS, scale)
+        setups[scale] = (params,) + make_kernels(params)
+    times = {scale: 0.0 for scale in scales}
+    states = {scale: [] for scale in scales}
+    areas = {scale: [] for scale in scales}
+    for _, frame in iter_frames(video_path, 0, max_frames):
+        for scale, (params, k_box, k_morph) in setups.items():
+            t0 = time.perf_counter()
+            small = downscale(frame, scale)
+            fan = get_fan_geometry(small.shape[1], small.shape[0], params)
+            _, _, max_area = detect_loop(small, fan, k_box, k_morph, params, detector)
+            times[scale] += time.perf_counter() - t0
+            states[scale].append("Close" if max_area > params['area_thr'] else "Open")
+            areas[scale].append(max_area * scale * scale)
+    return {'frames': len(states[scales[0]]), 'time': times, 'states': states, 'areas': areas}
+
+def scale_rows(video_path: str, res: dict, scales) -> list:
+    """compare_scales の結果から、縮小率ごとの速度・元の解像度との一致率・正解データとの F1 を求める"""
+    base = os.path.splitext(os.path.basename(video_path))[0]
+    truth_file = f"{base}_truth.csv"
+    df_true = pd.read_csv(truth_file) if os.path.exists(truth_file) else None
+    ref_states = np.array(res['states'][1])
+    ref_areas = np.array(res['areas'][1])
+    rows = []
+    for scale in scales:
+        states = np.array(res['states'][scale])
+        areas = np.array(res['areas'][scale])
+        scores = score_predictions(pd.DataFrame({'State': states}), df_true) if df_true is not None else None
+        rows.append({
+            'Video': base, 'Scale': scale, 'Frames': res['frames'],
+            'ms_per_frame': 1000.0 * res['time'][scale] / max(1, res['frames']),
+            'Speedup': res['time'][1] / res['time'][scale] if res['time'][scale] > 0 else float('nan'),
+            'Agreement': float(np.mean(states == ref_states)) if len(states) else float('nan'),
+            'Area_MAE': float(np.mean(np.abs(areas - ref_areas))) if len(areas) else float('nan'),
+            'F1': scores['f1'] if scores else float('nan'),
+        })
+    return rows
+
+def pick_scale(df: pd.DataFrame, f1_tolerance: float):
+    """
+    全動画の平均で、元の解像度からの F1 低下が f1_tolerance 以内となる最も速い縮小率を返す
+
+    正解データがない場合は、元の解像度との判定一致率が 1 - f1_tolerance 以上となる最も速い縮小率を返す。
+    """
+    overall = df.groupby('Scale').agg({'ms_per_frame': 'mean', 'Agreement': 'mean', 'F1': 'mean'})
+    if overall['F1'].notna().all():
+        ok = overall[overall['F1'] >= overall.loc[1, 'F1'] - f1_tolerance]
+    else:
+        ok = overall[overall['Agreement'] >= 1.0 - f1_tolerance]
+    return int(ok['ms_per_frame'].idxmin()), overall
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reduced-resolution loop analysis agreement report")
+    parser.add_argument("videos", nargs="*", default=VIDEO_LIST, help="Input video paths (default: VIDEO_LIST); <name>_truth.csv is read from the current directory")
+    parser.add_argument("--scales", type=int, nargs="+", choices=SCALES, default=list(SCALES), help="Downscale factors to compare (1 is always included)")
+    parser.add_argument("--detector", choices=sorted(DETECTORS), default="tree", help="Closed-loop detector")
+    parser.add_argument("--f1_tolerance", type=float, default=0.01, help="Allowed drop in mean F1 from full resolution")
+    parser.add_argument("--max_frames", type=int, default=None, help="Analyze at most this many frames per video")
+    parser.add_argument("--out", type=str, default="scale_report.csv", help="Output CSV path")
+    args = parser.parse_args()
+
+    scales = sorted(set(args.scales) | {1})
+    rows = []
+    for video_path in args.videos:
+        if not os.path.exists(video_path):
+            print(f"[Warning] Not found: {video_path}"); continue
+        res = compare_scales(video_path, scales, args.detector, args.max_frames)
+        print(f"[{os.path.basename(video_path)}] {res['frames']} frames")
+        for row in scale_rows(video_path, res, scales):
+            rows.append(row)
+            print(f"  1/{row['Scale']}: {row['ms_per_frame']:7.3f} ms/frame (x{row['Speedup']:.2f})  "
+                  f"Agreement: {row['Agreement']:.4f}  Area MAE: {row['Area_MAE']:.1f}  F1: {row['F1']:.4f}")
+    if not rows:
+        raise SystemExit("No videos analyzed.")
+
+    df = pd.DataFrame(rows)
+    df.to_csv(args.out, index=False)
+    best, overall = pick_scale(df, args.f1_tolerance)
+    print("\n--- Overall ---")
+    for scale, r in overall.iterrows():
+        print(f"  1/{scale}: {r['ms_per_frame']:7.3f} ms/frame  Agreement: {r['Agreement']:.4f}  Mean F1: {r['F1']:.4f}")
+    print(f"Fastest scale within tolerance ({args.f1_tolerance}): 1/{best}")
+    print(f"Saved report to {args.out}")
\ No newline at end of file
@@ -1,10 +1,17 @@
 import os
+import sys
 import csv
-import cv2
-import pandas as pd
+import argparse
 import numpy as np
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-from echo_loop import create_fan_mask, get_contour_depths, PARAMS
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+from echo_loop import get_fan_geometry, make_kernels, detect_loop, scale_params, downscale, PARAMS, SCALES
+from loop_detector import DETECTORS
+from frame_store import iter_source_frames, iter_source_frames_at, source_frame_count, open_store, add_store_args
+from parallel_runner import make_shard_tasks, run_in_order
+from profiler import Profiler, NULL_PROFILER, add_profile_args
+from sequential_verdict import SequentialVerdict, sampling_levels, run_sequential, verdict_row, write_verdicts, add_verdict_args
+from columnar_log import ColumnarWriter, ColumnarLog, DEFAULT_CHUNK_ROWS
 
 # ★ここに実際の動画ファイル名をリストしてください
 VIDEO_LIST = [
@@ -16,68 +23,358 @@ VIDEO_LIST = [
     "Sample6.mp4"
 ]
 
-def analyze_video_series(video_files):
-    """指定された動画リストに対し、開閉ループ判定処理を連続実行してCSVログを出力する"""
-    k_box = (PARAMS['blur_ksize'], PARAMS['blur_ksize'])
-    k_morph = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (PARAMS['morph_ksize'], PARAMS['morph_ksize']))
+# --profile_columns で CSV に追加する処理段（フレームごとの所要時間 [ms]）
+PROFILE_STAGES = ['decode', 'fan_mask', 'blur', 'morphology', 'contours']
+
+# フレームごとのログの形式（csv: log_<動画名>.csv、columnar: 型付きの列指向ログ log_<動画名>.col）
+LOG_FORMATS = {'csv': '.csv', 'columnar': '.col'}
+
+def _header(profile_columns=False):
+    header = ["Frame", "State", "MaxArea_Depth1"]
+    return header + [f"{s}_ms" for s in PROFILE_STAGES] + ["n_contours"] if profile_columns else header
+
+def _log_columns(profile_columns=False):
+    """列指向ログの (列名, 型)（State は Open / Close のカテゴリ、n_contours の空欄は -1）"""
+    columns = [("Frame", np.int32), ("State", ("Open", "Close")), ("MaxArea_Depth1", np.float64)]
+    return columns + [(f"{s}_ms", np.float64) for s in PROFILE_STAGES] + [("n_contours", np.int32)] if profile_columns else columns
+
+def _log_path(video_path, log_format='csv'):
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    return f"log_{base_name}{LOG_FORMATS[log_format]}"
+
+class _CsvLog:
+    """CSVのフレームごとのログ（ColumnarWriter と同じ writerow / writerows / close で書く）"""
+    def __init__(self, path, profile_columns=False):
+        self._f = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._f)
+        self._writer.writerow(_header(profile_columns))
+
+    def writerow(self, row):
+        self._writer.writerow(row)
+
+    def writerows(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._f.close()
+
+def _open_log(video_path, profile_columns=False, log_format='csv'):
+    """動画のフレームごとのログをカレントディレクトリに作成する"""
+    path = _log_path(video_path, log_format)
+    if log_format == 'columnar':
+        return ColumnarWriter(path, _log_columns(profile_columns))
+    return _CsvLog(path, profile_columns)
+
+def _iter_max_areas(frames, params, detector='tree', prof=NULL_PROFILER, scale=1):
+    """
+    (フレーム番号, フレーム) の列を判定し、(フレーム番号, 深度1輪郭の最大面積（解析した解像度）, 記録) を順に返す
+
+    記録はそのフレームのデコードと判定の間にプロファイラに記録した段ごとの所要時間と値の辞書 (Profiler.collect)。
+    """
+    k_box, k_morph = make_kernels(params)
+    frames = prof.iter('decode', frames)
+    while True:
+        with prof.collect() as record:
+            item = next(frames, None)
+            if item is None:
+                return
+            frame_idx, frame = item
+            if scale > 1:
+                frame = prof.run('downscale', downscale, frame, scale)
+            fan = get_fan_geometry(frame.shape[1], frame.shape[0], params)
+            _, _, max_area = detect_loop(frame, fan, k_box, k_morph, params, detector, prof)
+            prof.count('frames')
+        yield frame_idx, max_area, record
+
+def iter_rows(video_path, start=0, stop=None, detector='tree', prof=NULL_PROFILER, profile_columns=False, scale=1,
+              frame_store=None, store_color='bgr'):
+    """
+    動画の [start, stop) 範囲のフレームに開閉ループ判定を行い、CSVの行を順に返す
+
+    scale > 1 の場合は 1/scale に縮小したフレームで判定する（MaxArea_Depth1 は元の解像度の画素数に換算して出力する）。
+    frame_store を指定した場合は、動画をデコードせずにフレームストア (common/frame_store.py) から読み出す。
+    """
+    params = scale_params(PARAMS, scale)
+    frames = iter_source_frames(video_path, start, stop, frame_store, store_color)
+    for frame_idx, max_area, record in _iter_max_areas(frames, params, detector, prof, scale):
+        row = [frame_idx, "Close" if max_area > params['area_thr'] else "Open", max_area * scale * scale]
+        if profile_columns:
+            row += [f"{1000.0 * record.get(s, 0.0):.3f}" for s in PROFILE_STAGES] + [record.get('n_contours', '')]
+        yield row
+
+def decide_video(video_path, detector='tree', scale=1, frame_store=None, store_color='bgr', threshold=0.5,
+                 confidence=0.95, initial_frames=32, min_frames=30, prof=NULL_PROFILER):
+    """
+    動画全体が「主に閉ループ」(Close) か「主に開ループ」(Open) かだけを、一部のフレームの判定から決める
+
+    フレームは動画全体から等間隔に粗く選び、段ごとに間隔を半分にして追加で判定する（sequential_verdict.sampling_levels）。
+    閉ループのフレームの割合の信頼区間が threshold の片側に収まった段で打ち切る。
+    Returns:
+        sequential_verdict.VERDICT_COLUMNS の1行（判定・割合・信頼区間・判定したフレーム数と総フレーム数・段数）
+    """
+    params = scale_params(PARAMS, scale)
+    total = source_frame_count(video_path, frame_store, store_color)
+    verdict = SequentialVerdict(total, threshold, confidence, min_frames)
+
+    def judge_level(indices):
+        frames = iter_source_frames_at(video_path, indices, frame_store, store_color)
+        for _, max_area, _ in _iter_max_areas(frames, params, detector, prof, scale):
+            yield max_area > params['area_thr']
+
+    decided, levels = run_sequential(verdict, sampling_levels(total, initial_frames), judge_level)
+    label = "Unknown" if decided is None else ("Close" if decided else "Open")
+    return verdict_row(video_path, label, verdict, levels)
+
+def _decide_task(task):
+    """プロセスプール用: (動画パス, decide_video のキーワード引数, プロファイル有無) の動画を判定する"""
+    video_path, kwargs, profile = task
+    prof = Profiler() if profile else NULL_PROFILER
+    return decide_video(video_path, prof=prof, **kwargs), prof.state() if profile else None
+
+def decide_video_series(video_files, workers=1, prof=NULL_PROFILER, out_csv="verdicts.csv", **kwargs):
+    """
+    動画ごとに decide_video で動画単位の判定を行い、out_csv に1動画1行で出力する（workers > 1 の場合は動画単位で並列化）
+
+    kwargs は decide_video のキーワード引数。判定したフレーム数と総フレーム数を動画ごと・全体で表示する。
+    """
+    found = []
+    for video_path in video_files:
+        if not os.path.exists(video_path):
+            print(f"[Warning] Not found: {video_path}"); continue
+        found.append(video_path)
+    if kwargs.get('frame_store'):
+        for video_path in found:
+            print(f"Frame store: {open_store(kwargs['frame_store'], video_path, kwargs.get('store_color', 'bgr')).path}")
+    tasks = [(video_path, kwargs, prof.enabled) for video_path in found]
+    results = run_in_order(_decide_task, tasks, workers) if workers > 1 else map(_decide_task, tasks)
+    write_verdicts(results, out_csv, prof, fraction_name="closed")
+
+def _analyze_shard(task):
+    """
+    プロセスプール用: (動画パス, 開始フレーム, 終了フレーム, 検出手法, プロファイル有無, CSV追加列有無, 縮小率,
+    フレームストア, ストアの色) の範囲を解析する
+
+    Returns:
+        (行リスト, プロファイルの集計状態（プロファイル無効時は None）)
+    """
+    video_path, start, stop, detector, profile, profile_columns, scale, frame_store, store_color = task
+    prof = Profiler() if profile else NULL_PROFILER
+    rows = list(iter_rows(video_path, start, stop, detector, prof, profile_columns, scale, frame_store, store_color))
+    return rows, prof.state() if profile else None
+
+def analyze_video_series(video_files, workers=1, shard_frames=0, detector='tree', prof=NULL_PROFILER, profile_columns=False,
+                         scale=1, frame_store=None, store_color='bgr', log_format='csv'):
+    """
+    指定された動画リストに対し、開閉ループ判定処理を連続実行してフレームごとのログを出力する
+
+    workers > 1 の場合は動画（shard_frames > 0 ならさらにフレーム範囲ごと）をプロセスに分散し、
+    結果をフレーム順に結合して同じCSVを出力する。
+    prof を指定した場合は処理段ごとの時間と輪郭数を記録し（ワーカーの結果も合算）、
+    profile_columns=True ならフレームごとの値をCSVの列として追加する。
+    scale > 1 の場合は 1/scale に縮小したフレームで判定する。
+    frame_store を指定した場合は、各動画を初回のみデコードしてフレームストアを作成し、以降はそこから読み出す
+    （ワーカーが同じ動画を重複してデコードしないよう、ストアの作成はワーカーの起動前に行う）。
+    log_format='columnar' の場合は、CSVの代わりに型付きの列指向ログ (common/columnar_log.py) に一定行数ごとに追記する。
+    """
+    found = []
     for video_path in video_files:
         if not os.path.exists(video_path):
             print(f"[Warning] Not found: {video_path}"); continue
-        print(f"Processing: {video_path}")
-        base_name = os.path.splitext(os.path.basename(video_path))[0]
-        csv_out = f"log_{base_name}.csv"
-        cap = cv2.VideoCapture(video_path)
-        w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fan_mask, open_region_mask, boundary_pt = create_fan_mask(w, h, PARAMS)
-        
-        with open(csv_out, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(["Frame", "State", "MaxArea_Depth1"])
-            frame_idx = 0
-            while True:
-                ret, frame = cap.read()
-                if not ret: break
-                masked = cv2.bitwise_and(frame, frame, mask=fan_mask)
-                gray = cv2.cvtColor(masked, cv2.COLOR_BGR2GRAY)
-                blur = cv2.blur(gray, k_box)
-                _, mask = cv2.threshold(blur, PARAMS['threshold'], 255, cv2.THRESH_BINARY)
-                mask_closed = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, k_morph, iterations=PARAMS['iterations'])
-                cv2.line(mask_closed, PARAMS['fan_center'], boundary_pt, 255, 3, cv2.LINE_8)
-                mask_closed = cv2.bitwise_and(mask_closed, open_region_mask)
-                contours, hierarchy = cv2.findContours(mask_closed, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-                depths = get_contour_depths(hierarchy)
-                max_area = 0.0
-                for i, cnt in enumerate(contours):
-                    if (depths[i] if i < len(depths) else 0) == 1:
-                        max_area = max(max_area, cv2.contourArea(cnt))
-                writer.writerow([frame_idx, "Close" if max_area > PARAMS['area_thr'] else "Open", max_area])
-                frame_idx += 1
-        cap.release()
-
-def evaluate_results(video_files):
-    """出力されたCSVログと正解データを比較し、精度評価（Accuracy, Precision, Recall, F1）を行う"""
+        found.append(video_path)
+    if frame_store:
+        for video_path in found:
+            print(f"Frame store: {open_store(frame_store, video_path, store_color).path}")
+
+    if workers <= 1:
+        for video_path in found:
+            print(f"Processing: {video_path}")
+            log = _open_log(video_path, profile_columns, log_format)
+            try:
+                for row in iter_rows(video_path, detector=detector, prof=prof, profile_columns=profile_columns, scale=scale,
+                                     frame_store=frame_store, store_color=store_color):
+                    log.writerow(row)
+            finally:
+                log.close()
+        return
+
+    tasks = [task + (detector, prof.enabled, profile_columns, scale, frame_store, store_color)
+             for task in make_shard_tasks(found, shard_frames)]
+    print(f"Processing {len(found)} videos as {len(tasks)} shards on {workers} workers")
+    current, log = None, None
+    try:
+        for (video_path, *_), (rows, prof_state) in zip(tasks, run_in_order(_analyze_shard, tasks, workers)):
+            prof.merge(prof_state)
+            if video_path != current:
+                if log: log.close()
+                print(f"Processing: {video_path}")
+                log = _open_log(video_path, profile_columns, log_format)
+                current = video_path
+            log.writerows(rows)
+    finally:
+        if log: log.close()
+
+def score_predictions(df_pred, df_true):
+    """予測と正解を行番号で突き合わせ、Ignore を除いたフレームの評価指標を返す（評価対象がない場合は None）"""
+    import pandas as pd
+    from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+    merged = pd.merge(df_pred, df_true, left_index=True, right_index=True, suffixes=('_pred', '_true'))
+    valid = merged[merged['State_true'] != 'Ignore']
+    if valid.empty: return None
+    y_p, y_t = valid['State_pred'], valid['State_true']
+    return {
+        'acc': accuracy_score(y_t, y_p),
+        'prec': precision_score(y_t, y_p, pos_label='Close', zero_division=0),
+        'rec': recall_score(y_t, y_p, pos_label='Close', zero_division=0),
+        'f1': f1_score(y_t, y_p, pos_label='Close', zero_division=0),
+    }
+
+# 正解の State のコード（Ignore は評価対象外、Open / Close 以外のラベルは常に不一致として数える）
+TRUTH_IGNORE, TRUTH_OPEN, TRUTH_CLOSE, TRUTH_OTHER = -1, 0, 1, 2
+
+def _truth_codes(states) -> np.ndarray:
+    """正解の State（文字列の配列）をコードにする"""
+    states = np.asarray(states, dtype=object)
+    codes = np.full(len(states), TRUTH_OTHER, dtype=np.int8)
+    codes[states == 'Open'] = TRUTH_OPEN
+    codes[states == 'Close'] = TRUTH_CLOSE
+    codes[states == 'Ignore'] = TRUTH_IGNORE
+    return codes
+
+class ConfusionCounts:
+    """
+    予測 (Close / Open) と正解のフレーム数を数え、score_predictions と同じ評価指標を求める
+
+    チャンクごとに add で加算できるため、動画全体・アーカイブ全体の指標をフレームを保持せずに求められる。
+    """
+    def __init__(self):
+        self.tp = self.fp = self.fn = self.tn = self.n = 0
+
+    def add(self, pred_close: np.ndarray, truth: np.ndarray):
+        """予測が Close かどうか (bool) と正解のコード (_truth_codes) の同じ長さの配列を加える"""
+        valid = truth != TRUTH_IGNORE
+        pred_close, truth = pred_close[valid], truth[valid]
+        truth_close = truth == TRUTH_CLOSE
+        self.n += len(truth)
+        self.tp += int(np.count_nonzero(pred_close & truth_close))
+        self.fp += int(np.count_nonzero(pred_close & ~truth_close))
+        self.fn += int(np.count_nonzero(~pred_close & truth_close))
+        self.tn += int(np.count_nonzero(~pred_close & (truth == TRUTH_OPEN)))
+
+    def merge(self, other):
+        self.tp += other.tp; self.fp += other.fp; self.fn += other.fn; self.tn += other.tn; self.n += other.n
+
+    def scores(self):
+        """評価指標（score_predictions と同じキー。評価対象がない場合は None）"""
+        if self.n == 0: return None
+        return {
+            'acc': (self.tp + self.tn) / self.n,
+            'prec': self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0,
+            'rec': self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0,
+            'f1': 2 * self.tp / (2 * self.tp + self.fp + self.fn) if self.tp + self.fp + self.fn else 0.0,
+        }
+
+def _iter_pred_chunks(pred_file, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """フレームごとのログ（CSV / 列指向）から、予測が Close かどうかの配列をチャンクごとに返す"""
+    if pred_file.endswith(LOG_FORMATS['columnar']):
+        log = ColumnarLog(pred_file)
+        close = log.categories['State'].index('Close')
+        for chunk in log.iter_chunks(['State']):
+            yield chunk['State'] == close
+    else:
+        import pandas as pd
+        for chunk in pd.read_csv(pred_file, usecols=['State'], chunksize=chunk_rows):
+            yield (chunk['State'] == 'Close').to_numpy()
+
+def _iter_truth_chunks(truth_file, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """正解データ（CSV / columnar_log.py convert で変換した列指向）から、State のコードをチャンクごとに返す"""
+    if truth_file.endswith(LOG_FORMATS['columnar']):
+        log = ColumnarLog(truth_file)
+        table = _truth_codes(log.categories['State'])
+        for chunk in log.iter_chunks(['State']):
+            yield table[chunk['State']]
+    else:
+        import pandas as pd
+        for chunk in pd.read_csv(truth_file, usecols=['State'], chunksize=chunk_rows):
+            yield _truth_codes(chunk['State'].to_numpy())
+
+def _iter_aligned(pred_chunks, truth_chunks):
+    """2つのチャンク列を行番号で突き合わせ、同じ長さの配列の組を順に返す（短い方の末尾で終わる）"""
+    pred = truth = np.empty(0)
+    pred_chunks, truth_chunks = iter(pred_chunks), iter(truth_chunks)
+    while True:
+        while len(pred) == 0:
+            pred = next(pred_chunks, None)
+            if pred is None: return
+        while len(truth) == 0:
+            truth = next(truth_chunks, None)
+            if truth is None: return
+        n = min(len(pred), len(truth))
+        yield pred[:n], truth[:n]
+        pred, truth = pred[n:], truth[n:]
+
+def _find_file(stem, formats):
+    for ext in formats:
+        if os.path.exists(stem + ext):
+            return stem + ext
+    return None
+
+def evaluate_results(video_files, log_format='csv', chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    出力されたフレームごとのログと正解データを比較し、精度評価（Accuracy, Precision, Recall, F1）を行う
+
+    予測と正解は chunk_rows 行ずつ読みながら行番号で突き合わせ、フレーム数を数えるだけのため、
+    動画の長さ・本数によらずメモリ使用量は一定になる。正解データは <動画名>_truth.col（列指向に変換済み）があれば
+    そちらを、なければ <動画名>_truth.csv を読む。動画ごとの F1 の平均に加え、全動画のフレームを合算した指標も表示する。
+    """
     metrics = {'acc': [], 'prec': [], 'rec': [], 'f1': []}
+    total = ConfusionCounts()
     print("\n--- Evaluation ---")
     for path in video_files:
         base = os.path.splitext(os.path.basename(path))[0]
-        pred_file = f"log_{base}.csv"; truth_file = f"{base}_truth.csv"
-        if not os.path.exists(pred_file) or not os.path.exists(truth_file): continue
+        pred_file = _log_path(path, log_format)
+        truth_file = _find_file(f"{base}_truth", ('.col', '.csv'))
+        if not os.path.exists(pred_file) or truth_file is None: continue
         try:
-            df_pred = pd.read_csv(pred_file); df_true = pd.read_csv(truth_file)
-            merged = pd.merge(df_pred, df_true, left_index=True, right_index=True, suffixes=('_pred', '_true'))
-            valid = merged[merged['State_true'] != 'Ignore']
-            if valid.empty: continue
-            y_p, y_t = valid['State_pred'], valid['State_true']
-            metrics['acc'].append(accuracy_score(y_t, y_p))
-            metrics['prec'].append(precision_score(y_t, y_p, pos_label='Close', zero_division=0))
-            metrics['rec'].append(recall_score(y_t, y_p, pos_label='Close', zero_division=0))
-            metrics['f1'].append(f1_score(y_t, y_p, pos_label='Close', zero_division=0))
+            counts = ConfusionCounts()
+            for pred, truth in _iter_aligned(_iter_pred_chunks(pred_file, chunk_rows), _iter_truth_chunks(truth_file, chunk_rows)):
+                counts.add(pred, truth)
+            scores = counts.scores()
+            if scores is None: continue
+            total.merge(counts)
+            for k in metrics: metrics[k].append(scores[k])
             print(f"[{base}] F1: {metrics['f1'][-1]:.3f}")
         except Exception as e: print(f"Error {base}: {e}")
     print("\n--- Overall ---")
     if metrics['f1']:
         print(f"Mean F1 Score: {np.mean(metrics['f1']):.4f}")
+        pooled = total.scores()
+        print(f"Pooled over {total.n} frames: Acc {pooled['acc']:.4f}, Prec {pooled['prec']:.4f}, "
+              f"Rec {pooled['rec']:.4f}, F1 {pooled['f1']:.4f}")
 
 if __name__ == "__main__":
-    analyze_video_series(VIDEO_LIST)
-    evaluate_results(VIDEO_LIST)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes (1 = sequential)")
+    parser.add_argument("--shard_frames", type=int, default=0, help="Split each video into frame ranges of this length when workers > 1 (0 = whole video)")
+    parser.add_argument("--detector", choices=sorted(DETECTORS), default="tree", help="Closed-loop detector (tree: RETR_TREE hierarchy, ccomp: RETR_CCOMP holes, label: connected-component hole labeling)")
+    parser.add_argument("--scale", type=int, choices=SCALES, default=1, help="Analyze frames downscaled by this factor (1 = full resolution)")
+    parser.add_argument("--log_format", choices=sorted(LOG_FORMATS), default="csv", help="Per-frame log format (csv: log_<name>.csv, columnar: typed, chunk-appended log_<name>.col)")
+    add_store_args(parser)
+    add_verdict_args(parser, threshold_help="Call a video Close when more than this fraction of its frames is closed (with --verdict)")
+    add_profile_args(parser, csv_columns=True)
+    args = parser.parse_args()
+    prof = Profiler() if args.profile else NULL_PROFILER
+    if args.verdict:
+        # 動画単位の判定のみ（フレームごとのログと精度評価は行わない）
+        decide_video_series(VIDEO_LIST, workers=args.workers, prof=prof, detector=args.detector, scale=args.scale,
+                            frame_store=args.frame_store, store_color=args.store_color, threshold=args.verdict_threshold,
+                            confidence=args.confidence, initial_frames=args.initial_frames, min_frames=args.min_frames)
+    else:
+        analyze_video_series(VIDEO_LIST, workers=args.workers, shard_frames=args.shard_frames, detector=args.detector,
+                             prof=prof, profile_columns=bool(args.profile) and args.profile_columns, scale=args.scale,
+                             frame_store=args.frame_store, store_color=args.store_color, log_format=args.log_format)
+        evaluate_results(VIDEO_LIST, log_format=args.log_format)
+    if args.profile:
+        prof.print_summary()
+        prof.save(args.profile, tool="sixvideo_research", workers=args.workers, detector=args.detector, scale=args.scale,
+                  verdict=args.verdict)
+        print(f"Saved profile to {args.profile}")
\ No newline at end of file
@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+from lv_segment import INPUT_SHAPE, LVSegmenter
+from video_io import iter_frames
+
+def mask_dice(a: np.ndarray, b: np.ndarray) -> float:
+    """2つのバイナリマスクの Dice 係数（両方とも空の場合は 1）"""
+    a, b = a > 0, b > 0
+    total = np.count_nonzero(a) + np.count_nonzero(b)
+    return 1.0 if total == 0 else 2.0 * np.count_nonzero(a & b) / total
+
+def legacy_inputs(frames: list) -> np.ndarray:
+    """
+    従来の前処理（skimage.transform.resize, float64）で入力テンソルを作る
+
+    skimage がない環境では None を返す（基準も OpenCV の前処理になる）。
+    """
+    try:
+        from skimage.transform import resize
+    except ImportError:
+        return None
+    import cv2
+    inputs = np.empty((len(frames), INPUT_SHAPE[0], INPUT_SHAPE[1], 1), dtype=np.float64)
+    for j, frame in enumerate(frames):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        inputs[j, :, :, 0] = resize(gray, INPUT_SHAPE, preserve_range=True)
+    return inputs
+
+def compare_backends(video_files, keras_model: str, onnx_models, threads: int = 0, batch_size: int = 32,
+                     max_frames: int = None) -> dict:
+    """
+    Kerasモデル（従来の前処理）のマスクを基準に、各バックエンドのマスクの Dice 係数と処理速度を集計する
+
+    比較対象は Keras（OpenCV の前処理）と onnx_models の各モデル。処理時間は前処理と推論を含み、デコードは含まない。
+    最初のバッチは初期化を含むため、処理時間の計測から除く。
+    """
+    reference = LVSegmenter(keras_model, backend='keras', threads=threads)
+    candidates = {'keras': reference}
+    for path in onnx_models:
+        candidates[os.path.basename(path)] = LVSegmenter(path, backend='onnx', threads=threads)
+    dice = {name: [] for name in candidates}
+    area_err = {name: [] for name in candidates}
+    times = {name: 0.0 for name in candidates}
+    legacy = True
+    timed_frames = 0
+
+    def run_batch(frames):
+        nonlocal legacy, timed_frames
+        warmup = not dice['keras']
+        inputs = legacy_inputs(frames)
+        if inputs is None:
+            legacy = False
+            ref_masks = reference.predict_small_masks(frames, batch_size)
+        else:
+            ref_masks = reference.predict_preprocessed(inputs, batch_size)
+        for name, segmenter in candidates.items():
+            t0 = time.perf_counter()
+            masks = segmenter.predict_small_masks(frames, batch_size)
+            if not warmup:
+                times[name] += time.perf_counter() - t0
+            for ref, mask in zip(ref_masks, masks):
+                dice[name].append(mask_dice(ref, mask))
+                area_err[name].append(abs(np.count_nonzero(mask) - np.count_nonzero(ref)))
+        if not warmup:
+            timed_frames += len(frames)
+
+    n_frames = 0
+    for video_path in video_files:
+        if not os.path.exists(video_path):
+            print(f"[Warning] Not found: {video_path}"); continue
+        batch = []
+        for _, frame in iter_frames(video_path, 0, max_frames):
+            batch.append(frame)
+            if len(batch) == batch_size:
+                run_batch(batch); n_frames += len(batch); batch = []
+        if batch:
+            run_batch(batch); n_frames += len(batch)
+
+    results = {}
+    for name in candidates:
+        d = np.array(dice[name])
+        results[name] = {
+            'fps': timed_frames / times[name] if times[name] > 0 else float('nan'),
+            'dice_mean': float(d.mean()) if len(d) else float('nan'),
+            'dice_min': float(d.min()) if len(d) else float('nan'),
+            'dice_p5': float(np.percentile(d, 5)) if len(d) else float('nan'),
+            'area_mae': float(np.mean(area_err[name])) if len(d) else float('nan'),
+        }
+    return {'frames': n_frames, 'legacy_reference': legacy, 'backends': results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dice parity and speed of LV segmentation backends against the Keras masks")
+    parser.add_argument("videos", nargs="+", help="Input video paths")
+    parser.add_argument("--model", type=str, default="../models/mymodel_segmentation.h5", help="Path to the reference .h5 model file")
+    parser.add_argument("--onnx_models", nargs="*", default=[], help="Converted .onnx models to compare (e.g. FP32 and INT8)")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads for every backend (0 = library default)")
+    parser.add_argument("--batch_size", type=int, default=32, help="Number of frames per inference batch")
+    parser.add_argument("--max_frames", type=int, default=None, help="Analyze at most this many frames per video")
+    args = parser.parse_args()
+
+    res = compare_backends(args.videos, args.model, args.onnx_models, args.threads, args.batch_size, args.max_frames)
+    ref = "Keras + skimage resize" if res['legacy_reference'] else "Keras + OpenCV resize (skimage not installed)"
+    print(f"\n--- Parity against {ref}: {res['frames']} frames ---")
+    for name, r in res['backends'].items():
+        print(f"  {name:>24}: {r['fps']:8.1f} frames/s  Dice mean {r['dice_mean']:.4f} / p5 {r['dice_p5']:.4f} / min {r['dice_min']:.4f}"
+              f"  Area MAE {r['area_mae']:.1f} px")
\ No newline at end of file
@@ -0,0 +1,81 @@
+import os
+import sys
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+from lv_segment import INPUT_SHAPE, _preprocess, load_keras_model
+from video_io import get_video_info, iter_frames
+
+def export_onnx(model_path: str, out_path: str, opset: int = 13):
+    """Kerasモデル (.h5) を、バッチサイズ可変・float32 入力 (N, 384, 384, 1) の ONNX モデルに変換する"""
+    import tensorflow as tf
+    import tf2onnx
+    model = load_keras_model(model_path)
+    spec = (tf.TensorSpec((None, INPUT_SHAPE[0], INPUT_SHAPE[1], 1), tf.float32, name="image"),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=out_path)
+    print(f"Saved ONNX model to {out_path}")
+
+def sample_frames(video_files, n_frames: int) -> np.ndarray:
+    """量子化の校正用に、動画全体から等間隔に n_frames 枚を取り出して前処理した入力テンソルを返す"""
+    lengths = []
+    for path in video_files:
+        info = get_video_info(path)
+        if info is None:
+            print(f"[Warning] Could not open calibration video: {path}")
+            continue
+        lengths.append((path, info[0]))
+    total = sum(n for _, n in lengths)
+    if total == 0:
+        return np.empty((0, INPUT_SHAPE[0], INPUT_SHAPE[1], 1), dtype=np.float32)
+    step = max(1, total // n_frames)
+    inputs = []
+    offset = 0
+    for path, n in lengths:
+        for frame_idx, frame in iter_frames(path):
+            if (offset + frame_idx) % step == 0 and len(inputs) < n_frames:
+                inputs.append(_preprocess(frame))
+        offset += n
+    return np.stack(inputs).astype(np.float32)[..., None]
+
+def quantize_int8(onnx_path: str, out_path: str, calib_inputs: np.ndarray = None):
+    """
+    ONNX モデルの重み（と校正データがあれば活性値）を INT8 に量子化する
+
+    calib_inputs（前処理済みの入力テンソル）を指定した場合は静的量子化 (QDQ形式)、指定しない場合は重みのみの動的量子化を行う。
+    """
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+    if calib_inputs is None or len(calib_inputs) == 0:
+        quantize_dynamic(onnx_path, out_path, weight_type=QuantType.QInt8)
+    else:
+        import onnxruntime as ort
+        input_name = ort.InferenceSession(onnx_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+        class Reader(CalibrationDataReader):
+            def __init__(self):
+                self.it = iter(calib_inputs)
+
+            def get_next(self):
+                x = next(self.it, None)
+                return None if x is None else {input_name: x[None]}
+
+        quantize_static(onnx_path, out_path, Reader(), quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+    print(f"Saved INT8 model to {out_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the LV segmentation Keras model to ONNX (optionally INT8-quantized)")
+    parser.add_argument("--model", type=str, default="../models/mymodel_segmentation.h5", help="Path to .h5 model file")
+    parser.add_argument("--out", type=str, default=None, help="Output .onnx path (default: model path with .onnx)")
+    parser.add_argument("--opset", type=int, default=13, help="ONNX opset version")
+    parser.add_argument("--int8", action="store_true", help="Also write an INT8-quantized model (<out>_int8.onnx)")
+    parser.add_argument("--calib_videos", nargs="*", default=[], help="Videos used to calibrate activations for static INT8 quantization (none = dynamic, weights only)")
+    parser.add_argument("--calib_frames", type=int, default=200, help="Number of calibration frames sampled evenly from --calib_videos")
+    args = parser.parse_args()
+
+    out_path = args.out or os.path.splitext(args.model)[0] + ".onnx"
+    export_onnx(args.model, out_path, args.opset)
+    if args.int8:
+        calib = sample_frames(args.calib_videos, args.calib_frames) if args.calib_videos else None
+        quantize_int8(out_path, os.path.splitext(out_path)[0] + "_int8.onnx", calib)
\ No newline at end of file
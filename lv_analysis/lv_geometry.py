@@ -1,6 +1,11 @@
+import os
+import sys
 import cv2
 import numpy as np
 
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+from fan_geometry import get_fan_geometry
+
 # 解析パラメータ設定 (echo_loop.pyの構造に合わせ、値を設定)
 PARAMS = {
     'blur_ksize': 21,                # 平滑化カーネルサイズ
@@ -15,31 +20,27 @@ PARAMS = {
 
 def create_fan_mask(w: int, h: int, params: dict) -> np.ndarray:
     """解析パラメータに基づいて扇形のマスク画像を生成する"""
-    cx, cy = params['fan_center']
-    r_min, r_max = params['fan_r_range']
-    aL, aR = params['fan_angles']
-    
-    xs = np.arange(w, dtype=np.float32)
-    ys = np.arange(h, dtype=np.float32)
-    xg, yg = np.meshgrid(xs, ys)
-    X = xg - cx
-    
-    inside_lines = (yg >= aL * X + cy) & (yg >= aR * X + cy)
-    y_min = np.sqrt(np.clip(r_min**2 - X**2, 0, None)) + cy
-    y_max = np.sqrt(np.clip(r_max**2 - X**2, 0, None)) + cy
-    inside_rings = (yg >= y_min) & (yg <= y_max)
-    
-    mask = np.zeros((h, w), dtype=np.uint8)
-    mask[inside_lines & inside_rings] = 255
-    return mask
+    return get_fan_geometry(w, h, params).mask.copy()
 
-def get_geometric_mask(frame: np.ndarray, params: dict = PARAMS) -> np.ndarray:
-    """フレームから幾何学的処理（2次関数フィッティング）によるLV領域マスクを生成する"""
+def roi_pad(params: dict) -> int:
+    """扇形の外接矩形に足す余白（平滑化とオープニングの影響が及ぶ距離より1画素大きくとる）"""
+    return (params['blur_ksize'] | 1) // 2 + 2 * ((params['morph_ksize'] | 1) // 2) + 1
+
+def fit_geometric_curve(frame: np.ndarray, params: dict = PARAMS):
+    """
+    フレームから幾何学的処理（2次関数フィッティング）でLV領域の下端の曲線を求め、(FanGeometry, 列ごとの曲線のY座標) を返す
+
+    画像処理と輪郭抽出は扇形の外接矩形（カーネルの影響範囲分の余白付き）の範囲だけで行い、輪郭はフレーム座標で得る。
+    扇形の外側は0のため、結果は全画面で処理した場合と一致する。グレースケールのフレームも受け付ける。
+    フィッティングできない場合、曲線は None とする。
+    """
     h, w = frame.shape[:2]
     
-    fan_mask = create_fan_mask(w, h, params)
-    masked_frame = cv2.bitwise_and(frame, frame, mask=fan_mask)
-    gray = cv2.cvtColor(masked_frame, cv2.COLOR_BGR2GRAY)
+    fan = get_fan_geometry(w, h, params)
+    x0, y0, x1, y1 = fan.roi(roi_pad(params))
+    roi = frame[y0:y1, x0:x1]
+    masked_frame = cv2.bitwise_and(roi, roi, mask=fan.mask[y0:y1, x0:x1])
+    gray = cv2.cvtColor(masked_frame, cv2.COLOR_BGR2GRAY) if masked_frame.ndim == 3 else masked_frame
     
     bk = params['blur_ksize'] | 1 
     blur = cv2.GaussianBlur(gray, (bk, bk), 0)
@@ -50,7 +51,7 @@ def get_geometric_mask(frame: np.ndarray, params: dict = PARAMS) -> np.ndarray:
     binary = cv2.erode(binary, kernel, iterations=1)
     binary = cv2.dilate(binary, kernel, iterations=1)
     
-    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x0, y0))
     
     valid_points_x = []
     valid_points_y = []
@@ -66,8 +67,6 @@ def get_geometric_mask(frame: np.ndarray, params: dict = PARAMS) -> np.ndarray:
             valid_points_x.extend(pts[:, 0])
             valid_points_y.extend(pts[:, 1])
             
-    geo_mask = np.zeros((h, w), dtype=np.uint8)
-    
     if len(valid_points_x) > 5:
         try:
             x_pts = np.array(valid_points_x)
@@ -75,12 +74,25 @@ def get_geometric_mask(frame: np.ndarray, params: dict = PARAMS) -> np.ndarray:
             coeffs = np.polyfit(x_pts, y_pts, 2)
             poly_func = np.poly1d(coeffs)
             
-            X_grid, Y_grid = np.meshgrid(np.arange(w), np.arange(h))
-            Y_curve = poly_func(X_grid)
-            
-            condition = (fan_mask > 0) & (Y_grid < Y_curve)
-            geo_mask[condition] = 255
+            # 2次曲線は列ごとに1回だけ評価し、扇形マスクとの比較は FanGeometry に任せる
+            return fan, poly_func(np.arange(w))
         except:
             pass 
             
-    return geo_mask
\ No newline at end of file
+    return fan, None
+
+def get_geometric_mask(frame: np.ndarray, params: dict = PARAMS) -> np.ndarray:
+    """フレームから幾何学的処理（2次関数フィッティング）によるLV領域マスクを生成する"""
+    fan, y_curve = fit_geometric_curve(frame, params)
+    if y_curve is None:
+        return np.zeros(frame.shape[:2], dtype=np.uint8)
+    return fan.fill_below_curve(y_curve)
+
+def get_geometric_area(frame: np.ndarray, params: dict = PARAMS) -> int:
+    """
+    get_geometric_mask のマスクの画素数（幾何学手法によるLV面積）を、マスクを生成せずに求める
+
+    曲線を列ごとに扇形の上端・画素数と比較して数えるため、フレームサイズの配列を確保しない。
+    """
+    fan, y_curve = fit_geometric_curve(frame, params)
+    return 0 if y_curve is None else fan.count_below_curve(y_curve)
\ No newline at end of file
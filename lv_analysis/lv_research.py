@@ -1,10 +1,18 @@
 import os
-import cv2
+import sys
 import csv
-import numpy as np
 import argparse
-from lv_segment import LVSegmenter
-from lv_geometry import get_geometric_mask, PARAMS
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+from lv_segment import LVSegmenter, BACKENDS, CACHE_NAMESPACE
+from lv_geometry import get_geometric_area, PARAMS
+from video_io import get_video_info
+from frame_store import iter_source_frames, iter_source_frames_at, source_frame_count, open_store, add_store_args
+from parallel_runner import make_shard_tasks, run_in_order
+from inference_cache import InferenceCache, add_cache_args
+from model_client import connect_model_server, add_server_args
+from profiler import Profiler, NULL_PROFILER, add_profile_args
+from sequential_verdict import SequentialVerdict, sampling_levels, run_sequential, verdict_row, write_verdicts, add_verdict_args
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -13,61 +21,307 @@ VIDEO_LIST = [
     os.path.join(BASE_DIR, "sample2.mp4"),
 ]
 
-def analyze_video_series(video_files, model_path):
+_SEGMENTER = None
+_BATCH_SIZE = 32
+_PROFILE = (False, False)
+_STORE = (None, 'bgr')
+
+# --verdict で「左心室が適切に描出されている」とみなすフレームの面積比 (AI面積 / 幾何学面積) の範囲
+ADEQUATE_RATIO = (0.5, 2.0)
+
+# --profile_columns で CSV に追加する処理段（フレームごとの所要時間 [ms]。unet はバッチの時間をフレーム数で割った値）
+PROFILE_STAGES = ['decode', 'unet', 'geometric_area']
+
+def _header(profile_columns=False):
+    header = ["Frame", "AI_Area", "Geo_Area", "Ratio"]
+    return header + [f"{s}_ms" for s in PROFILE_STAGES] if profile_columns else header
+
+def _batch_rows(segmenter, batch_frames, start_idx, batch_size, prof=NULL_PROFILER, profile_columns=False, decode_times=None):
+    """
+    バッファしたフレームをまとめてAI推論し、幾何学手法と合わせて1フレーム1行のCSV行リストを返す
+
+    面積のみを出力するため、AIのマスクはモデル解像度のまま、幾何学手法は曲線と扇形の列ごとの範囲から数え、
+    フレームサイズのマスクは生成しない（値はマスクを生成して数えた場合と同一）。
+    """
+    rows = []
+    with prof.collect() as record:
+        ai_areas = prof.run('unet', segmenter.predict_areas, batch_frames, batch_size=batch_size)
+    unet_time = record.get('unet', 0.0) / len(batch_frames)
+    for offset, (frame, ai_area) in enumerate(zip(batch_frames, ai_areas)):
+        with prof.collect() as record:
+            geo_area = prof.run('geometric_area', get_geometric_area, frame, PARAMS)
+
+        ratio = 0.0
+        if geo_area > 0:
+            ratio = ai_area / geo_area
+
+        row = [start_idx + offset, ai_area, geo_area, f"{ratio:.4f}"]
+        if profile_columns:
+            times = [decode_times[offset], unet_time, record.get('geometric_area', 0.0)]
+            row += [f"{1000.0 * t:.3f}" for t in times]
+        rows.append(row)
+    prof.count('frames', len(batch_frames))
+    return rows
+
+def iter_rows(segmenter, video_path, start=0, stop=None, batch_size=32, prof=NULL_PROFILER, profile_columns=False,
+              frame_store=None, store_color='bgr'):
+    """
+    動画の [start, stop) 範囲のフレームを batch_size 枚ずつ解析し、CSVの行を順に返す
+
+    frame_store を指定した場合は、動画をデコードせずにフレームストア (common/frame_store.py) から読み出す。
+    """
+    batch_frames, decode_times, batch_start = [], [], start
+    frames = prof.iter('decode', iter_source_frames(video_path, start, stop, frame_store, store_color))
+    while True:
+        with prof.collect() as record:
+            item = next(frames, None)
+        if item is None:
+            break
+        frame_idx, frame = item
+        if not batch_frames:
+            batch_start = frame_idx
+        batch_frames.append(frame)
+        decode_times.append(record.get('decode', 0.0))
+        if len(batch_frames) == batch_size:
+            yield from _batch_rows(segmenter, batch_frames, batch_start, batch_size, prof, profile_columns, decode_times)
+            batch_frames, decode_times = [], []
+    if batch_frames:
+        yield from _batch_rows(segmenter, batch_frames, batch_start, batch_size, prof, profile_columns, decode_times)
+
+def decide_video(segmenter, video_path, batch_size=32, frame_store=None, store_color='bgr', adequate_ratio=ADEQUATE_RATIO,
+                 threshold=0.5, confidence=0.95, initial_frames=32, min_frames=30, prof=NULL_PROFILER):
+    """
+    動画全体で左心室が適切に描出されているか (Adequate / Inadequate) だけを、一部のフレームの判定から決める
+
+    面積比が adequate_ratio の範囲内（幾何学面積が0のフレームは範囲外）のフレームを「適切」とし、その割合が threshold を
+    超えるかを判定する。フレームは動画全体から粗く選んで段ごとに細かくし（sequential_verdict.sampling_levels）、
+    割合の信頼区間が threshold の片側に収まった段で打ち切る。各段のフレームは batch_size 枚ずつまとめて推論する。
+    Returns:
+        sequential_verdict.VERDICT_COLUMNS の1行
+    """
+    lo, hi = adequate_ratio
+    total = source_frame_count(video_path, frame_store, store_color)
+    verdict = SequentialVerdict(total, threshold, confidence, min_frames)
+
+    def judge_batch(frames):
+        for _, ai_area, geo_area, _ in _batch_rows(segmenter, frames, 0, batch_size, prof):
+            yield geo_area > 0 and lo <= ai_area / geo_area <= hi
+
+    def judge_level(indices):
+        batch = []
+        for _, frame in prof.iter('decode', iter_source_frames_at(video_path, indices, frame_store, store_color)):
+            batch.append(frame)
+            if len(batch) == batch_size:
+                yield from judge_batch(batch)
+                batch = []
+        if batch:
+            yield from judge_batch(batch)
+
+    decided, levels = run_sequential(verdict, sampling_levels(total, initial_frames), judge_level)
+    label = "Unknown" if decided is None else ("Adequate" if decided else "Inadequate")
+    return verdict_row(video_path, label, verdict, levels)
+
+def _count_cache(prof, segmenter, before=None):
+    """推論キャッシュのヒット・ミス数（before からの増分）をプロファイルのカウンタに加える"""
+    if segmenter.cache is None: return
+    stats = segmenter.cache.stats()
+    for key in ('hits', 'misses', 'evictions'):
+        prof.count(f"cache_{key}", stats[key] - (before[key] if before else 0))
+
+def _make_segmenter(model_path, cache_dir=None, cache_size_mb=1024, backend='auto', threads=0, model_server=None):
+    """推論キャッシュ・推論バックエンド・モデルサーバーの指定に応じて LVSegmenter を生成する"""
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model not found: {model_path}")
+    cache = None
+    if cache_dir:
+        cache = InferenceCache(cache_dir, model_path, CACHE_NAMESPACE, max_bytes=cache_size_mb << 20)
+    server = connect_model_server(model_server, 'lv', model_path)
+    return LVSegmenter(model_path, cache=cache, backend=backend, threads=threads, server=server)
+
+def _init_worker(model_path, batch_size, cache_dir, cache_size_mb, profile=(False, False), backend='auto', threads=0,
+                 model_server=None, store=(None, 'bgr')):
+    """プロセスプール用: 各ワーカープロセスでモデルを1回だけロードする（モデルサーバー使用時は接続のみ）"""
+    global _SEGMENTER, _BATCH_SIZE, _PROFILE, _STORE
+    _SEGMENTER = _make_segmenter(model_path, cache_dir, cache_size_mb, backend, threads, model_server)
+    _BATCH_SIZE = batch_size
+    _PROFILE = profile
+    _STORE = store
+
+def _analyze_shard(task):
+    """
+    プロセスプール用: (動画パス, 開始フレーム, 終了フレーム) の範囲を解析する
+
+    Returns:
+        (行リスト, プロファイルの集計状態（プロファイル無効時は None）)
+    """
+    video_path, start, stop = task
+    profile, profile_columns = _PROFILE
+    prof = Profiler() if profile else NULL_PROFILER
+    before = _SEGMENTER.cache.stats() if _SEGMENTER.cache is not None else None
+    rows = list(iter_rows(_SEGMENTER, video_path, start, stop, _BATCH_SIZE, prof, profile_columns, *_STORE))
+    _count_cache(prof, _SEGMENTER, before)
+    return rows, prof.state() if profile else None
+
+def _decide_task(task):
+    """プロセスプール用: (動画パス, decide_video のキーワード引数) の動画を判定する"""
+    video_path, kwargs = task
+    profile, _ = _PROFILE
+    prof = Profiler() if profile else NULL_PROFILER
+    row = decide_video(_SEGMENTER, video_path, _BATCH_SIZE, *_STORE, prof=prof, **kwargs)
+    return row, prof.state() if profile else None
+
+def decide_video_series(video_files, model_path, batch_size=32, workers=1, cache_dir=None, cache_size_mb=1024,
+                        prof=NULL_PROFILER, backend='auto', threads=0, model_server=None, frame_store=None,
+                        store_color='bgr', **kwargs):
+    """
+    動画ごとに decide_video で動画単位の判定を行い、<BASE_DIR>/lv_verdicts.csv に1動画1行で出力する
+
+    kwargs は decide_video の判定条件（adequate_ratio / threshold / confidence / initial_frames / min_frames）。
+    workers > 1 の場合は動画単位でプロセスに分散する。その他の引数は analyze_video_series と同じ。
+    """
+    batch_size = max(1, int(batch_size))
+    found = []
+    for video_path in video_files:
+        if not os.path.exists(video_path):
+            print(f"[Warning] Not found: {video_path}")
+            continue
+        found.append(video_path)
+    if frame_store:
+        for video_path in found:
+            print(f"Frame store: {open_store(frame_store, video_path, store_color).path}")
+
+    tasks = [(video_path, kwargs) for video_path in found]
+    initargs = (model_path, batch_size, cache_dir, cache_size_mb, (prof.enabled, False), backend, threads,
+                model_server, (frame_store, store_color))
+    if workers > 1:
+        results = run_in_order(_decide_task, tasks, workers, initializer=_init_worker, initargs=initargs)
+    else:
+        _init_worker(*initargs)
+        results = map(_decide_task, tasks)
+    write_verdicts(results, os.path.join(BASE_DIR, "lv_verdicts.csv"), prof, fraction_name="adequate")
+
+def _csv_path(video_path):
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(BASE_DIR, f"log_{base_name}_lv.csv")
+
+def analyze_video_series(video_files, model_path, batch_size=32, workers=1, shard_frames=0,
+                         cache_dir=None, cache_size_mb=1024, prof=NULL_PROFILER, profile_columns=False,
+                         backend='auto', threads=0, model_server=None, frame_store=None, store_color='bgr'):
     """
     指定された動画リストに対し、AI予測と幾何学手法による左心室面積を算出し、
     その比率（AI面積 / 幾何学面積）を時系列でCSVログに出力する
-    """
-    print("Loading AI Model...")
-    segmenter = LVSegmenter(model_path)
 
+    AI推論は batch_size フレームずつまとめて実行する（出力されるCSVは1フレームずつ推論した場合と同一）。
+    workers > 1 の場合は動画（shard_frames > 0 ならさらにフレーム範囲ごと）をプロセスに分散し、
+    各プロセスでモデルをロードして、結果をフレーム順に結合する。
+    cache_dir を指定した場合はAI推論結果を永続キャッシュし、同じフレーム・モデルでの再実行では推論を省略する。
+    prof を指定した場合は処理段ごとの時間とキャッシュのヒット数を記録し（ワーカーの結果も合算）、
+    profile_columns=True ならフレームごとの所要時間をCSVの列として追加する。
+    backend / threads は推論バックエンド（lv_segment.BACKENDS のキーまたは 'auto'）と演算内スレッド数。
+    model_server を指定し、そのサーバーが同じモデルを読み込んでいる場合は、モデルをロードせずにサーバーで推論する。
+    frame_store を指定した場合は、各動画を初回のみデコードしてフレームストアを作成し（ワーカーの起動前）、以降はそこから読み出す。
+    store_color='gray' のストアでは推論キャッシュのキーがBGRのフレームと異なる（面積の結果は同一）。
+    """
+    batch_size = max(1, int(batch_size))
+    found = []
     for video_path in video_files:
         if not os.path.exists(video_path):
             print(f"[Warning] Not found: {video_path}")
             continue
-            
-        print(f"Processing: {video_path}")
-        base_name = os.path.splitext(os.path.basename(video_path))[0]
-        csv_out = os.path.join(BASE_DIR, f"log_{base_name}_lv.csv")
-        
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            print(" Error: Could not open video.")
+        if get_video_info(video_path) is None:
+            print(f" Error: Could not open video: {video_path}")
             continue
+        found.append(video_path)
+    if frame_store:
+        for video_path in found:
+            print(f"Frame store: {open_store(frame_store, video_path, store_color).path}")
+
+    if workers > 1:
+        tasks = make_shard_tasks(found, shard_frames)
+        print(f"Processing {len(found)} videos as {len(tasks)} shards on {workers} workers")
+        current, f = None, None
+        try:
+            for (video_path, _, _), (rows, prof_state) in zip(tasks, run_in_order(
+                    _analyze_shard, tasks, workers, initializer=_init_worker,
+                    initargs=(model_path, batch_size, cache_dir, cache_size_mb, (prof.enabled, profile_columns),
+                              backend, threads, model_server, (frame_store, store_color)))):
+                prof.merge(prof_state)
+                if video_path != current:
+                    if f:
+                        f.close()
+                        print(f" Saved log to {_csv_path(current)}")
+                    print(f"Processing: {video_path}")
+                    f = open(_csv_path(video_path), 'w', newline='', encoding='utf-8')
+                    writer = csv.writer(f)
+                    writer.writerow(_header(profile_columns))
+                    current = video_path
+                writer.writerows(rows)
+        finally:
+            if f:
+                f.close()
+                print(f" Saved log to {_csv_path(current)}")
+        return
+
+    print("Loading AI Model...")
+    segmenter = _make_segmenter(model_path, cache_dir, cache_size_mb, backend, threads, model_server)
+
+    for video_path in found:
+        print(f"Processing: {video_path}")
+        csv_out = _csv_path(video_path)
             
         with open(csv_out, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             
-            writer.writerow(["Frame", "AI_Area", "Geo_Area", "Ratio"])
+            writer.writerow(_header(profile_columns))
             
-            frame_idx = 0
-            while True:
-                ret, frame = cap.read()
-                if not ret: break
-
-                ai_mask = segmenter.predict_mask(frame)
-                ai_area = np.count_nonzero(ai_mask)
-
-                geo_mask = get_geometric_mask(frame, PARAMS)
-                geo_area = np.count_nonzero(geo_mask)
-
-                ratio = 0.0
-                if geo_area > 0:
-                    ratio = ai_area / geo_area
+            for row in iter_rows(segmenter, video_path, batch_size=batch_size, prof=prof, profile_columns=profile_columns,
+                                 frame_store=frame_store, store_color=store_color):
+                writer.writerow(row)
                 
-                writer.writerow([frame_idx, ai_area, geo_area, f"{ratio:.4f}"])
-                
-                if frame_idx % 50 == 0:
-                    print(f"\r Frame {frame_idx}: Ratio={ratio:.2f}", end="")
-                
-                frame_idx += 1
+                if row[0] % 50 == 0:
+                    print(f"\r Frame {row[0]}: Ratio={float(row[3]):.2f}", end="")
             
             print(f"\n Saved log to {csv_out}")
-        cap.release()
+
+    if segmenter.cache is not None:
+        print(f"Inference cache: {segmenter.cache.stats()}")
+    _count_cache(prof, segmenter)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--model", type=str, default="../models/mymodel_segmentation.h5", help="Path to .h5 model file")
+    parser.add_argument("--model", type=str, default="../models/mymodel_segmentation.h5", help="Path to .h5 or converted .onnx model file")
+    parser.add_argument("--backend", choices=["auto"] + sorted(BACKENDS), default="auto", help="Inference backend (auto: onnx for .onnx files, keras otherwise)")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads per inference backend (0 = library default)")
+    parser.add_argument("--batch_size", type=int, default=32, help="Number of frames per AI inference batch")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes (1 = sequential)")
+    parser.add_argument("--shard_frames", type=int, default=0, help="Split each video into frame ranges of this length when workers > 1 (0 = whole video)")
+    add_cache_args(parser)
+    add_server_args(parser)
+    add_store_args(parser)
+    add_verdict_args(parser, threshold_help="Call a video Adequate when more than this fraction of its frames is adequate (with --verdict)")
+    parser.add_argument("--adequate_ratio", type=float, nargs=2, default=list(ADEQUATE_RATIO), metavar=("LOW", "HIGH"),
+                        help="AI_Area / Geo_Area range for a frame to count as adequately showing the LV (with --verdict)")
+    add_profile_args(parser, csv_columns=True)
     args = parser.parse_args()
 
-    analyze_video_series(VIDEO_LIST, args.model)
\ No newline at end of file
+    prof = Profiler() if args.profile else NULL_PROFILER
+    if args.verdict:
+        # 動画単位の判定のみ（フレームごとのログは出力しない）
+        decide_video_series(VIDEO_LIST, args.model, batch_size=args.batch_size, workers=args.workers,
+                            cache_dir=args.cache_dir, cache_size_mb=args.cache_size_mb, prof=prof,
+                            backend=args.backend, threads=args.threads, model_server=args.model_server,
+                            frame_store=args.frame_store, store_color=args.store_color,
+                            adequate_ratio=tuple(args.adequate_ratio), threshold=args.verdict_threshold,
+                            confidence=args.confidence, initial_frames=args.initial_frames, min_frames=args.min_frames)
+    else:
+        analyze_video_series(VIDEO_LIST, args.model, batch_size=args.batch_size,
+                             workers=args.workers, shard_frames=args.shard_frames,
+                             cache_dir=args.cache_dir, cache_size_mb=args.cache_size_mb,
+                             prof=prof, profile_columns=bool(args.profile) and args.profile_columns,
+                             backend=args.backend, threads=args.threads, model_server=args.model_server,
+                             frame_store=args.frame_store, store_color=args.store_color)
+    if args.profile:
+        prof.print_summary()
+        prof.save(args.profile, tool="lv_research", workers=args.workers, batch_size=args.batch_size,
+                  backend=args.backend, threads=args.threads, verdict=args.verdict)
+        print(f"Saved profile to {args.profile}")
\ No newline at end of file
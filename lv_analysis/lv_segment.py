@@ -1,16 +1,18 @@
 import os
+import functools
 import numpy as np
-from skimage.transform import resize
-# 環境に合わせて tensorflow.keras または keras を選択してください
-from keras.models import load_model
-from keras import backend as K
 import cv2
 
 # モデルの入力サイズ定義
 INPUT_SHAPE = (384, 384)
+# 推論キャッシュ (common/inference_cache.py) の用途名。前処理（_preprocess）を変えた場合は版を上げ、
+# 同じモデルファイルでも以前の前処理で求めたマスクを使わないようにする（v2: cv2 の INTER_AREA による縮小）
+CACHE_NAMESPACE = 'lv_unet:preprocess-v2'
 
 def dice_coef(y_true, y_pred):
     """モデルロードに必要なカスタムメトリクス (Dice係数)"""
+    # 環境に合わせて tensorflow.keras または keras を選択してください
+    from keras import backend as K
     smooth = 1
     y_true = y_true[:,:,:,1:] 
     y_pred = y_pred[:,:,:,1:]
@@ -22,11 +24,137 @@ def dice_coef_loss(y_true, y_pred):
     """Dice係数を用いた損失関数"""
     return 1 - dice_coef(y_true, y_pred)
 
+def _preprocess(frame_bgr: np.ndarray) -> np.ndarray:
+    """フレームをグレースケール化し、モデル入力サイズに縮小する（画素平均, uint8）"""
+    if frame_bgr.ndim == 3:
+        img = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+    else:
+        img = frame_bgr
+    return cv2.resize(img, (INPUT_SHAPE[1], INPUT_SHAPE[0]), interpolation=cv2.INTER_AREA)
+
+def load_keras_model(model_path: str):
+    """学習済みKerasモデル (.h5) をカスタムメトリクス付きでロードする"""
+    # 環境に合わせて tensorflow.keras または keras を選択してください
+    from keras.models import load_model
+    return load_model(model_path, custom_objects={'dice_coef_loss': dice_coef_loss, 'dice_coef': dice_coef})
+
+class _Backend:
+    """推論バックエンドの共通部分（predict はクラスごとの確率 (N, H, W, C) を返す）"""
+    def predict_classes(self, inputs: np.ndarray, batch_size: int) -> np.ndarray:
+        """画素ごとに確率最大のクラス番号 (N, H, W, uint8) を返す"""
+        return np.argmax(self.predict(inputs, batch_size), axis=3).astype(np.uint8)
+
+class KerasBackend(_Backend):
+    """Kerasモデル (.h5) による推論"""
+    name = 'keras'
+
+    def __init__(self, model_path: str, threads: int = 0):
+        if threads > 0:
+            import tensorflow as tf
+            try:
+                tf.config.threading.set_intra_op_parallelism_threads(threads)
+                tf.config.threading.set_inter_op_parallelism_threads(1)
+            except RuntimeError:  # TensorFlow が既に初期化済みの場合は変更できない
+                print("[Warning] TensorFlow is already initialized; --threads is ignored")
+        self.model = load_keras_model(model_path)
+
+    def predict(self, inputs: np.ndarray, batch_size: int) -> np.ndarray:
+        return self.model.predict(inputs, batch_size=batch_size, verbose=0)
+
+class OnnxBackend(_Backend):
+    """
+    ONNX Runtime (CPU) による推論
+
+    export_onnx.py で変換したモデル（INT8 量子化モデルを含む）を読み込む。threads > 0 の場合は演算内の並列スレッド数を指定する。
+    """
+    name = 'onnx'
+
+    def __init__(self, model_path: str, threads: int = 0):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The onnx backend requires onnxruntime (pip install onnxruntime)") from e
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            opts.intra_op_num_threads = threads
+            opts.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, opts, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, inputs: np.ndarray, batch_size: int) -> np.ndarray:
+        preds = [self.session.run(None, {self.input_name: inputs[i:i + batch_size]})[0]
+                 for i in range(0, len(inputs), batch_size)]
+        return np.concatenate(preds, axis=0)
+
+class RemoteBackend:
+    """
+    モデルサーバー (pipeline/model_server.py) による推論
+
+    入力テンソルを送り、サーバー側で argmax まで行ったクラス番号を受け取る。モデルはサーバーが読み込み済みのものを使う。
+    """
+    name = 'server'
+
+    def __init__(self, client):
+        self.client = client
+
+    def predict_classes(self, inputs: np.ndarray, batch_size: int) -> np.ndarray:
+        return self.client.call('lv_classes', inputs=inputs, batch_size=batch_size)
+
+BACKENDS = {
+    'keras': KerasBackend,
+    'onnx': OnnxBackend,
+}
+
+def load_backend(model_path: str, backend: str = 'auto', threads: int = 0):
+    """推論バックエンドを生成する（'auto' の場合は拡張子 .onnx なら onnx、それ以外は keras）"""
+    if backend == 'auto':
+        backend = 'onnx' if model_path.lower().endswith('.onnx') else 'keras'
+    return BACKENDS[backend](model_path, threads)
+
+@functools.lru_cache(maxsize=16)
+def _nearest_repeats(src: int, dst: int) -> np.ndarray:
+    """cv2.resize (INTER_NEAREST) で長さ src を dst に拡大したとき、元の各画素がいくつの画素に複製されるか"""
+    ramp = np.arange(src, dtype=np.uint16).reshape(1, src)
+    index = cv2.resize(ramp, (dst, 1), interpolation=cv2.INTER_NEAREST).reshape(-1)
+    repeats = np.bincount(index, minlength=src).astype(np.int64)
+    repeats.setflags(write=False)
+    return repeats
+
+def upsampled_area(mask_small: np.ndarray, w: int, h: int) -> int:
+    """
+    モデル解像度のマスクを (w, h) に INTER_NEAREST で拡大した場合の非ゼロ画素数を、拡大せずに求める
+
+    最近傍補間では元の画素 (i, j) が縦 repeats_y[i] x 横 repeats_x[j] 画素に複製されるため、
+    拡大後の面積は repeats_y @ mask @ repeats_x となり、cv2.resize してから数えた値と一致する。
+    行ごとの和は w 以下の整数のため、float32 の行列積（BLAS）でも誤差なく求まる。
+    """
+    rep_y = _nearest_repeats(mask_small.shape[0], h)
+    rep_x = _nearest_repeats(mask_small.shape[1], w)
+    row_areas = (mask_small > 0).astype(np.float32) @ rep_x.astype(np.float32)
+    return int(rep_y @ row_areas.astype(np.int64))
+
+def _pack_mask(mask_small: np.ndarray) -> bytes:
+    """モデル解像度のマスク(0 or 255)をキャッシュ保存用に1画素1ビットへ圧縮する"""
+    return np.packbits(mask_small > 0).tobytes()
+
+def _unpack_mask(value: bytes) -> np.ndarray:
+    """_pack_mask で圧縮したマスクを元の (0 or 255) のマスクに戻す"""
+    bits = np.unpackbits(np.frombuffer(value, dtype=np.uint8), count=INPUT_SHAPE[0] * INPUT_SHAPE[1])
+    return (bits.reshape(INPUT_SHAPE) * 255).astype(np.uint8)
+
 class LVSegmenter:
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, cache=None, backend: str = 'auto', threads: int = 0, server=None):
         """
         モデルをロードし、セグメンテーションの準備を行う
 
+        backend は BACKENDS のキーまたは 'auto'（拡張子 .onnx なら ONNX Runtime、それ以外は Keras）。
+        threads > 0 の場合は推論の演算内スレッド数を指定する。
+        cache (common/inference_cache.InferenceCache) を指定した場合は、モデル解像度のマスクを
+        フレーム内容とモデルファイルのハッシュで永続キャッシュし、ヒットしたフレームの推論を省略する。
+        この場合、モデルは最初にキャッシュミスが発生した時点でロードする。
+        server (common/model_client.ModelClient) を指定した場合は、モデルをロードせずにモデルサーバーで推論する。
+
         Note:
             このクラスは 'echo-plax-segmentation' リポジトリの学習済みモデルを利用しています。
             出典: https://github.com/raventan95/echo-plax-segmentation
@@ -34,29 +162,78 @@ class LVSegmenter:
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model not found: {model_path}")
         
-        self.model = load_model(
-            model_path, 
-            custom_objects={'dice_coef_loss': dice_coef_loss, 'dice_coef': dice_coef}
-        )
-        print(f"Model loaded: {model_path}")
+        self.model_path = model_path
+        self.cache = cache
+        self.backend = backend
+        self.threads = threads
+        self._model = RemoteBackend(server) if server is not None else None
+        if self._model is None and cache is None:
+            self._load_model()
+
+    def _load_model(self):
+        self._model = load_backend(self.model_path, self.backend, self.threads)
+        print(f"Model loaded: {self.model_path} ({self._model.name})")
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._load_model()
+        return self._model
 
     def predict_mask(self, frame_bgr: np.ndarray) -> np.ndarray:
         """OpenCV形式のフレーム(BGR)からLV領域のバイナリマスク(0 or 255)を生成する"""
-        original_h, original_w = frame_bgr.shape[:2]
+        return self.predict_masks([frame_bgr])[0]
 
-        if frame_bgr.ndim == 3:
-            img = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
-        else:
-            img = frame_bgr
+    def predict_small_masks(self, frames, batch_size: int = 32) -> list:
+        """複数フレームをまとめて推論し、モデル解像度 (INPUT_SHAPE) のLV領域バイナリマスク(0 or 255)のリストを返す"""
+        if len(frames) == 0:
+            return []
 
-        img_resized = resize(img, INPUT_SHAPE, preserve_range=True)
-        img_input = img_resized.reshape(1, INPUT_SHAPE[0], INPUT_SHAPE[1], 1)
-        
-        preds = self.model.predict(img_input, verbose=0)[0,:,:,:] 
-        
-        pred_mask_small = np.argmax(preds, axis=2).astype(np.uint8)
-        lv_mask_small = (pred_mask_small == 1).astype(np.uint8) * 255
-        
-        final_mask = cv2.resize(lv_mask_small, (original_w, original_h), interpolation=cv2.INTER_NEAREST)
-        
-        return final_mask
\ No newline at end of file
+        masks = [None] * len(frames)
+        if self.cache is not None:
+            for i, value in enumerate(self.cache.get_many(frames)):
+                if value is not None:
+                    masks[i] = _unpack_mask(value)
+        todo = [i for i, m in enumerate(masks) if m is None]
+        if not todo:
+            return masks
+
+        img_inputs = np.empty((len(todo), INPUT_SHAPE[0], INPUT_SHAPE[1], 1), dtype=np.float32)
+        for j, i in enumerate(todo):
+            img_inputs[j, :, :, 0] = _preprocess(frames[i])
+
+        for i, mask in zip(todo, self.predict_preprocessed(img_inputs, batch_size)):
+            masks[i] = mask
+
+        if self.cache is not None:
+            self.cache.put_many([frames[i] for i in todo], [_pack_mask(masks[i]) for i in todo])
+        return masks
+
+    def predict_preprocessed(self, img_inputs: np.ndarray, batch_size: int = 32) -> list:
+        """前処理済みの入力テンソル (N, H, W, 1) を推論し、モデル解像度のLV領域バイナリマスク(0 or 255)のリストを返す"""
+        classes = self.model.predict_classes(img_inputs, batch_size)
+        return [(c == 1).astype(np.uint8) * 255 for c in classes]
+
+    def predict_areas(self, frames, batch_size: int = 32) -> list:
+        """
+        複数フレームをまとめて推論し、各フレームのLV領域の面積（元の解像度の画素数）のリストを返す
+
+        predict_masks のマスクを数えた値と同一だが、フレームサイズへの拡大を行わずモデル解像度のマスクから求める。
+        """
+        return [upsampled_area(m, frame.shape[1], frame.shape[0])
+                for frame, m in zip(frames, self.predict_small_masks(frames, batch_size))]
+
+    def predict_masks(self, frames, batch_size: int = 32) -> list:
+        """
+        複数フレームをまとめて推論し、各フレームのLV領域バイナリマスク(0 or 255)のリストを返す
+
+        1フレームずつ model.predict を呼ぶとKerasの呼び出しオーバーヘッドが支配的になるため、
+        batch_size 枚単位で入力テンソルを組み立てて一括推論する。
+        """
+        masks = []
+        for frame_bgr, lv_mask_small in zip(frames, self.predict_small_masks(frames, batch_size)):
+            original_h, original_w = frame_bgr.shape[:2]
+            final_mask = cv2.resize(lv_mask_small, (original_w, original_h), interpolation=cv2.INTER_NEAREST)
+            masks.append(final_mask)
+
+        return masks
\ No newline at end of file
@@ -0,0 +1,305 @@
+import os
+import sys
+import csv
+import queue
+import argparse
+import threading
+import traceback
+import multiprocessing
+import cv2
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _sub in ('common', 'loop_analysis', 'lv_analysis', 'chordae_analysis'):
+    sys.path.append(os.path.join(ROOT_DIR, _sub))
+
+import echo_loop
+import lv_geometry
+import chordae_detect as cd
+from fan_geometry import get_fan_geometry
+from frame_ring import FrameRing
+from inference_cache import InferenceCache, add_cache_args
+from model_client import connect_model_server, add_server_args
+
+class LoopAnalyzer:
+    """左心室の開・閉ループ判定 (loop_analysis/echo_loop.py と同一の処理)"""
+    name = 'loop'
+    columns = ["Loop_State", "Loop_MaxArea_Depth1"]
+
+    def __init__(self, params: dict = None, detector: str = 'tree', scale: int = 1):
+        self.scale = scale
+        self.params = echo_loop.scale_params(params or echo_loop.PARAMS, scale)
+        self.detector = detector
+        self.k_box, self.k_morph = echo_loop.make_kernels(self.params)
+
+    def start(self, w: int, h: int, fps: float):
+        self.fan = get_fan_geometry(w // self.scale, h // self.scale, self.params)
+
+    def analyze_batch(self, frames: list) -> list:
+        rows = []
+        for frame in frames:
+            small = echo_loop.downscale(frame, self.scale)
+            _, _, max_area = echo_loop.detect_loop(small, self.fan, self.k_box, self.k_morph, self.params, self.detector)
+            rows.append(["Close" if max_area > self.params['area_thr'] else "Open", max_area * self.scale * self.scale])
+        return rows
+
+class LVAnalyzer:
+    """AIセグメンテーションと幾何学手法による左心室面積比 (lv_analysis/lv_research.py と同一の処理)"""
+    name = 'lv'
+    columns = ["AI_Area", "Geo_Area", "LV_Ratio"]
+
+    def __init__(self, model_path: str, params: dict = None, cache=None, server=None):
+        from lv_segment import LVSegmenter
+        self.segmenter = LVSegmenter(model_path, cache=cache, server=server)
+        self.params = params or lv_geometry.PARAMS
+
+    def start(self, w: int, h: int, fps: float):
+        pass
+
+    def analyze_batch(self, frames: list) -> list:
+        rows = []
+        ai_areas = self.segmenter.predict_areas(frames, batch_size=len(frames))
+        for frame, ai_area in zip(frames, ai_areas):
+            geo_area = lv_geometry.get_geometric_area(frame, self.params)
+            ratio = ai_area / geo_area if geo_area > 0 else 0.0
+            rows.append([ai_area, geo_area, f"{ratio:.4f}"])
+        return rows
+
+class ChordaeAnalyzer:
+    """YOLOによる僧帽弁検出と腱索接続判定 (chordae_analysis/chordae_detect.py を利用)"""
+    name = 'chordae'
+    columns = ["MV_Conf", "Chordae_Label", "Chordae_Ratio"]
+
+    def __init__(self, model_path: str, cache=None, server=None):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found: {model_path}")
+        from mv_detector import MVDetector
+        self.detector = MVDetector(model_path, cache=cache, server=server)
+        self.mv_ids = cd.get_mv_class_ids(self.detector.names)
+
+    def start(self, w: int, h: int, fps: float):
+        pass
+
+    def analyze_batch(self, frames: list) -> list:
+        rows = []
+        for frame, boxes in zip(frames, self.detector.detect(frames)):
+            best_box = cd.select_mv_box(boxes, self.mv_ids)
+            if best_box is None:
+                rows.append(["", "", ""])
+                continue
+            label, ratio = cd.analyze_chordae(frame, best_box['xyxy'])
+            rows.append([f"{best_box['conf']:.4f}", label, f"{ratio:.4f}"])
+        return rows
+
+_ANALYZER_CLASSES = {cls.name: cls for cls in (LoopAnalyzer, LVAnalyzer, ChordaeAnalyzer)}
+
+def build_analyzers(names: list, lv_model: str = None, yolo_model: str = None, loop_detector: str = 'tree',
+                    cache_dir: str = None, cache_size_mb: int = 1024, loop_scale: int = 1, model_server: str = None) -> list:
+    """
+    解析器名のリストから解析器インスタンスを生成する
+
+    cache_dir 指定時はAI推論結果を永続キャッシュし、model_server 指定時は同じモデルを読み込んだモデルサーバーで推論する。
+    """
+    def make_cache(model_path, namespace):
+        if not cache_dir:
+            return None
+        return InferenceCache(cache_dir, model_path, namespace, max_bytes=cache_size_mb << 20)
+
+    analyzers = []
+    for name in names:
+        if name == 'loop':
+            analyzers.append(LoopAnalyzer(detector=loop_detector, scale=loop_scale))
+        elif name == 'lv':
+            from lv_segment import CACHE_NAMESPACE
+            analyzers.append(LVAnalyzer(lv_model, cache=make_cache(lv_model, CACHE_NAMESPACE),
+                                        server=connect_model_server(model_server, 'lv', lv_model)))
+        elif name == 'chordae':
+            analyzers.append(ChordaeAnalyzer(yolo_model, cache=make_cache(yolo_model, 'yolo_mv'),
+                                             server=connect_model_server(model_server, 'mv', yolo_model)))
+        else:
+            raise ValueError(f"Unknown analyzer: {name}")
+    return analyzers
+
+def run_pipeline(video_path: str, analyzers: list, csv_out: str, batch_size: int = 32):
+    """動画を1回だけデコードし、各フレームを全解析器に渡して結果を1つのCSVにまとめる"""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f" Error: Could not open video: {video_path}")
+        return
+    w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    for analyzer in analyzers:
+        analyzer.start(w, h, fps)
+
+    def flush(writer, frames, start_idx):
+        results = [analyzer.analyze_batch(frames) for analyzer in analyzers]
+        for offset in range(len(frames)):
+            row = [start_idx + offset]
+            for analyzer_rows in results:
+                row.extend(analyzer_rows[offset])
+            writer.writerow(row)
+
+    with open(csv_out, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Frame"] + [col for analyzer in analyzers for col in analyzer.columns])
+        frame_idx = 0
+        batch_frames = []
+        while True:
+            ret, frame = cap.read()
+            if not ret: break
+            batch_frames.append(frame)
+            frame_idx += 1
+            if len(batch_frames) == batch_size:
+                flush(writer, batch_frames, frame_idx - len(batch_frames))
+                batch_frames = []
+                print(f"\r Frame {frame_idx}", end="")
+        if batch_frames:
+            flush(writer, batch_frames, frame_idx - len(batch_frames))
+    cap.release()
+    print(f"\n Saved log to {csv_out}")
+
+def _analyzer_process(k: int, name: str, build_kwargs: dict, size: tuple, fps: float, reader, batch_size: int, results):
+    """
+    解析プロセスの本体（run_pipeline_processes から spawn で起動する）
+
+    共有メモリのフレームをコピーせずに batch_size 枚ずつ解析し、(解析器番号, 先頭フレーム番号, 行) を results に送る。
+    """
+    parent = multiprocessing.parent_process()
+    try:
+        analyzer = build_analyzers([name], **build_kwargs)[0]
+        analyzer.start(size[0], size[1], fps)
+        batch, slots, start_idx = [], [], 0
+        for index, slot, frame in reader.iter_frames(alive=parent.is_alive):
+            if not batch:
+                start_idx = index
+            batch.append(frame); slots.append(slot)
+            if len(batch) == batch_size:
+                results.put(('rows', k, start_idx, analyzer.analyze_batch(batch)))
+                batch = []
+                for slot in slots:
+                    reader.release(slot)
+                slots = []
+        if batch:
+            results.put(('rows', k, start_idx, analyzer.analyze_batch(batch)))
+            batch = []
+        results.put(('done', k, None, None))
+    except BaseException:
+        results.put(('error', k, None, traceback.format_exc()))
+    finally:
+        frame = None
+        reader.close()
+
+def run_pipeline_processes(video_path: str, names: list, build_kwargs: dict, csv_out: str, batch_size: int = 32, slots: int = 0):
+    """
+    run_pipeline のマルチプロセス版。解析器ごとに1プロセスを起動し、1つの録画を全コアで解析する
+
+    親プロセスが動画を1回だけデコードして共有メモリのリングバッファ (frame_ring.FrameRing) に書き込み、
+    各解析プロセスはそこからフレームをコピー・pickle せずに読む。結果はフレーム番号で結合し、run_pipeline と同一のCSVを出力する。
+    KerasやYOLOの推論がGILを保持していても、OpenCVのループ判定とは別プロセスのため互いを待たない。
+    slots はリングバッファのフレーム数（0 または batch_size 未満の場合は batch_size の2倍）。
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f" Error: Could not open video: {video_path}")
+        return
+    ret, frame = cap.read()
+    if not ret:
+        cap.release()
+        print(f" Error: No frames in video: {video_path}")
+        return
+    size = (frame.shape[1], frame.shape[0])
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    ctx = multiprocessing.get_context('spawn')
+    ring = FrameRing(ctx, frame.shape, slots if slots >= batch_size else 2 * batch_size, len(names))
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_analyzer_process, name=f"analyzer-{name}", daemon=True,
+                         args=(k, name, build_kwargs, size, fps, reader, batch_size, results))
+             for k, (name, reader) in enumerate(zip(names, ring.readers))]
+    for p in procs:
+        p.start()
+
+    errors = []
+    stop = threading.Event()
+
+    def merge_loop(writer):
+        # 解析器ごとの行をフレーム順に溜め、全解析器の行が揃ったフレームから書き出す
+        pending = [{} for _ in names]
+        done, written = set(), 0
+        while len(done) < len(names):
+            try:
+                kind, k, start_idx, rows = results.get(timeout=1.0)
+            except queue.Empty:
+                if not all(p.is_alive() or p.exitcode == 0 for p in procs):
+                    errors.append(RuntimeError("An analyzer process exited unexpectedly")); break
+                continue
+            if kind == 'error':
+                errors.append(RuntimeError(f"Analyzer '{names[k]}' failed:\n{rows}")); break
+            if kind == 'done':
+                done.add(k); continue
+            for offset, row in enumerate(rows):
+                pending[k][start_idx + offset] = row
+            if all(written in p for p in pending):
+                while all(written in p for p in pending):
+                    writer.writerow([written] + [col for p in pending for col in p.pop(written)])
+                    written += 1
+                print(f"\r Frame {written}", end="")
+        stop.set()
+
+    try:
+        with open(csv_out, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["Frame"] + [col for name in names for col in _ANALYZER_CLASSES[name].columns])
+            merger = threading.Thread(target=merge_loop, args=(writer,), name="merger", daemon=True)
+            merger.start()
+            frame_idx = 0
+            try:
+                while ret:
+                    if not ring.publish(frame_idx, frame, alive=lambda: not stop.is_set()): break
+                    frame_idx += 1
+                    ret, frame = cap.read()
+            finally:
+                ring.finish()
+            merger.join()
+    finally:
+        cap.release()
+        for p in procs:
+            p.join(timeout=None if not errors else 5.0)
+            if p.is_alive():
+                p.terminate()
+        ring.close()
+    if errors:
+        raise errors[0]
+    print(f"\n Saved log to {csv_out}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Single-pass echo analysis pipeline")
+    parser.add_argument("videos", nargs="+", help="Input video paths")
+    parser.add_argument("--analyzers", nargs="+", default=["loop", "lv", "chordae"], choices=["loop", "lv", "chordae"], help="Analyzers to run on each frame")
+    parser.add_argument("--lv_model", type=str, default=os.path.join(ROOT_DIR, "models", "mymodel_segmentation.h5"), help="Path to .h5 or converted .onnx model file")
+    parser.add_argument("--yolo_model", type=str, default=os.path.join(ROOT_DIR, "models", "best.pt"), help="Path to YOLO model")
+    parser.add_argument("--loop_detector", choices=sorted(echo_loop.DETECTORS), default="tree", help="Closed-loop detector used by the loop analyzer")
+    parser.add_argument("--loop_scale", type=int, choices=echo_loop.SCALES, default=1, help="Downscale factor for the loop analyzer (1 = full resolution)")
+    parser.add_argument("--batch_size", type=int, default=32, help="Number of frames handed to the analyzers at once")
+    parser.add_argument("--processes", action="store_true", help="Run each analyzer in its own process, fed from one decoder through a shared-memory ring buffer")
+    parser.add_argument("--ring_slots", type=int, default=0, help="Frames held in the shared-memory ring buffer with --processes (default: 2 x batch_size)")
+    parser.add_argument("--out_dir", type=str, default=".", help="Output dir")
+    add_cache_args(parser)
+    add_server_args(parser)
+    args = parser.parse_args()
+
+    build_kwargs = dict(lv_model=args.lv_model, yolo_model=args.yolo_model, loop_detector=args.loop_detector,
+                        cache_dir=args.cache_dir, cache_size_mb=args.cache_size_mb, loop_scale=args.loop_scale,
+                        model_server=args.model_server)
+    # --processes では各解析プロセスが自分の解析器を生成する
+    analyzers = None if args.processes else build_analyzers(args.analyzers, **build_kwargs)
+    os.makedirs(args.out_dir, exist_ok=True)
+    for video_path in args.videos:
+        if not os.path.exists(video_path):
+            print(f"[Warning] Not found: {video_path}")
+            continue
+        print(f"Processing: {video_path}")
+        base_name = os.path.splitext(os.path.basename(video_path))[0]
+        csv_out = os.path.join(args.out_dir, f"log_{base_name}_combined.csv")
+        if args.processes:
+            run_pipeline_processes(video_path, args.analyzers, build_kwargs, csv_out, max(1, args.batch_size), args.ring_slots)
+        else:
+            run_pipeline(video_path, analyzers, csv_out, max(1, args.batch_size))
\ No newline at end of file
@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+import signal
+import socket
+import secrets
+import argparse
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _sub in ('common', 'lv_analysis', 'chordae_analysis'):
+    sys.path.append(os.path.join(ROOT_DIR, _sub))
+
+from model_client import SERVER_ENV, KEY_ENV, model_identity, default_socket_path, key_path
+from lv_segment import BACKENDS, INPUT_SHAPE, LVSegmenter
+from mv_detector import MVDetector
+
+class ModelServer:
+    """
+    LVセグメンテーションとYOLOのモデルを1回だけロードして保持し、Unixソケット経由で推論を受け付ける
+
+    接続ごとにスレッドを立て、モデルごとのロックで推論を1つずつ順に実行する。
+    要求は (操作名, 引数の辞書)、応答は ('ok', 値) または ('error', メッセージ)（common/model_client.py を参照）。
+    """
+    def __init__(self, lv_model: str = None, yolo_model: str = None, backend: str = 'auto', threads: int = 0):
+        self.segmenter = None
+        self.detector = None
+        self.models = {}
+        if lv_model:
+            self.segmenter = LVSegmenter(lv_model, backend=backend, threads=threads)
+            self.models['lv'] = model_identity(lv_model)
+        if yolo_model:
+            if not os.path.exists(yolo_model):
+                raise FileNotFoundError(f"Model not found: {yolo_model}")
+            self.detector = MVDetector(yolo_model)
+            self.models['mv'] = model_identity(yolo_model)
+        self._locks = {'lv': threading.Lock(), 'mv': threading.Lock()}
+        self._count_lock = threading.Lock()
+        self.counts = {}
+
+    def warmup(self):
+        """初回の推論で発生する初期化（グラフ構築など）を待ち受け前に済ませる"""
+        if self.segmenter is not None:
+            self.segmenter.model.predict_classes(np.zeros((1, INPUT_SHAPE[0], INPUT_SHAPE[1], 1), dtype=np.float32), 1)
+        if self.detector is not None:
+            self.detector._infer([np.zeros((480, 640, 3), dtype=np.uint8)])
+
+    def _need(self, kind):
+        model = self.segmenter if kind == 'lv' else self.detector
+        if model is None:
+            raise ValueError(f"No {kind} model loaded")
+        return model
+
+    def handle(self, op: str, kwargs: dict):
+        if op == 'ping':
+            return 'pong'
+        if op == 'models':
+            return self.models
+        if op == 'lv_classes':
+            segmenter = self._need('lv')
+            with self._locks['lv']:
+                return segmenter.model.predict_classes(kwargs['inputs'], kwargs.get('batch_size', 32))
+        if op == 'mv_names':
+            return self._need('mv').names
+        if op == 'mv_detect':
+            detector = self._need('mv')
+            with self._locks['mv']:
+                return detector._infer(kwargs['imgs'])
+        raise ValueError(f"Unknown operation: {op}")
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    op, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = ('ok', self.handle(op, kwargs))
+                except Exception as e:
+                    reply = ('error', f"{type(e).__name__}: {e}")
+                with self._count_lock:
+                    self.counts[op] = self.counts.get(op, 0) + 1
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+
+    def serve_forever(self, address: str):
+        """
+        address のUnixソケットで待ち受ける（Ctrl+C で終了し、ソケットファイルと鍵ファイルを削除する）
+
+        要求は pickle で受け取るため、接続は認証鍵で認証する。鍵は環境変数 ECHO_MODEL_SERVER_KEY、未設定の場合は
+        乱数で生成して <ソケット>.key（0600）に書き出し、同じユーザーのクライアントが読む。
+        ソケットと鍵ファイルは作成時点から所有者のみアクセスできる（umask 0177）。
+        """
+        if os.path.exists(address):
+            probe = socket.socket(socket.AF_UNIX)
+            try:
+                probe.connect(address)
+            except OSError:
+                os.remove(address)  # 前回異常終了したサーバーのソケットファイル
+            else:
+                raise SystemExit(f"A model server is already running at {address}")
+            finally:
+                probe.close()
+        key_file = None
+        old_umask = os.umask(0o177)
+        try:
+            authkey = os.environ.get(KEY_ENV, '').encode()
+            if not authkey:
+                authkey = secrets.token_hex(32).encode()
+                key_file = key_path(address)
+                if os.path.lexists(key_file):
+                    os.remove(key_file)
+                fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(authkey)
+            listener = Listener(address, family='AF_UNIX', authkey=authkey)
+        finally:
+            os.umask(old_umask)
+        print(f"Model server listening on {address} (models: {', '.join(sorted(self.models)) or 'none'})", flush=True)
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except AuthenticationError:
+                    print("[Warning] Rejected a connection that failed authentication", flush=True)
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.close()
+            if key_file and os.path.exists(key_file):
+                os.remove(key_file)
+            print(f"\nModel server stopped. Requests: {self.counts}")
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the LV segmentation and YOLO models loaded and serve inference over a Unix socket")
+    parser.add_argument("--socket", type=str, default=os.environ.get(SERVER_ENV), help=f"Unix socket path to listen on (default: ${SERVER_ENV}, else echo_model_server.sock in $XDG_RUNTIME_DIR or a per-user 0700 temp directory)")
+    parser.add_argument("--lv_model", type=str, default=os.path.join(ROOT_DIR, "models", "mymodel_segmentation.h5"), help="Path to .h5 or converted .onnx model file ('' = do not serve LV)")
+    parser.add_argument("--yolo_model", type=str, default=os.path.join(ROOT_DIR, "models", "best.pt"), help="Path to YOLO model ('' = do not serve MV detection)")
+    parser.add_argument("--backend", choices=["auto"] + sorted(BACKENDS), default="auto", help="LV inference backend (auto: onnx for .onnx files, keras otherwise)")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads for the LV inference backend (0 = library default)")
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, _interrupt)  # kill / サービス停止でも Ctrl+C と同様にソケットファイルを削除して終了する
+    t0 = time.perf_counter()
+    server = ModelServer(args.lv_model, args.yolo_model, args.backend, args.threads)
+    server.warmup()
+    print(f"Models ready in {time.perf_counter() - t0:.1f} s")
+    server.serve_forever(args.socket if args.socket not in (None, "auto") else default_socket_path())
\ No newline at end of file
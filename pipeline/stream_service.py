@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from echo_pipeline import ROOT_DIR, build_analyzers, echo_loop
+from model_client import add_server_args
+
+PERCENTILES = (50, 90, 99)
+
+class LatestFrameSlot:
+    """
+    最新の1フレームだけを保持する受け渡し口
+
+    解析が追いつかない間に届いたフレームは、新しいフレームで上書きして破棄する（キューに溜めない）。
+    イベントループのスレッドからのみ操作する（別スレッドからは call_soon_threadsafe 経由で put / close する）。
+    """
+    def __init__(self):
+        self._item = None
+        self._event = asyncio.Event()
+        self.closed = False
+        self.overwritten = 0
+
+    def put(self, item):
+        if self._item is not None:
+            self.overwritten += 1
+        self._item = item
+        self._event.set()
+
+    def close(self):
+        self.closed = True
+        self._event.set()
+
+    async def get(self):
+        """次のフレームを返す（入力が終了し、未処理のフレームもない場合は None）"""
+        while self._item is None:
+            if self.closed:
+                return None
+            self._event.clear()
+            await self._event.wait()
+        item, self._item = self._item, None
+        return item
+
+def _stamp(idx: int, frame: np.ndarray) -> tuple:
+    return idx, time.monotonic(), time.time(), frame
+
+def _read_exact(f, n: int):
+    """n バイトを読み出す（途中で終端に達した場合は None）"""
+    buf = bytearray(n)
+    view, got = memoryview(buf), 0
+    while got < n:
+        k = f.readinto(view[got:])
+        if not k:
+            return None
+        got += k
+    return buf
+
+# release を呼ぶ前に読み出しスレッドの終了を待つ時間 [s]
+READER_JOIN_TIMEOUT = 2.0
+
+async def _pump_thread(read, slot: LatestFrameSlot, stop: threading.Event, release=None):
+    """
+    ブロッキングする read() を専用スレッドで回し、得られたフレームを slot に渡す
+
+    release（入力の解放）を指定した場合は、終了時（キャンセルを含む）に stop を立てて読み出しスレッドの終了を待ってから呼ぶ。
+    read() の途中で入力を解放しないよう、READER_JOIN_TIMEOUT 秒以内に終わらなければ解放せずにスレッドを切り離す。
+    """
+    loop = asyncio.get_running_loop()
+    finished = loop.create_future()
+
+    def run():
+        idx = 0
+        try:
+            while not stop.is_set():
+                frame = read()
+                if frame is None:
+                    break
+                loop.call_soon_threadsafe(slot.put, _stamp(idx, frame))
+                idx += 1
+        finally:
+            try:
+                loop.call_soon_threadsafe(lambda: finished.done() or finished.set_result(None))
+            except RuntimeError:  # イベントループが既に終了している
+                pass
+
+    # 読み出しでブロックしたままでも終了できるよう、デーモンスレッドとして動かす
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        await finished
+    finally:
+        if release is not None:
+            stop.set()
+            thread.join(READER_JOIN_TIMEOUT)
+            if thread.is_alive():
+                print("[Warning] Frame reader did not stop in time; leaving the source open", file=sys.stderr)
+            else:
+                release()
+
+async def camera_source(target: str, slot: LatestFrameSlot, stop: threading.Event):
+    """カメラ（デバイス番号）または動画ファイルからフレームを取得する（動画ファイルはそのfpsで実時間再生する）"""
+    is_device = target.isdigit()
+    cap = cv2.VideoCapture(int(target) if is_device else target)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open camera source: {target}")
+    interval = 0.0 if is_device else 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 30.0)
+    t0, n = time.monotonic(), 0
+
+    def read():
+        nonlocal n
+        if interval:
+            delay = t0 + n * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        ret, frame = cap.read()
+        n += 1
+        return frame if ret else None
+
+    await _pump_thread(read, slot, stop, release=cap.release)
+
+async def raw_source(target: str, size: tuple, slot: LatestFrameSlot, stop: threading.Event):
+    """BGR24 の生フレームが連続するパイプ（'-' は標準入力）からフレームを取得する"""
+    w, h = size
+    f = sys.stdin.buffer if target == '-' else open(target, 'rb', buffering=0)
+
+    def read():
+        buf = _read_exact(f, w * h * 3)
+        return None if buf is None else np.frombuffer(buf, np.uint8).reshape(h, w, 3)
+
+    try:
+        await _pump_thread(read, slot, stop)
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+async def socket_source(kind: str, target: str, size: tuple, slot: LatestFrameSlot, stop: threading.Event):
+    """
+    ローカルソケット（UNIXドメインまたは localhost のTCP）で待ち受け、接続元から BGR24 の生フレームを受け取る
+
+    同時に受け付ける接続は1つで、その接続が切れた時点で入力終了とする。
+    """
+    w, h = size
+    n_bytes = w * h * 3
+    done = asyncio.Event()
+    busy = False
+
+    async def handle(reader, writer):
+        nonlocal busy
+        if busy:
+            writer.close()
+            return
+        busy = True
+        idx = 0
+        try:
+            while not stop.is_set():
+                try:
+                    buf = await reader.readexactly(n_bytes)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                slot.put(_stamp(idx, np.frombuffer(buf, np.uint8).reshape(h, w, 3)))
+                idx += 1
+        finally:
+            writer.close()
+            done.set()
+
+    if kind == 'unix':
+        if os.path.exists(target):
+            os.unlink(target)
+        server = await asyncio.start_unix_server(handle, target)
+    else:
+        host, port = target.rsplit(':', 1)
+        server = await asyncio.start_server(handle, host, int(port))
+    print(f"Listening on {kind}:{target}", file=sys.stderr)
+    try:
+        await done.wait()
+    finally:
+        server.close()
+        await server.wait_closed()
+        if kind == 'unix' and os.path.exists(target):
+            os.unlink(target)
+
+def open_source(spec: str, size: tuple, slot: LatestFrameSlot, stop: threading.Event):
+    """'camera:<index|path>' / 'raw:<path|->' / 'unix:<path>' / 'tcp:<host>:<port>' から入力コルーチンを生成する"""
+    kind, _, target = spec.partition(':')
+    if kind == 'camera':
+        return camera_source(target or '0', slot, stop)
+    if kind in ('raw', 'unix', 'tcp'):
+        if size is None:
+            raise ValueError(f"--size is required for {kind} sources")
+        if kind == 'raw':
+            return raw_source(target or '-', size, slot, stop)
+        return socket_source(kind, target, size, slot, stop)
+    raise ValueError(f"Unknown source: {spec}")
+
+def _json_value(v):
+    if isinstance(v, np.generic):
+        return v.item()
+    if isinstance(v, str):
+        try:
+            return float(v)
+        except ValueError:
+            return v
+    return v
+
+class LatencyStats:
+    """フレームごとの遅延（入力から判定出力まで）と破棄数を集計する"""
+    def __init__(self):
+        self.latencies = array('d')
+        self.stale = 0
+
+    def summary(self, slot: LatestFrameSlot) -> dict:
+        lat = np.frombuffer(self.latencies, dtype=np.float64) if self.latencies else np.zeros(0)
+        out = {'type': 'stats', 'frames': len(lat), 'dropped_overwritten': slot.overwritten, 'dropped_stale': self.stale}
+        if len(lat):
+            out['latency_ms'] = {f"p{p}": round(float(v), 3) for p, v in zip(PERCENTILES, np.percentile(lat, PERCENTILES))}
+            out['latency_ms']['max'] = round(float(lat.max()), 3)
+        return out
+
+async def serve(source_spec: str, analyzers: list, size: tuple = None, max_latency_ms: float = 200.0,
+                stats_interval: float = 5.0, out=sys.stdout) -> dict:
+    """
+    入力からフレームを受け取り、各解析器の判定を1フレーム1行のJSONとして out に出力する
+
+    解析中に届いたフレームは最新の1枚だけを残して破棄し（dropped_overwritten）、解析開始時点で
+    入力から max_latency_ms を超えて経過したフレームも破棄する（dropped_stale）。
+    stats_interval 秒ごとと終了時に、遅延のパーセンタイルと破棄数を "type": "stats" の行として出力する。
+    最終的な集計結果を返す。
+    """
+    slot = LatestFrameSlot()
+    stop = threading.Event()
+    stats = LatencyStats()
+    executor = ThreadPoolExecutor(max_workers=1)
+    loop = asyncio.get_running_loop()
+    started = [None]
+
+    def emit(record: dict):
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+    def analyze(frame):
+        h, w = frame.shape[:2]
+        if started[0] != (w, h):
+            for analyzer in analyzers:
+                analyzer.start(w, h, 0.0)
+            started[0] = (w, h)
+        return [analyzer.analyze_batch([frame])[0] for analyzer in analyzers]
+
+    async def report():
+        while True:
+            await asyncio.sleep(stats_interval)
+            emit(stats.summary(slot))
+
+    source = asyncio.create_task(open_source(source_spec, size, slot, stop))
+    source.add_done_callback(lambda t: slot.close())
+    reporter = asyncio.create_task(report()) if stats_interval > 0 else None
+    try:
+        while True:
+            item = await slot.get()
+            if item is None:
+                break
+            idx, t_mono, t_wall, frame = item
+            if (time.monotonic() - t_mono) * 1000.0 > max_latency_ms:
+                stats.stale += 1
+                continue
+            rows = await loop.run_in_executor(executor, analyze, frame)
+            latency = (time.monotonic() - t_mono) * 1000.0
+            stats.latencies.append(latency)
+            record = {'frame': idx, 'time': round(t_wall, 6), 'latency_ms': round(latency, 3)}
+            for analyzer, row in zip(analyzers, rows):
+                record[analyzer.name] = {col: _json_value(v) for col, v in zip(analyzer.columns, row)}
+            emit(record)
+    finally:
+        stop.set()
+        if reporter:
+            reporter.cancel()
+        if not source.done():
+            source.cancel()
+        try:
+            await source
+        except asyncio.CancelledError:
+            pass
+        executor.shutdown(wait=True)
+        summary = stats.summary(slot)
+        emit(summary)
+    return summary
+
+def parse_size(text: str) -> tuple:
+    w, h = text.lower().split('x')
+    return int(w), int(h)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming loop/LV judgment service emitting JSON lines")
+    parser.add_argument("source", help="Frame source: camera:<index|video path>, raw:<pipe path|->, unix:<socket path>, tcp:<host>:<port>")
+    parser.add_argument("--size", type=parse_size, default=None, help="Frame size WxH for raw/unix/tcp sources (BGR24 frames)")
+    parser.add_argument("--analyzers", nargs="+", default=["loop", "lv"], choices=["loop", "lv"], help="Analyzers to run on each frame")
+    parser.add_argument("--lv_model", type=str, default=os.path.join(ROOT_DIR, "models", "mymodel_segmentation.h5"), help="Path to .h5 or converted .onnx model file")
+    parser.add_argument("--loop_detector", choices=sorted(echo_loop.DETECTORS), default="tree", help="Closed-loop detector used by the loop analyzer")
+    parser.add_argument("--loop_scale", type=int, choices=echo_loop.SCALES, default=1, help="Downscale factor for the loop analyzer (1 = full resolution, see loop_analysis/scale_report.py)")
+    parser.add_argument("--max_latency_ms", type=float, default=200.0, help="Drop frames that waited longer than this before analysis")
+    parser.add_argument("--stats_interval", type=float, default=5.0, help="Seconds between latency percentile reports (0 = only at the end)")
+    parser.add_argument("--out", type=str, default=None, help="Write JSON lines to this file instead of stdout")
+    add_server_args(parser)
+    args = parser.parse_args()
+
+    analyzers = build_analyzers(args.analyzers, lv_model=args.lv_model, loop_detector=args.loop_detector, loop_scale=args.loop_scale,
+                                model_server=args.model_server)
+    out = open(args.out, 'w', encoding='utf-8') if args.out else sys.stdout
+    try:
+        asyncio.run(serve(args.source, analyzers, args.size, args.max_latency_ms, args.stats_interval, out))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out is not sys.stdout:
+            out.close()
\ No newline at end of file